@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'gestion.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -127,3 +128,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL= 'index'
 LOGIN_URL= "login"
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Cantidad de códigos BLB-/MLT- que reserva cada proceso por consulta
+GESTION_CODIGOS_BLOQUE = 1
+
+# Libros por página en el catálogo y máximo que puede pedir el cliente (?por_pagina=)
+GESTION_CATALOGO_POR_PAGINA = 24
+GESTION_PAGINA_MAXIMA = 100
+
+# Caché de OpenLibrary (ver gestion/openlibrary.py): TTL en segundos y tamaños máximos;
+# HILOS_ASYNC y ESPERA_ASYNC acotan las consultas de las vistas async
+GESTION_OPENLIBRARY = {
+    'TTL': 24 * 60 * 60,
+    'MAX_MEMORIA': 256,
+    'MAX_PERSISTENTE': 10000,
+    'HILOS_ASYNC': 32,
+    'ESPERA_ASYNC': 8,
+}
+
+# Métricas por vista (ver gestion/metricas.py): MUESTREO es la fracción de peticiones medidas
+GESTION_METRICAS = {
+    'ACTIVO': True,
+    'MUESTREO': 1.0,
+    'TOKEN': None,
+}
@@ -5,6 +5,10 @@ from .models import Multa
 from .models import Prestamo
 from .models import Editorial
 from .models import UsuarioBiblioteca
+from .models import NotificacionMulta
+from .models import Tarea
+from . import tareas
+from .busqueda import filtro_fts
 
 # Register your models here.
 
@@ -27,41 +31,123 @@ class AutorAdmin(admin.ModelAdmin):
 @admin.register(Libro)
 class LibroAdmin(admin.ModelAdmin):
     list_display = ['titulo', 'autor', 'editorial', 'isbn', 'ejemplares', 'costo']
+    list_select_related = ['autor', 'editorial']
     search_fields = ['titulo', 'isbn']
     list_filter = ['editorial', 'autor']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Usa el índice FTS5 cuando existe; si no, la búsqueda icontains de siempre
+        filtro = filtro_fts(search_term) if search_term.strip() else None
+        if filtro is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(filtro), False
+
+class RetrasoFilter(admin.SimpleListFilter):
+    title = 'retraso'
+    parameter_name = 'retraso'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('0', 'Al día'),
+            ('1-7', '1 a 7 días'),
+            ('8-30', '8 a 30 días'),
+            ('31+', 'Más de 30 días'),
+        ]
+
+    def queryset(self, request, queryset):
+        #Filtra sobre la anotación dias_retraso de PrestamoQuerySet.con_retraso()
+        valor = self.value()
+        if valor == '0':
+            return queryset.filter(dias_retraso=0)
+        if valor == '1-7':
+            return queryset.filter(dias_retraso__range=(1, 7))
+        if valor == '8-30':
+            return queryset.filter(dias_retraso__range=(8, 30))
+        if valor == '31+':
+            return queryset.filter(dias_retraso__gt=30)
+        return queryset
+
 @admin.register(Prestamo)
 class PrestamoAdmin(admin.ModelAdmin):
-    list_display = ['codigo', 'libro', 'usuario_biblioteca', 'fecha_prestamos', 'fecha_max', 'estado']
-    list_filter = ['estado', 'fecha_prestamos']
+    list_display = ['codigo', 'libro', 'usuario_biblioteca', 'fecha_prestamos', 'fecha_max', 'estado',
+                    'retraso', 'multas_registradas', 'multa_proyectada']
+    list_filter = ['estado', RetrasoFilter, 'fecha_prestamos']
+    list_select_related = ['libro', 'usuario_biblioteca']
     search_fields = ['codigo', 'libro__titulo', 'usuario_biblioteca__nombre', 'usuario_biblioteca__cedula']
     readonly_fields = ['codigo']
     actions = ['generar_prestamos_seleccionados']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).con_retraso()
+
+    @admin.display(description='Días de retraso', ordering='dias_retraso')
+    def retraso(self, obj):
+        return obj.dias_retraso
+
+    @admin.display(description='Multas', ordering='total_multas')
+    def multas_registradas(self, obj):
+        return obj.total_multas
+
+    @admin.display(description='Multa proyectada', ordering='multa_proyectada')
+    def multa_proyectada(self, obj):
+        return obj.multa_proyectada
     
     def generar_prestamos_seleccionados(self, request, queryset):
-        """Acción masiva para generar préstamos"""
-        generados = 0
-        errores = []
-        
-        for prestamo in queryset:
-            try:
-                if prestamo.estado == 'b':
-                    prestamo.generar_prestamo()
-                    generados += 1
-            except Exception as e:
-                errores.append(f"Préstamo {prestamo.codigo}: {str(e)}")
-        
-        if generados > 0:
-            self.message_user(request, f'{generados} préstamo(s) generado(s) exitosamente')
-        if errores:
-            self.message_user(request, f'Errores: {"; ".join(errores)}', level='error')
+        """Acción masiva para generar préstamos (se ejecuta en la cola de tareas)"""
+        ids = list(queryset.filter(estado='b').values_list('id', flat=True))
+        if not ids:
+            self.message_user(request, 'Ninguno de los préstamos seleccionados está en estado Borrador', level='warning')
+            return
+        tarea = tareas.encolar('generar_prestamos', usuario=request.user, ids=ids)
+        self.message_user(request, f'Generación de {len(ids)} préstamo(s) encolada como tarea #{tarea.id}')
     
     generar_prestamos_seleccionados.short_description = "Generar préstamos seleccionados"
 
 
 @admin.register(Multa)
 class MultaAdmin(admin.ModelAdmin):
-    list_display = ['codigo', 'prestamo', 'tipo', 'monto', 'pagada', 'fecha']
+    list_display = ['codigo', 'prestamo', 'tipo', 'monto', 'monto_vigente', 'pagada', 'fecha']
+    list_select_related = ['prestamo__libro', 'prestamo__usuario_biblioteca']
     list_filter = ['tipo', 'pagada']
     readonly_fields = ['codigo']
-    search_fields = ['codigo', 'prestamo__codigo']
\ No newline at end of file
+    search_fields = ['codigo', 'prestamo__codigo']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).con_monto_vigente()
+
+    @admin.display(description='Monto vigente', ordering='monto_actual')
+    def monto_vigente(self, obj):
+        return obj.monto_vigente
+
+
+@admin.register(NotificacionMulta)
+class NotificacionMultaAdmin(admin.ModelAdmin):
+    list_display = ['prestamo', 'fecha', 'estado', 'intentos', 'proximo_intento', 'enviada']
+    list_select_related = ['prestamo']
+    list_filter = ['estado', 'fecha']
+    readonly_fields = ['ultimo_error']
+    search_fields = ['prestamo__codigo']
+    actions = ['reintentar_ahora']
+
+    @admin.action(description="Reintentar ahora")
+    def reintentar_ahora(self, request, queryset):
+        from django.utils import timezone
+        cantidad = queryset.filter(estado__in=['p', 'f']).update(estado='p', proximo_intento=timezone.now())
+        self.message_user(request, f'{cantidad} notificación(es) listas para enviar')
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'intentos', 'usuario', 'creada', 'terminada']
+    list_select_related = ['usuario']
+    list_filter = ['estado', 'tipo']
+    readonly_fields = ['argumentos', 'resultado', 'ultimo_error']
+    actions = ['reintentar_ahora']
+
+    @admin.action(description="Reintentar ahora")
+    def reintentar_ahora(self, request, queryset):
+        from django.utils import timezone
+        cantidad = queryset.filter(estado__in=['p', 'f']).update(
+            estado='p', intentos=0, proximo_intento=timezone.now(), terminada=None
+        )
+        self.message_user(request, f'{cantidad} tarea(s) listas para ejecutar')
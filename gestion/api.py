@@ -0,0 +1,240 @@
+"""API JSON de solo lectura para kioscos y clientes móviles.
+
+Cada respuesta lleva ``ETag`` y ``Last-Modified`` tomados de ``VersionRecurso``
+(una consulta por clave primaria). Si el cliente envía ``If-None-Match`` o
+``If-Modified-Since`` y el recurso no cambió, se responde 304 sin ejecutar las
+consultas del listado. Los listados se paginan por cursor (``despues``/``antes``).
+
+``/api/cambios/`` expone el registro de cambios (ver ``cambios.py``) para que
+los clientes sincronicen solo lo modificado desde su último cursor.
+"""
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+
+from . import cambios as registro_cambios
+from .models import ESTADOS_ACTIVOS, Libro, Multa, Prestamo, UsuarioBiblioteca
+from .paginacion import paginar_keyset, tamano_pagina
+from .versiones import CATALOGO, USUARIO, version
+
+
+def _version(request, recurso, objeto_id):
+    #Una sola lectura de la versión por petición (la usan ETag y Last-Modified)
+    cache = request.__dict__.setdefault('_versiones', {})
+    if (recurso, objeto_id) not in cache:
+        cache[(recurso, objeto_id)] = version(recurso, objeto_id)
+    return cache[(recurso, objeto_id)]
+
+
+def condicional(recurso, parametro=None, diario=False):
+    """Decorador: respuesta condicional según la versión de ``recurso``.
+
+    ``parametro`` es el argumento de la URL con el id del objeto versionado
+    (por ejemplo el usuario); sin él se usa la versión global del recurso.
+    Con ``diario`` la respuesta también cambia con la fecha: días de retraso y
+    montos vigentes crecen cada día sin que se escriba nada.
+    """
+    def objeto(kwargs):
+        return kwargs[parametro] if parametro else 0
+
+    def etag(request, *args, **kwargs):
+        v = _version(request, recurso, objeto(kwargs))
+        # La misma versión con otros filtros o cursor es otra representación
+        consulta = hashlib.md5(request.get_full_path().encode()).hexdigest()[:8]
+        dia = f'-{timezone.now().date():%Y%m%d}' if diario else ''
+        return f'{recurso}-{v.objeto_id}-{v.valor}-{consulta}{dia}'
+
+    def last_modified(request, *args, **kwargs):
+        modificado = _version(request, recurso, objeto(kwargs)).modificado
+        if diario:
+            # Mismo día que usan con_retraso()/con_monto_vigente()
+            hoy = datetime.combine(timezone.now().date(), time.min, tzinfo=dt_timezone.utc)
+            modificado = max(modificado, hoy)
+        return modificado
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def _pagina(request, queryset, serializar):
+    params = request.GET
+    pagina = paginar_keyset(
+        queryset,
+        despues=params.get('despues'),
+        antes=params.get('antes'),
+        por_pagina=tamano_pagina(params.get('por_pagina')),
+    )
+
+    def enlace(clave, cursor):
+        if cursor is None:
+            return None
+        consulta = params.copy()
+        consulta.pop('despues', None)
+        consulta.pop('antes', None)
+        consulta[clave] = cursor
+        return request.build_absolute_uri(f'{request.path}?{consulta.urlencode()}')
+
+    return JsonResponse({
+        'resultados': [serializar(objeto) for objeto in pagina.objetos],
+        'siguiente': enlace('despues', pagina.cursor_siguiente),
+        'anterior': enlace('antes', pagina.cursor_anterior),
+    })
+
+
+def _libro(libro):
+    return {
+        'id': libro.id,
+        'titulo': libro.titulo,
+        'autor': str(libro.autor),
+        'autor_id': libro.autor_id,
+        'editorial': libro.editorial.nombre if libro.editorial else None,
+        'isbn': libro.isbn,
+        'paginas': libro.paginas,
+        'fecha_publicacion': libro.fecha_publicacion,
+        'costo': str(libro.costo),
+        'ejemplares': libro.ejemplares,
+        'disponibles': libro.ejemplares_disponibles,
+    }
+
+
+def _prestamo(prestamo):
+    return {
+        'id': prestamo.id,
+        'codigo': prestamo.codigo,
+        'libro_id': prestamo.libro_id,
+        'libro': prestamo.libro.titulo,
+        'fecha_prestamo': prestamo.fecha_prestamos,
+        'fecha_max': prestamo.fecha_max,
+        'fecha_devolucion': prestamo.fecha_devolucion,
+        'estado': prestamo.estado,
+        'dias_retraso': prestamo.dias_retraso,
+        'multa_proyectada': str(prestamo.multa_proyectada),
+        'total_multas': str(prestamo.total_multas),
+    }
+
+
+def _multa(multa):
+    return {
+        'id': multa.id,
+        'codigo': multa.codigo,
+        'prestamo': multa.prestamo.codigo,
+        'tipo': multa.tipo,
+        'monto': str(multa.monto),
+        'monto_vigente': str(multa.monto_vigente),
+        'pagada': multa.pagada,
+        'fecha': multa.fecha,
+    }
+
+
+def _usuario(usuario):
+    return {
+        'id': usuario.id,
+        'nombre': usuario.nombre,
+        'cedula': usuario.cedula,
+        'email': usuario.email,
+        'tipo': usuario.tipo,
+        'activo': usuario.activo,
+    }
+
+
+# Consulta base y serializador de cada modelo del registro de cambios
+SINCRONIZADOS = {
+    registro_cambios.LIBRO: (lambda: Libro.objects.select_related('autor', 'editorial'), _libro),
+    registro_cambios.PRESTAMO: (lambda: Prestamo.objects.select_related('libro').con_retraso(), _prestamo),
+    registro_cambios.MULTA: (lambda: Multa.objects.select_related('prestamo').con_monto_vigente(), _multa),
+    registro_cambios.USUARIO: (lambda: UsuarioBiblioteca.objects.all(), _usuario),
+}
+
+
+@require_GET
+@condicional(CATALOGO)
+def libros(request):
+    params = request.GET
+    filtros = {
+        'autor': params.get('autor') if (params.get('autor') or '').isdigit() else None,
+        'editorial': params.get('editorial') if (params.get('editorial') or '').isdigit() else None,
+        'disponible': params.get('disponible'),
+    }
+    return _pagina(request, Libro.objects.catalogo(**filtros), _libro)
+
+
+@require_GET
+@condicional(CATALOGO)
+def libro(request, id):
+    return JsonResponse(_libro(get_object_or_404(Libro.objects.select_related('autor', 'editorial'), id=id)))
+
+
+@require_GET
+@condicional(CATALOGO)
+def disponibilidad(request, id):
+    libro = get_object_or_404(Libro.objects.only('id', 'ejemplares', 'ejemplares_prestados'), id=id)
+    return JsonResponse({
+        'id': libro.id,
+        'ejemplares': libro.ejemplares,
+        'disponibles': libro.ejemplares_disponibles,
+    })
+
+
+@login_required
+@require_GET
+@condicional(USUARIO, 'id', diario=True)
+def prestamos_usuario(request, id):
+    usuario = get_object_or_404(UsuarioBiblioteca, id=id)
+    prestamos = Prestamo.objects.filter(usuario_biblioteca=usuario).select_related('libro').con_retraso()
+    if request.GET.get('activos') == '1':
+        prestamos = prestamos.filter(estado__in=ESTADOS_ACTIVOS)
+    return _pagina(request, prestamos, _prestamo)
+
+
+@login_required
+@require_GET
+@condicional(USUARIO, 'id', diario=True)
+def multas_usuario(request, id):
+    usuario = get_object_or_404(UsuarioBiblioteca, id=id)
+    multas = Multa.objects.filter(prestamo__usuario_biblioteca=usuario).select_related('prestamo').con_monto_vigente()
+    if request.GET.get('pendientes') == '1':
+        multas = multas.filter(pagada=False)
+    return _pagina(request, multas, _multa)
+
+
+@login_required
+@require_GET
+def cambios(request):
+    """Cambios posteriores al cursor ``desde`` (0 = copia completa).
+
+    Responde ``{cambios, cursor, hay_mas}``; el cliente repite la petición con
+    el ``cursor`` recibido mientras ``hay_mas`` sea verdadero. Si el cursor es
+    anterior al horizonte de compactación responde 410 y el cliente debe
+    volver a empezar desde 0.
+    """
+    if not request.user.has_perm('gestion.Ver_prestamos'):
+        return HttpResponseForbidden()
+    try:
+        desde = int(request.GET.get('desde') or 0)
+        limite = int(request.GET.get('limite') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'desde y limite deben ser enteros'}, status=400)
+
+    horizonte = registro_cambios.horizonte()
+    if 0 < desde < horizonte:
+        return JsonResponse(
+            {'error': 'El cursor es anterior a la compactación: sincronice desde 0', 'horizonte': horizonte},
+            status=410,
+        )
+
+    consultas = {modelo: consulta() for modelo, (consulta, _) in SINCRONIZADOS.items()}
+    lote = registro_cambios.leer(desde, limite, consultas)
+    resultado = []
+    for cambio, objeto in lote.cambios:
+        fila = {'cursor': cambio.id, 'modelo': cambio.modelo, 'id': cambio.objeto_id}
+        if objeto is None:
+            fila['operacion'] = 'borrado'
+        else:
+            fila['operacion'] = 'guardado'
+            fila['datos'] = SINCRONIZADOS[cambio.modelo][1](objeto)
+        resultado.append(fila)
+    return JsonResponse({'cambios': resultado, 'cursor': lote.cursor, 'hay_mas': lote.hay_mas})
@@ -7,9 +7,18 @@ class GestionConfig(AppConfig):
     def ready(self):
         """Se ejecuta cuando Django inicia"""
         import os
+        from gestion import cambios, tarjetas, versiones
         
-        # Solo iniciar scheduler en el proceso principal
-        # (no en migraciones, tests, etc.)
+        # Versiones y registro de cambios de la API: se actualizan al guardar/borrar
+        versiones.conectar()
+        cambios.conectar()
+        # Tarjetas del catálogo en caché: cambios de autor/editorial
+        tarjetas.conectar()
+        
+        # Con runserver el scheduler corre en el proceso principal (no en
+        # migraciones, tests, etc.); en producción se usa manage.py run_scheduler.
+        # En ambos casos solo ejecuta los jobs el proceso con el liderazgo.
         if os.environ.get('RUN_MAIN') == 'true':
             from gestion import scheduler
-            scheduler.start_scheduler()
\ No newline at end of file
+            if scheduler.configuracion()['CON_RUNSERVER']:
+                scheduler.start_scheduler()
\ No newline at end of file
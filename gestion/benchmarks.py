@@ -0,0 +1,303 @@
+"""Casos de benchmark del ciclo de vida de préstamos.
+
+Cada caso tiene una preparación (no medida) y una ejecución (medida). Ambas
+corren dentro de una transacción que se revierte al terminar, así los casos
+se pueden repetir sobre la misma base de datos sembrada con ``seed_biblioteca``.
+"""
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .metricas import ContadorConsultas
+from .models import ESTADOS_ACTIVOS, Autor, Libro, Prestamo, UsuarioBiblioteca
+
+
+@dataclass
+class Medicion:
+    segundos: float
+    consultas: int
+    segundos_bd: float
+    memoria_pico_kb: float
+    operaciones: int
+
+
+class _Revertir(Exception):
+    pass
+
+
+def _en_transaccion_revertida(funcion):
+    try:
+        with transaction.atomic():
+            resultado = funcion()
+            raise _Revertir
+    except _Revertir:
+        return resultado
+
+
+def medir(caso, n):
+    """Ejecuta el caso dos veces: una para tiempo/consultas y otra para memoria"""
+    def tiempo():
+        ejecutar = caso(n)
+        contador = ContadorConsultas()
+        with connection.execute_wrapper(contador):
+            inicio = time.perf_counter()
+            operaciones = ejecutar()
+            segundos = time.perf_counter() - inicio
+        return segundos, contador, operaciones
+
+    def memoria():
+        ejecutar = caso(n)
+        tracemalloc.start()
+        try:
+            ejecutar()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    segundos, contador, operaciones = _en_transaccion_revertida(tiempo)
+    pico = _en_transaccion_revertida(memoria)
+    return Medicion(
+        segundos=round(segundos, 6),
+        consultas=contador.consultas,
+        segundos_bd=round(contador.segundos, 6),
+        memoria_pico_kb=round(pico / 1024, 1),
+        operaciones=operaciones,
+    )
+
+
+# ---- datos de apoyo ----
+def _usuario():
+    usuario = UsuarioBiblioteca.objects.filter(activo=True).first()
+    if usuario is None:
+        usuario = UsuarioBiblioteca.objects.create(nombre='Benchmark', cedula='1710034065', email='b@test.com')
+    return usuario
+
+
+def _libros_disponibles(n):
+    libros = list(Libro.objects.disponibles()[:n])
+    if len(libros) < n:
+        autor = Autor.objects.create(nombre='Benchmark', apellido='Autor')
+        libros += Libro.objects.bulk_create(
+            Libro(titulo=f'Benchmark {i}', autor=autor, ejemplares=1) for i in range(n - len(libros))
+        )
+    return libros
+
+
+def _borradores(n):
+    usuario = _usuario()
+    return [Prestamo.objects.create(libro=libro, usuario_biblioteca=usuario) for libro in _libros_disponibles(n)]
+
+
+def _activos(n, dias_retraso=0):
+    prestamos = _borradores(n)
+    for prestamo in prestamos:
+        prestamo.generar_prestamo()
+    if dias_retraso:
+        fecha_max = timezone.now().date() - timedelta(days=dias_retraso)
+        Prestamo.objects.filter(id__in=[p.id for p in prestamos]).update(fecha_max=fecha_max)
+        for prestamo in prestamos:
+            prestamo.fecha_max = fecha_max
+    return prestamos
+
+
+def _request(ruta='/'):
+    request = RequestFactory().get(ruta)
+    request.user = User(username='benchmark', is_staff=True, is_superuser=True)
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+
+# ---- casos ----
+def caso_generar_prestamo(n):
+    prestamos = _borradores(n)
+
+    def ejecutar():
+        for prestamo in prestamos:
+            prestamo.generar_prestamo()
+        return len(prestamos)
+    return ejecutar
+
+
+def _caso_devolver(estado_libro):
+    def caso(n):
+        prestamos = _activos(n, dias_retraso=3)
+
+        def ejecutar():
+            for prestamo in prestamos:
+                prestamo.estado_libro = estado_libro
+                prestamo.devolver_libro()
+            return len(prestamos)
+        return ejecutar
+    return caso
+
+
+def _caso_comando(*argumentos):
+    def caso(n):
+        _activos(n, dias_retraso=5)
+
+        def ejecutar():
+            call_command('verificar_prestamos_vencidos', *argumentos, stdout=StringIO())
+            return n
+        return ejecutar
+    return caso
+
+
+def _caso_vista(nombre):
+    def caso(n):
+        from . import views
+        vista = getattr(views, nombre)
+
+        def ejecutar():
+            response = vista(_request())
+            return len(response.content)
+        return ejecutar
+    return caso
+
+
+def caso_admin_generar(n):
+    prestamos = _borradores(n)
+    admin = site._registry[Prestamo]
+
+    def ejecutar():
+        queryset = Prestamo.objects.filter(id__in=[p.id for p in prestamos])
+        admin.generar_prestamos_seleccionados(_request(), queryset)
+        return len(prestamos)
+    return ejecutar
+
+
+CASOS = {
+    'generar_prestamo': caso_generar_prestamo,
+    'devolver_libro_bueno': _caso_devolver('bueno'),
+    'devolver_libro_danado': _caso_devolver('danado'),
+    'devolver_libro_perdido': _caso_devolver('perdido'),
+    'verificar_prestamos_vencidos': _caso_comando(),
+    'verificar_prestamos_vencidos_bulk': _caso_comando('--bulk'),
+    'lista_prestamos': _caso_vista('lista_prestamos'),
+    'lista_multas': _caso_vista('lista_multas'),
+    'lista_libros': _caso_vista('lista_libros'),
+    'admin_generar_prestamos': caso_admin_generar,
+}
+
+
+def comparar(actual, baseline, umbral):
+    """Devuelve las regresiones de ``actual`` respecto a ``baseline``"""
+    regresiones = []
+    for nombre, medicion in actual.items():
+        base = baseline.get(nombre)
+        if not base:
+            continue
+        if base['segundos'] and medicion['segundos'] > base['segundos'] * (1 + umbral):
+            regresiones.append(
+                f"{nombre}: {medicion['segundos']:.4f}s vs {base['segundos']:.4f}s "
+                f"(+{(medicion['segundos'] / base['segundos'] - 1) * 100:.0f}%)"
+            )
+        if medicion['consultas'] > base['consultas']:
+            regresiones.append(f"{nombre}: {medicion['consultas']} consultas vs {base['consultas']}")
+    return regresiones
+
+
+def como_dict(medicion):
+    return asdict(medicion)
+
+
+# ---- préstamos concurrentes ----
+def generar_prestamo_legado(prestamo):
+    """Versión anterior de ``Prestamo.generar_prestamo``: leer, comprobar y guardar
+    por separado. Solo se usa para comparar en ``benchmark_prestamos_concurrentes``."""
+    prestamo.libro.refresh_from_db(fields=['ejemplares', 'ejemplares_prestados'])
+    disponibles = prestamo.libro.ejemplares_disponibles
+    if disponibles <= 0:
+        raise ValidationError('No hay ejemplares disponibles')
+    prestamo.fecha_max = timezone.now().date() + timedelta(days=2)
+    prestamo.estado = 'p'
+    with transaction.atomic():
+        if disponibles == 1:
+            prestamo.libro.disponible = False
+            prestamo.libro.save(update_fields=['disponible'])
+        prestamo.save()
+
+
+@dataclass
+class ResultadoConcurrencia:
+    intentos: int
+    prestados: int
+    rechazados: int
+    reintentos: int
+    errores: list
+    segundos: float
+    sobreprestados: int
+
+    @property
+    def por_segundo(self):
+        return self.intentos / self.segundos if self.segundos else 0
+
+
+def estresar_prestamos(libro, prestamos, hilos, generar=None, max_reintentos=20):
+    """Genera ``prestamos`` (borradores del mismo libro) repartidos en ``hilos``.
+
+    Cada hilo usa su propia conexión. Los errores de bloqueo de SQLite se
+    reintentan; ``sobreprestados`` cuenta los préstamos activos por encima
+    de ``libro.ejemplares``.
+    """
+    generar = generar or (lambda prestamo: prestamo.generar_prestamo())
+    lock = threading.Lock()
+    totales = {'prestados': 0, 'rechazados': 0, 'reintentos': 0}
+    errores = []
+    barrera = threading.Barrier(hilos)
+
+    def trabajador(lote):
+        try:
+            barrera.wait()
+            for prestamo in lote:
+                for intento in range(max_reintentos):
+                    try:
+                        generar(prestamo)
+                        resultado = 'prestados'
+                    except ValidationError:
+                        resultado = 'rechazados'
+                    except OperationalError:
+                        with lock:
+                            totales['reintentos'] += 1
+                        time.sleep(0.001 * (intento + 1))
+                        continue
+                    with lock:
+                        totales[resultado] += 1
+                    break
+        except Exception as e:
+            with lock:
+                errores.append(repr(e))
+        finally:
+            connection.close()
+
+    lotes = [prestamos[i::hilos] for i in range(hilos)]
+    threads = [threading.Thread(target=trabajador, args=(lote,)) for lote in lotes]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    segundos = time.perf_counter() - inicio
+
+    activos = Prestamo.objects.filter(libro=libro, estado__in=ESTADOS_ACTIVOS).count()
+    return ResultadoConcurrencia(
+        intentos=len(prestamos),
+        prestados=totales['prestados'],
+        rechazados=totales['rechazados'],
+        reintentos=totales['reintentos'],
+        errores=errores,
+        segundos=segundos,
+        sobreprestados=max(0, activos - libro.ejemplares),
+    )
@@ -0,0 +1,104 @@
+"""Búsqueda de texto completo en el catálogo.
+
+En SQLite con FTS5 se consulta la tabla virtual ``gestion_libro_fts`` (creada
+por la migración 0014 y mantenida por triggers) ordenando por ``bm25``. En
+otras bases de datos, o si FTS5 no está disponible, se usa ``icontains``.
+"""
+import re
+
+from django.db import connections, DatabaseError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Libro
+
+TABLA_FTS = 'gestion_libro_fts'
+# Pesos de bm25 por columna: título, autor, editorial, isbn
+PESOS = (10.0, 5.0, 2.0, 1.0)
+
+_fts_por_alias = {}
+
+
+def fts_disponible(using='default'):
+    #Comprueba una vez por alias si existe la tabla FTS5
+    if using not in _fts_por_alias:
+        conexion = connections[using]
+        disponible = False
+        if conexion.vendor == 'sqlite':
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLA_FTS])
+                disponible = cursor.fetchone() is not None
+        _fts_por_alias[using] = disponible
+    return _fts_por_alias[using]
+
+
+def consulta_fts(texto):
+    """Convierte el texto del usuario en una consulta FTS5 con prefijos.
+
+    ``"cien años"`` -> ``"cien"* "años"*`` (todas las palabras, por prefijo).
+    """
+    palabras = re.findall(r'\w+', texto, flags=re.UNICODE)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def _ids_fts(texto, limite, using):
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    pesos = ', '.join(str(p) for p in PESOS)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s "
+            f"ORDER BY bm25({TABLA_FTS}, {pesos}) LIMIT %s",
+            [consulta, limite],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def filtro_icontains(texto):
+    #Filtro equivalente sin índice (recorre toda la tabla)
+    filtro = Q()
+    for palabra in texto.split():
+        filtro &= (
+            Q(titulo__icontains=palabra)
+            | Q(isbn__icontains=palabra)
+            | Q(autor__nombre__icontains=palabra)
+            | Q(autor__apellido__icontains=palabra)
+            | Q(editorial__nombre__icontains=palabra)
+        )
+    return filtro
+
+
+def buscar_icontains(texto, limite=20):
+    if not texto.split():
+        return []
+    return list(Libro.objects.catalogo().filter(filtro_icontains(texto)).order_by('titulo')[:limite])
+
+
+def ids_coincidentes(texto, limite=20, using='default'):
+    """Ids de libros ordenados por relevancia, o None si no hay FTS5"""
+    if not fts_disponible(using):
+        return None
+    try:
+        return _ids_fts(texto, limite, using)
+    except DatabaseError:
+        return None
+
+
+def filtro_fts(texto, using='default'):
+    """Filtro con todas las coincidencias FTS5 como subconsulta (sin límite), o None si no hay FTS5"""
+    if not fts_disponible(using):
+        return None
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return Q(pk__in=[])
+    return Q(pk__in=RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [consulta]))
+
+
+def buscar_libros(texto, limite=20, using='default'):
+    """Devuelve hasta ``limite`` libros que coinciden con ``texto``, los más relevantes primero"""
+    ids = ids_coincidentes(texto, limite, using)
+    if ids is None:
+        return buscar_icontains(texto, limite)
+    libros = Libro.objects.catalogo().in_bulk(ids)
+    return [libros[i] for i in ids if i in libros]
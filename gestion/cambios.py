@@ -0,0 +1,192 @@
+"""Registro de cambios para la sincronización incremental de los clientes.
+
+Cada guardado o borrado de Libro, Prestamo, Multa o UsuarioBiblioteca agrega una
+fila a ``Cambio`` (por señales); las rutas masivas que no pasan por ``save()``
+llaman a ``registrar()`` con los ids afectados. El id de la fila es el cursor
+de ``/api/cambios/?desde=<cursor>``.
+
+``compactar()`` deja solo el último cambio de cada objeto y elimina los borrados
+más antiguos que la retención. El mayor id eliminado de esa forma es el
+horizonte: un cliente con un cursor anterior pudo perderse un borrado y debe
+sincronizar de nuevo desde 0 (que, gracias a la compactación, es una copia
+completa de los datos).
+
+El cursor es un id autoincremental. En una base con escrituras concurrentes
+(PostgreSQL, MySQL) una transacción larga puede confirmar un id menor después
+de que otro cliente ya leyó uno mayor; por eso ``leer()`` no entrega cambios
+con menos de ``VISIBILIDAD`` segundos. Las transacciones que llaman a
+``registrar()`` (``devolver_lote``, los bloques de multas) deben durar menos
+que eso. SQLite serializa las escrituras y no necesita ese margen.
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+
+from .models import Autor, Cambio, Editorial, Libro, Multa, Prestamo, UsuarioBiblioteca, VersionRecurso
+
+LIBRO, PRESTAMO, MULTA, USUARIO = 'libro', 'prestamo', 'multa', 'usuario'
+MODELOS = {LIBRO: Libro, PRESTAMO: Prestamo, MULTA: Multa, USUARIO: UsuarioBiblioteca}
+# Fila de VersionRecurso que guarda el horizonte
+HORIZONTE = 'cambios_horizonte'
+
+CONFIGURACION = {
+    # Cambios por respuesta de la API (por defecto y máximo)
+    'LOTE': 500,
+    'LOTE_MAXIMO': 5000,
+    # Días que se conservan los borrados antes de compactarlos
+    'RETENCION_DIAS': 30,
+    # Segundos antes de entregar un cambio; None = 0 en SQLite y 10 en otras bases
+    'VISIBILIDAD': None,
+}
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_CAMBIOS', {})}
+
+
+def visibilidad():
+    valor = configuracion()['VISIBILIDAD']
+    if valor is None:
+        valor = 0 if connection.vendor == 'sqlite' else 10
+    return valor
+
+
+def registrar(modelo, ids, borrado=False):
+    """Agrega un cambio de ``modelo`` por cada id.
+
+    ``ids`` puede ser una lista o un queryset del modelo; con un queryset se
+    hace un único ``INSERT ... SELECT`` sin traer los ids a Python.
+    """
+    ahora = timezone.now()
+    if hasattr(ids, 'query'):
+        sql, params = ids.order_by().values(objeto_id=F('pk')).query.sql_with_params()
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {qn(Cambio._meta.db_table)} (modelo, objeto_id, borrado, fecha) '
+                f'SELECT %s, sub.objeto_id, %s, %s FROM ({sql}) sub',
+                [modelo, borrado, connection.ops.adapt_datetimefield_value(ahora), *params],
+            )
+            return cursor.rowcount
+    ids = sorted({i for i in ids if i is not None})
+    Cambio.objects.bulk_create(
+        [Cambio(modelo=modelo, objeto_id=i, borrado=borrado, fecha=ahora) for i in ids], batch_size=1000
+    )
+    return len(ids)
+
+
+def horizonte():
+    #Cursores distintos de 0 menores que este valor deben sincronizar desde 0
+    return VersionRecurso.objects.get_or_create(recurso=HORIZONTE, objeto_id=0)[0].valor
+
+
+@dataclass
+class Lote:
+    # (Cambio, objeto) en orden de cursor; objeto None = borrado
+    cambios: list = field(default_factory=list)
+    cursor: int = 0
+    hay_mas: bool = False
+
+
+def leer(desde=0, limite=None, consultas=None, ahora=None):
+    """Cambios posteriores al cursor ``desde``, como máximo ``limite`` filas.
+
+    Dentro del lote solo se devuelve el último cambio de cada objeto, con el
+    objeto actual cargado con una consulta por modelo. ``consultas`` permite
+    indicar el queryset base de cada modelo (``select_related``, anotaciones).
+    El lote se corta en el primer cambio más reciente que ``VISIBILIDAD``: el
+    cursor nunca pasa por encima de un id que todavía podría confirmarse.
+    """
+    opciones = configuracion()
+    limite = max(1, min(limite or opciones['LOTE'], opciones['LOTE_MAXIMO']))
+    filas = list(Cambio.objects.filter(id__gt=desde).order_by('id')[:limite + 1])
+    lote = Lote(cursor=desde, hay_mas=len(filas) > limite)
+    filas = filas[:limite]
+    margen = visibilidad()
+    if margen:
+        corte = (ahora or timezone.now()) - timedelta(seconds=margen)
+        recientes = [i for i, cambio in enumerate(filas) if cambio.fecha > corte]
+        if recientes:
+            # Lo que sigue es reciente: el cliente lo recibe en su próxima consulta
+            filas = filas[:recientes[0]]
+            lote.hay_mas = False
+    if not filas:
+        return lote
+    lote.cursor = filas[-1].id
+
+    ultimos = {}
+    for cambio in filas:
+        ultimos.pop((cambio.modelo, cambio.objeto_id), None)
+        ultimos[(cambio.modelo, cambio.objeto_id)] = cambio
+
+    ids = {}
+    for cambio in ultimos.values():
+        if not cambio.borrado:
+            ids.setdefault(cambio.modelo, []).append(cambio.objeto_id)
+    consultas = consultas or {}
+    objetos = {
+        modelo: consultas.get(modelo, MODELOS[modelo].objects.all()).in_bulk(lista)
+        for modelo, lista in ids.items()
+    }
+    # Un objeto que ya no existe tiene un borrado más adelante en el registro
+    lote.cambios = [(c, objetos.get(c.modelo, {}).get(c.objeto_id)) for c in ultimos.values()]
+    return lote
+
+
+def compactar(retencion_dias=None, fecha=None):
+    """Elimina los cambios superados y los borrados más antiguos que la retención.
+
+    Devuelve ``(superados, borrados)``: filas eliminadas de cada tipo.
+    """
+    if retencion_dias is None:
+        retencion_dias = configuracion()['RETENCION_DIAS']
+    limite = (fecha or timezone.now()) - timedelta(days=retencion_dias)
+
+    with transaction.atomic():
+        posteriores = Cambio.objects.filter(
+            modelo=OuterRef('modelo'), objeto_id=OuterRef('objeto_id'), id__gt=OuterRef('id')
+        )
+        superados = Cambio.objects.filter(Exists(posteriores)).delete()[0]
+
+        vencidos = Cambio.objects.filter(borrado=True, fecha__lt=limite)
+        ultimo = vencidos.aggregate(m=Max('id'))['m']
+        if ultimo is None:
+            return superados, 0
+        borrados = vencidos.delete()[0]
+        horizonte()
+        VersionRecurso.objects.filter(recurso=HORIZONTE, objeto_id=0, valor__lt=ultimo).update(
+            valor=ultimo, modificado=timezone.now()
+        )
+    return superados, borrados
+
+
+_NOMBRES = {modelo: nombre for nombre, modelo in MODELOS.items()}
+
+
+def _guardado(sender, instance, **kwargs):
+    registrar(_NOMBRES[sender], [instance.pk])
+
+
+def _borrado(sender, instance, **kwargs):
+    registrar(_NOMBRES[sender], [instance.pk], borrado=True)
+
+
+def _libros_de(sender, instance, created=False, **kwargs):
+    # Los nombres de autor y editorial forman parte de los datos del libro;
+    # al borrar una editorial sus libros quedan sin ella por un UPDATE sin señales
+    if not created:
+        registrar(LIBRO, instance.libros.all())
+
+
+def conectar():
+    for modelo, nombre in _NOMBRES.items():
+        post_save.connect(_guardado, sender=modelo, dispatch_uid=f'cambio_{nombre}_save')
+        post_delete.connect(_borrado, sender=modelo, dispatch_uid=f'cambio_{nombre}_delete')
+    for modelo in (Autor, Editorial):
+        post_save.connect(_libros_de, sender=modelo, dispatch_uid=f'cambio_{modelo.__name__}_save')
+        pre_delete.connect(_libros_de, sender=modelo, dispatch_uid=f'cambio_{modelo.__name__}_delete')
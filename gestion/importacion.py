@@ -0,0 +1,257 @@
+"""Importación masiva de libros desde OpenLibrary a partir de una lista de ISBN.
+
+Las consultas HTTP se hacen en paralelo con un pool de hilos que comparte una
+``requests.Session`` (conexiones keep-alive, reintentos con backoff). Autores y
+editoriales se resuelven en memoria y los libros se insertan con
+``bulk_create`` por lotes; todo el acceso a la base de datos ocurre en el hilo
+que llama a ``importar_isbns``.
+"""
+import csv
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.db import IntegrityError, transaction
+
+from .cambios import LIBRO, registrar
+from .models import Autor, Editorial, Libro
+from .openlibrary import configuracion, obtener_cliente
+from .versiones import CATALOGO, tocar
+
+ISBN_VALIDO = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+LOTE_CONSULTA = 500  # Máximo de parámetros por IN (...) en SQLite
+
+
+@dataclass
+class ResultadoISBN:
+    isbn: str
+    estado: str  # importado | existente | no_encontrado | invalido | error
+    detalle: str = ''
+
+
+def leer_isbns(contenido):
+    """Extrae los ISBN de un texto o CSV (uno por línea o separados por , ;)"""
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode('utf-8-sig', errors='ignore')
+    isbns = []
+    vistos = set()
+    for fila in csv.reader(io.StringIO(contenido), delimiter=','):
+        for celda in fila:
+            for token in re.split(r'[;\s]+', celda):
+                isbn = token.replace('-', '').strip().upper()
+                if isbn and isbn not in vistos:
+                    vistos.add(isbn)
+                    isbns.append(isbn)
+    return isbns
+
+
+def crear_sesion(workers):
+    sesion = requests.Session()
+    reintentos = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+    )
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=reintentos)
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    return sesion
+
+
+def transporte_sesion(sesion):
+    def transporte(url, params, timeout):
+        response = sesion.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    return transporte
+
+
+def _truncar(modelo, campo, valor):
+    return valor[:modelo._meta.get_field(campo).max_length] if valor else valor
+
+
+def _nombre_autor(doc):
+    #(nombre, apellido) del primer autor del documento, o None si no trae uno utilizable
+    nombres = str((doc.get('author_name') or [''])[0] or '').split()
+    if not nombres:
+        return None
+    firstname = _truncar(Autor, 'nombre', nombres[0])
+    lastname = _truncar(Autor, 'apellido', ' '.join(nombres[1:]))
+    return firstname, lastname
+
+
+def _en_lotes(valores, tamano=LOTE_CONSULTA):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _resolver_autores(nombres):
+    #Devuelve {(nombre, apellido): Autor} creando de una vez los que faltan
+    claves = set(nombres)
+    autores = {}
+    for lote in _en_lotes({nombre for nombre, _ in claves}):
+        for autor in Autor.objects.filter(nombre__in=lote).order_by('id'):
+            autores.setdefault((autor.nombre, autor.apellido), autor)
+    faltantes = [Autor(nombre=n, apellido=a) for n, a in claves if (n, a) not in autores]
+    for autor in Autor.objects.bulk_create(faltantes):
+        autores[(autor.nombre, autor.apellido)] = autor
+    return autores
+
+
+def _resolver_editoriales(nombres):
+    nombres = set(nombres)
+    editoriales = {}
+    for lote in _en_lotes(nombres):
+        for editorial in Editorial.objects.filter(nombre__in=lote).order_by('id'):
+            editoriales.setdefault(editorial.nombre, editorial)
+    faltantes = [Editorial(nombre=n) for n in nombres if n not in editoriales]
+    for editorial in Editorial.objects.bulk_create(faltantes):
+        editoriales[editorial.nombre] = editorial
+    return editoriales
+
+
+def importar_isbns(isbns, workers=8, batch_size=500, transporte=None):
+    """Importa los ISBN indicados y devuelve un ``ResultadoISBN`` por cada uno"""
+    resultados = {}
+    pendientes = []
+    for isbn in isbns:
+        if ISBN_VALIDO.match(isbn):
+            pendientes.append(isbn)
+        else:
+            resultados[isbn] = ResultadoISBN(isbn, 'invalido', 'Debe tener 10 o 13 dígitos')
+
+    for lote in _en_lotes(pendientes):
+        for isbn in Libro.objects.filter(isbn__in=lote).values_list('isbn', flat=True):
+            resultados[isbn] = ResultadoISBN(isbn, 'existente', 'Ya existe en la biblioteca')
+    pendientes = [isbn for isbn in pendientes if isbn not in resultados]
+
+    # 1. Consultas HTTP concurrentes (sin acceso a la base de datos)
+    sesion = None
+    if transporte is None:
+        sesion = crear_sesion(workers)
+        transporte = transporte_sesion(sesion)
+    config = configuracion()
+    url = config['URL_BASE'] + '/search.json'
+
+    def consultar(isbn):
+        try:
+            datos = transporte(url, {'isbn': isbn}, config['TIMEOUT'])
+            return isbn, (datos.get('docs') or [None])[0], None
+        except Exception as e:
+            return isbn, None, str(e)
+
+    documentos = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for isbn, doc, error in pool.map(consultar, pendientes):
+                if error:
+                    resultados[isbn] = ResultadoISBN(isbn, 'error', error)
+                elif doc is None:
+                    resultados[isbn] = ResultadoISBN(isbn, 'no_encontrado', 'Sin datos en OpenLibrary')
+                else:
+                    documentos[isbn] = doc
+    finally:
+        if sesion is not None:
+            sesion.close()
+
+    # 2. Autores y editoriales resueltos en memoria
+    nombres_autor = {isbn: _nombre_autor(doc) for isbn, doc in documentos.items()}
+    autores = _resolver_autores(nombre for nombre in nombres_autor.values() if nombre)
+    editoriales = _resolver_editoriales(
+        _truncar(Editorial, 'nombre', doc['publisher'][0]) for doc in documentos.values() if doc.get('publisher')
+    )
+    autor_por_defecto = Autor.objects.order_by('id').first()
+
+    libros = []
+    for isbn, doc in documentos.items():
+        autor = autores[nombres_autor[isbn]] if nombres_autor[isbn] else autor_por_defecto
+        if autor is None:
+            resultados[isbn] = ResultadoISBN(isbn, 'error', 'El libro no tiene autor y no hay autores registrados')
+            continue
+        editorial = editoriales[_truncar(Editorial, 'nombre', doc['publisher'][0])] if doc.get('publisher') else None
+        anio = doc.get('first_publish_year')
+        libros.append(Libro(
+            titulo=_truncar(Libro, 'titulo', doc.get('title') or 'Sin título'),
+            autor=autor,
+            editorial=editorial,
+            isbn=isbn,
+            paginas=doc.get('number_of_pages_median'),
+            fecha_publicacion=date(anio, 1, 1) if anio else None,
+            ejemplares=1,
+            costo=20.00,
+            disponible=True,
+        ))
+
+    # 3. Inserción por lotes; si un lote falla se reintenta libro por libro
+    for lote in _en_lotes(libros, batch_size):
+        try:
+            with transaction.atomic():
+                Libro.objects.bulk_create(lote)
+                # bulk_create no emite post_save
+                registrar(LIBRO, Libro.objects.filter(isbn__in=[libro.isbn for libro in lote]))
+            for libro in lote:
+                resultados[libro.isbn] = ResultadoISBN(libro.isbn, 'importado', libro.titulo)
+        except IntegrityError:
+            for libro in lote:
+                try:
+                    with transaction.atomic():
+                        libro.save()
+                    resultados[libro.isbn] = ResultadoISBN(libro.isbn, 'importado', libro.titulo)
+                except IntegrityError as e:
+                    resultados[libro.isbn] = ResultadoISBN(libro.isbn, 'error', str(e))
+
+    if libros:
+        tocar(CATALOGO)
+    return [resultados[isbn] for isbn in isbns]
+
+
+def importar_libro(isbn, cliente=None):
+    """Importa un solo ISBN a través de la caché de OpenLibrary.
+
+    Los errores de conexión (``ErrorOpenLibrary``) se propagan para que la
+    tarea se reintente; el resto de los casos se informa en el resultado.
+    """
+    if Libro.objects.filter(isbn=isbn).exists():
+        return ResultadoISBN(isbn, 'existente', f'El libro con ISBN {isbn} ya existe en la biblioteca')
+
+    docs = (cliente or obtener_cliente()).buscar_isbn(isbn)
+    if not docs:
+        return ResultadoISBN(isbn, 'no_encontrado', 'No se encontró información del libro')
+    doc = docs[0]
+
+    autor = None
+    nombre_autor = _nombre_autor(doc)
+    if nombre_autor:
+        autor, _ = Autor.objects.get_or_create(**dict(zip(('nombre', 'apellido'), nombre_autor)))
+    autor = autor or Autor.objects.order_by('id').first()
+    if autor is None:
+        return ResultadoISBN(isbn, 'error', 'El libro no tiene autor y no hay autores registrados')
+    editorial = None
+    if doc.get('publisher'):
+        editorial, _ = Editorial.objects.get_or_create(nombre=_truncar(Editorial, 'nombre', doc['publisher'][0]))
+
+    anio = doc.get('first_publish_year')
+    try:
+        with transaction.atomic():
+            libro = Libro.objects.create(
+                titulo=_truncar(Libro, 'titulo', doc.get('title') or 'Sin título'),
+                autor=autor,
+                editorial=editorial,
+                isbn=isbn,
+                paginas=doc.get('number_of_pages_median'),
+                fecha_publicacion=date(anio, 1, 1) if anio else None,
+                ejemplares=1,
+                costo=20.00,
+                disponible=True,
+            )
+    except IntegrityError:
+        # Otra importación del mismo ISBN terminó primero
+        return ResultadoISBN(isbn, 'existente', f'El libro con ISBN {isbn} ya existe en la biblioteca')
+    return ResultadoISBN(isbn, 'importado', f'Libro "{libro.titulo}" importado exitosamente')
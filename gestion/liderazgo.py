@@ -0,0 +1,60 @@
+"""Elección de líder entre procesos con una concesión en la base de datos.
+
+Varios procesos (réplicas de ``run_scheduler``, el de ``runserver``) compiten
+por la misma fila de ``Liderazgo``; solo el titular de la concesión vigente es
+el líder. El líder la renueva cada ``LATIDO`` segundos con un UPDATE
+condicional; si el proceso muere o pierde la base, la concesión vence a los
+``DURACION`` segundos y otro la toma. Los relojes de los servidores deben
+diferir bastante menos que ``DURACION``.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Liderazgo
+
+CONFIGURACION = {
+    # Segundos que dura la concesión sin renovarla
+    'DURACION': 30,
+    # Segundos entre renovaciones (bastante menor que DURACION)
+    'LATIDO': 10,
+}
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_LIDERAZGO', {})}
+
+
+def titular_local():
+    #Identifica al proceso: host, pid y un sufijo por si se reutiliza el pid
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def adquirir(nombre, titular, ahora=None):
+    """Renueva o toma la concesión ``nombre``; devuelve True si ``titular`` es el líder"""
+    ahora = ahora or timezone.now()
+    vence = ahora + timedelta(seconds=configuracion()['DURACION'])
+    Liderazgo.objects.get_or_create(nombre=nombre, defaults={'vence': ahora})
+    if Liderazgo.objects.filter(nombre=nombre, titular=titular, vence__gt=ahora).update(vence=vence):
+        return True
+    # Solo uno de los procesos que compiten ve la fila vencida al hacer el UPDATE
+    return bool(
+        Liderazgo.objects.filter(Q(titular='') | Q(vence__lte=ahora), nombre=nombre)
+        .update(titular=titular, vence=vence, desde=ahora)
+    )
+
+
+def es_lider(nombre, titular, ahora=None):
+    return Liderazgo.objects.filter(nombre=nombre, titular=titular, vence__gt=ahora or timezone.now()).exists()
+
+
+def liberar(nombre, titular):
+    """Cede la concesión para que otro proceso la tome sin esperar a que venza"""
+    return bool(
+        Liderazgo.objects.filter(nombre=nombre, titular=titular).update(titular='', vence=timezone.now())
+    )
@@ -0,0 +1,61 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from gestion.benchmarks import CASOS, comparar, como_dict, medir
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo, consultas y memoria de las operaciones del ciclo de préstamos (salida JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('casos', nargs='*', help=f'Casos a ejecutar (por defecto todos): {", ".join(CASOS)}')
+        parser.add_argument('-n', '--operaciones', type=int, default=50, help='Préstamos por caso')
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON de resultados')
+        parser.add_argument('--baseline', help='JSON de una ejecución anterior para comparar')
+        parser.add_argument('--umbral', type=float, default=0.2,
+                            help='Aumento de tiempo tolerado respecto al baseline (0.2 = 20%%)')
+        parser.add_argument('--fallar', action='store_true', help='Termina con error si hay regresiones')
+
+    def handle(self, *args, **options):
+        nombres = options['casos'] or list(CASOS)
+        desconocidos = [n for n in nombres if n not in CASOS]
+        if desconocidos:
+            raise CommandError(f'Casos desconocidos: {", ".join(desconocidos)}')
+
+        resultados = {}
+        for nombre in nombres:
+            resultados[nombre] = como_dict(medir(CASOS[nombre], options['operaciones']))
+            r = resultados[nombre]
+            self.stderr.write(
+                f'{nombre:36} {r["segundos"] * 1000:10.1f} ms {r["consultas"]:7d} consultas '
+                f'{r["memoria_pico_kb"]:10.1f} KB'
+            )
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'base_de_datos': connection.vendor,
+            'python': platform.python_version(),
+            'operaciones': options['operaciones'],
+            'resultados': resultados,
+        }
+
+        regresiones = []
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f).get('resultados', {})
+            regresiones = comparar(resultados, baseline, options['umbral'])
+            informe['regresiones'] = regresiones
+
+        texto = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                f.write(texto)
+        self.stdout.write(texto)
+
+        for regresion in regresiones:
+            self.stderr.write(self.style.ERROR(f'Regresión: {regresion}'))
+        if regresiones and options['fallar']:
+            raise CommandError(f'{len(regresiones)} regresiones respecto al baseline')
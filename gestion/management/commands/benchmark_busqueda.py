@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from gestion.busqueda import buscar_icontains, fts_disponible, ids_coincidentes
+from gestion.models import Autor, Editorial, Libro
+
+PALABRAS = [
+    'historia', 'sombra', 'viento', 'ciudad', 'mar', 'noche', 'tiempo', 'amor', 'guerra', 'cielo',
+    'fuego', 'piedra', 'camino', 'sol', 'luna', 'jardin', 'rio', 'memoria', 'silencio', 'reino',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda FTS5 con icontains sobre un catálogo sintético (se revierte al final)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=100000)
+        parser.add_argument('--consultas', type=int, default=50)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not fts_disponible():
+            raise CommandError('La base de datos no tiene el índice FTS5 (migración 0014)')
+
+        rnd = random.Random(options['semilla'])
+        with transaction.atomic():
+            self._poblar(rnd, options['libros'])
+            consultas = [
+                ' '.join(rnd.sample(PALABRAS, rnd.choice((1, 2))))[:rnd.choice((3, 5, 20))]
+                for _ in range(options['consultas'])
+            ]
+
+            tiempos = {}
+            for nombre, buscar in (
+                ('fts5', lambda q: ids_coincidentes(q, limite=20)),
+                ('icontains', lambda q: buscar_icontains(q, limite=20)),
+            ):
+                inicio = time.perf_counter()
+                for consulta in consultas:
+                    buscar(consulta)
+                tiempos[nombre] = (time.perf_counter() - inicio) / len(consultas) * 1000
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Búsqueda sobre {options["libros"]} libros ({options["consultas"]} consultas):\n'
+                f'   - FTS5:      {tiempos["fts5"]:.2f} ms/consulta\n'
+                f'   - icontains: {tiempos["icontains"]:.2f} ms/consulta\n'
+                f'   - {tiempos["icontains"] / tiempos["fts5"]:.1f}x más rápido con FTS5'
+            )
+        )
+
+    def _poblar(self, rnd, cantidad):
+        autores = Autor.objects.bulk_create(
+            Autor(nombre=rnd.choice(PALABRAS).title(), apellido=rnd.choice(PALABRAS).title())
+            for _ in range(max(1, cantidad // 20))
+        )
+        editoriales = Editorial.objects.bulk_create(
+            Editorial(nombre=f'Editorial {rnd.choice(PALABRAS).title()}') for _ in range(max(1, cantidad // 200))
+        )
+        lote = []
+        for i in range(cantidad):
+            lote.append(Libro(
+                titulo=' '.join(rnd.sample(PALABRAS, 2))[:20],
+                autor=rnd.choice(autores),
+                editorial=rnd.choice(editoriales),
+                isbn=f'99{i:011d}',
+            ))
+            if len(lote) == 5000:
+                Libro.objects.bulk_create(lote)
+                lote = []
+        Libro.objects.bulk_create(lote)
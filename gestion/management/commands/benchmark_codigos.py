@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, IntegrityError
+from gestion.models import Autor, Libro, Prestamo
+from gestion.secuencias import siguiente_codigo
+
+# Secuencia propia: el benchmark no consume números de los códigos BLB reales
+SECUENCIA = 'benchmark_codigos'
+PREFIJO = 'BCH'
+
+
+def _codigo_legado():
+    #Esquema anterior: leer la última fila y sumar 1
+    ultimo = Prestamo.objects.order_by('-id').first()
+    try:
+        numero = int(ultimo.codigo.split('-')[1]) + 1 if ultimo and ultimo.codigo else 1
+    except (IndexError, ValueError):
+        numero = 1
+    return f"BLB-{numero:03d}"
+
+
+class Command(BaseCommand):
+    help = 'Inserta préstamos en paralelo y verifica que no se repitan los códigos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--por-hilo', type=int, default=100)
+        parser.add_argument(
+            '--legado',
+            action='store_true',
+            help='Usa el esquema anterior (última fila + 1) para comparar',
+        )
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        por_hilo = options['por_hilo']
+        legado = options['legado']
+
+        autor = Autor.objects.create(nombre='Benchmark', apellido='Codigos')
+        libro = Libro.objects.create(titulo='Benchmark codigos', autor=autor, ejemplares=1)
+
+        codigos = []
+        colisiones = []
+        errores = []
+        resultados_lock = threading.Lock()
+
+        def trabajador():
+            try:
+                for _ in range(por_hilo):
+                    prestamo = Prestamo(libro=libro)
+                    if legado:
+                        prestamo.codigo = _codigo_legado()
+                    else:
+                        prestamo.codigo = siguiente_codigo(SECUENCIA, PREFIJO)
+                    try:
+                        prestamo.save()
+                    except IntegrityError:
+                        with resultados_lock:
+                            colisiones.append(prestamo.codigo)
+                        continue
+                    with resultados_lock:
+                        codigos.append(prestamo.codigo)
+            except Exception as e:
+                with resultados_lock:
+                    errores.append(str(e))
+            finally:
+                connection.close()
+
+        inicio = time.perf_counter()
+        threads = [threading.Thread(target=trabajador) for _ in range(hilos)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracion = time.perf_counter() - inicio
+
+        duplicados = len(codigos) - len(set(codigos))
+        Prestamo.objects.filter(libro=libro).delete()
+        libro.delete()
+        autor.delete()
+
+        for error in errores[:5]:
+            self.stdout.write(self.style.ERROR(f'Error: {error}'))
+
+        estilo = self.style.SUCCESS if not (colisiones or duplicados or errores) else self.style.ERROR
+        self.stdout.write(
+            estilo(
+                f'\n{"Esquema anterior" if legado else "Secuencia atómica"}:\n'
+                f'   - {len(codigos)} préstamos insertados en {duracion:.2f}s '
+                f'({len(codigos) / duracion if duracion else 0:.0f}/s)\n'
+                f'   - {len(colisiones)} colisiones de código (IntegrityError)\n'
+                f'   - {duplicados} códigos duplicados\n'
+                f'   - {len(errores)} hilos con errores'
+            )
+        )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from gestion.benchmarks import estresar_prestamos, generar_prestamo_legado, _usuario
+from gestion.models import Autor, Libro, Prestamo
+from gestion.secuencias import reservar_codigos
+
+# Secuencia propia: el benchmark no consume números de los códigos BLB reales
+SECUENCIA = 'benchmark_prestamos'
+PREFIJO = 'BCP'
+
+
+class Command(BaseCommand):
+    help = 'Genera préstamos del mismo libro desde varios hilos y comprueba que no se presten ejemplares de más'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--prestamos', type=int, default=400, help='Borradores a generar en total')
+        parser.add_argument('--ejemplares', type=int, default=100)
+        parser.add_argument('--sin-legado', action='store_true', help='No ejecuta la versión anterior para comparar')
+
+    def handle(self, *args, **options):
+        modos = [('UPDATE condicional', None)]
+        if not options['sin_legado']:
+            modos.append(('Esquema anterior', generar_prestamo_legado))
+
+        for nombre, generar in modos:
+            resultado = self._ejecutar(options, generar)
+            estilo = self.style.SUCCESS if not (resultado.sobreprestados or resultado.errores) else self.style.ERROR
+            for error in resultado.errores[:5]:
+                self.stdout.write(self.style.ERROR(f'Error: {error}'))
+            self.stdout.write(
+                estilo(
+                    f'\n{nombre} ({options["hilos"]} hilos, {options["ejemplares"]} ejemplares):\n'
+                    f'   - {resultado.intentos} intentos en {resultado.segundos:.2f}s '
+                    f'({resultado.por_segundo:.0f} préstamos/s)\n'
+                    f'   - {resultado.prestados} prestados, {resultado.rechazados} rechazados, '
+                    f'{resultado.reintentos} reintentos por bloqueo\n'
+                    f'   - {resultado.sobreprestados} ejemplares prestados de más'
+                )
+            )
+
+    def _ejecutar(self, options, generar):
+        autor = Autor.objects.create(nombre='Benchmark', apellido='Concurrencia')
+        libro = Libro.objects.create(titulo='Benchmark concurrencia', autor=autor, ejemplares=options['ejemplares'])
+        usuario = _usuario()
+        codigos = reservar_codigos(SECUENCIA, PREFIJO, options['prestamos'])
+        prestamos = Prestamo.objects.bulk_create(
+            Prestamo(codigo=codigo, libro=libro, usuario_biblioteca=usuario) for codigo in codigos
+        )
+        try:
+            return estresar_prestamos(libro, prestamos, options['hilos'], generar)
+        finally:
+            Prestamo.objects.filter(libro=libro).delete()
+            libro.delete()
+            autor.delete()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from gestion.cambios import compactar, configuracion, horizonte
+from gestion.models import Cambio
+
+
+class Command(BaseCommand):
+    help = 'Compacta el registro de cambios: deja el último cambio de cada objeto y elimina los borrados antiguos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retencion-dias',
+            type=int,
+            default=None,
+            help=f'Días que se conservan los borrados (por defecto {configuracion()["RETENCION_DIAS"]})',
+        )
+
+    def handle(self, *args, **options):
+        superados, borrados = compactar(options['retencion_dias'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Registro de cambios compactado:\n'
+                f'   - {superados} cambios superados eliminados\n'
+                f'   - {borrados} borrados vencidos eliminados\n'
+                f'   - {Cambio.objects.count()} cambios restantes, horizonte {horizonte()}'
+            )
+        )
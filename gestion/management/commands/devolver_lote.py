@@ -0,0 +1,50 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion.prestamos import devolver_lote, leer_devoluciones
+
+
+class Command(BaseCommand):
+    help = 'Procesa en lote las devoluciones del buzón (códigos de préstamo o ISBN + cédula)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'archivo',
+            help='Una devolución por línea: "BLB-001[,estado]" o "ISBN,cédula[,estado]"; "-" lee de stdin',
+        )
+        parser.add_argument('--reporte', help='Guarda el resultado por línea en un CSV')
+
+    def handle(self, *args, **options):
+        try:
+            if options['archivo'] == '-':
+                texto = sys.stdin.read()
+            else:
+                with open(options['archivo'], encoding='utf-8') as f:
+                    texto = f.read()
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        resultados = devolver_lote(leer_devoluciones(texto))
+
+        for resultado in resultados:
+            estilo = self.style.SUCCESS if resultado.ok else self.style.WARNING
+            self.stdout.write(estilo(f'{resultado.referencia}: {resultado.detalle}'))
+
+        if options['reporte']:
+            with open(options['reporte'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['referencia', 'codigo', 'ok', 'total_multas', 'detalle'])
+                for r in resultados:
+                    writer.writerow([r.referencia, r.codigo, r.ok, r.total_multas, r.detalle])
+
+        devueltos = [r for r in resultados if r.ok]
+        total = sum(r.total_multas for r in devueltos)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Devolución en lote completada:\n'
+                f'   - {len(devueltos)} préstamos devueltos\n'
+                f'   - {len(resultados) - len(devueltos)} con errores\n'
+                f'   - ${total:.2f} en multas'
+            )
+        )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from gestion.notificaciones import ResultadoEnvio, configuracion, encolar_multados, procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Envía las notificaciones de multas encoladas, por lotes y con una conexión de correo por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None,
+                            help=f'Notificaciones por lote (por defecto {configuracion()["LOTE"]})')
+        parser.add_argument('--multados', action='store_true',
+                            help='Antes de enviar, encola un aviso para cada préstamo con multas pendientes')
+        parser.add_argument('--continuo', action='store_true',
+                            help='No termina al vaciar la cola: espera y vuelve a revisarla')
+        parser.add_argument('--intervalo', type=float, default=30,
+                            help='Segundos entre revisiones de la cola en modo --continuo')
+
+    def handle(self, *args, **options):
+        if options['multados']:
+            self.stdout.write(f'{encolar_multados()} notificaciones encoladas')
+
+        total = ResultadoEnvio()
+        try:
+            while True:
+                resultado = procesar_pendientes(options['lote'])
+                for error in resultado.errores:
+                    self.stdout.write(self.style.WARNING(error))
+                total.enviadas += resultado.enviadas
+                total.reintentos += resultado.reintentos
+                total.fallidas += resultado.fallidas
+                total.descartadas += resultado.descartadas
+                if not resultado.procesadas:
+                    if not options['continuo']:
+                        break
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Notificaciones procesadas:\n'
+                f'   - {total.enviadas} enviadas\n'
+                f'   - {total.reintentos} con reintento programado, {total.fallidas} fallidas\n'
+                f'   - {total.descartadas} descartadas (multas ya pagadas)'
+            )
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from gestion.exportacion import parsear_fecha
+from gestion.notificaciones import enviar_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Envía a cada usuario un único correo con todas sus multas pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', default=None, help='Fecha del resumen (AAAA-MM-DD, por defecto hoy)')
+        parser.add_argument('--forzar', action='store_true', help='Envía aunque ya se haya enviado el resumen de esa fecha')
+
+    def handle(self, *args, **options):
+        try:
+            fecha = parsear_fecha(options['fecha']) or timezone.now().date()
+        except ValueError:
+            raise CommandError('Fecha inválida, use AAAA-MM-DD')
+
+        resultado = enviar_resumenes(fecha, forzar=options['forzar'])
+        if resultado is None:
+            self.stdout.write(self.style.WARNING(f'El resumen del {fecha} ya fue enviado (use --forzar para repetirlo)'))
+            return
+        for error in resultado.errores[:20]:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Resumen de multas del {fecha}:\n'
+                f'   - {resultado.enviadas} correos enviados\n'
+                f'   - {resultado.fallidas} fallidos'
+            )
+        )
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion import exportacion
+
+
+class Command(BaseCommand):
+    help = 'Exporta préstamos o multas en CSV/NDJSON leyendo la base de datos por bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=list(exportacion.COLUMNAS))
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='csv')
+        parser.add_argument('--desde', help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (AAAA-MM-DD)')
+        parser.add_argument('--estado', help='Estado del préstamo (b, p, m, d) o, para multas, pagada/pendiente')
+        parser.add_argument('--gzip', action='store_true', help='Comprime la salida con gzip')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = exportacion.parsear_fecha(options['desde'])
+            hasta = exportacion.parsear_fecha(options['hasta'])
+        except ValueError:
+            raise CommandError('Fecha inválida, use AAAA-MM-DD')
+
+        destino = open(options['salida'], 'wb') if options['salida'] else sys.stdout.buffer
+        escritos = 0
+        try:
+            for bloque in exportacion.bloques(
+                options['modelo'], options['formato'], options['gzip'],
+                desde=desde, hasta=hasta, estado=options['estado'],
+            ):
+                destino.write(bloque)
+                escritos += len(bloque)
+        finally:
+            if options['salida']:
+                destino.close()
+            else:
+                destino.flush()
+
+        if options['salida']:
+            self.stdout.write(self.style.SUCCESS(f'✅ {escritos} bytes escritos en {options["salida"]}'))
@@ -0,0 +1,46 @@
+import csv
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion.importacion import importar_isbns, leer_isbns
+
+
+class Command(BaseCommand):
+    help = 'Importa libros desde OpenLibrary a partir de un archivo CSV/texto con ISBNs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo con un ISBN por línea (o separados por comas)')
+        parser.add_argument('--workers', type=int, default=8, help='Consultas HTTP simultáneas')
+        parser.add_argument('--batch-size', type=int, default=500, help='Libros por inserción masiva')
+        parser.add_argument('--reporte', help='Guarda el resultado por ISBN en un CSV')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], 'rb') as f:
+                isbns = leer_isbns(f.read())
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        resultados = importar_isbns(isbns, workers=options['workers'], batch_size=options['batch_size'])
+
+        for resultado in resultados:
+            estilo = self.style.SUCCESS if resultado.estado == 'importado' else self.style.WARNING
+            self.stdout.write(estilo(f'{resultado.isbn}: {resultado.estado} {resultado.detalle}'))
+
+        if options['reporte']:
+            with open(options['reporte'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['isbn', 'estado', 'detalle'])
+                for resultado in resultados:
+                    writer.writerow([resultado.isbn, resultado.estado, resultado.detalle])
+
+        conteo = Counter(r.estado for r in resultados)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Importación completada:\n'
+                f'   - {conteo["importado"]} libros importados\n'
+                f'   - {conteo["existente"]} ya existían\n'
+                f'   - {conteo["no_encontrado"]} no encontrados\n'
+                f'   - {conteo["invalido"] + conteo["error"]} con errores'
+            )
+        )
@@ -0,0 +1,39 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from gestion import liderazgo
+from gestion.models import Liderazgo
+from gestion.scheduler import NOMBRE, Coordinador
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta las tareas programadas en un proceso propio. Se pueden lanzar varias réplicas: '
+            'solo la que tiene el liderazgo ejecuta los jobs y, si cae, otra toma el relevo')
+
+    def handle(self, *args, **options):
+        opciones = liderazgo.configuracion()
+        # La identidad se calcula en el proceso que late, no al importar el módulo
+        coordinador = Coordinador(liderazgo.titular_local())
+        detener = threading.Event()
+        # SIGTERM (systemd, docker stop) termina igual que Ctrl+C: cede el liderazgo
+        signal.signal(signal.SIGTERM, lambda *_: detener.set())
+
+        self.stdout.write(
+            f'Scheduler {coordinador.titular}: latido cada {opciones["LATIDO"]} s, '
+            f'concesión de {opciones["DURACION"]} s'
+        )
+        try:
+            coordinador.ejecutar(detener)
+        except KeyboardInterrupt:
+            # ejecutar() ya cedió el liderazgo al salir
+            pass
+
+        lider = Liderazgo.objects.filter(nombre=NOMBRE).first()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Scheduler detenido:\n'
+                f'   - {coordinador.titular}\n'
+                f'   - Líder actual: {(lider and lider.titular) or "ninguno"}'
+            )
+        )
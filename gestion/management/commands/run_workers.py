@@ -0,0 +1,67 @@
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from gestion.models import Tarea
+from gestion.tareas import configuracion, trabajar
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas encoladas (importaciones, acciones masivas) con un pool de workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=None,
+                            help=f'Workers (hilos) por proceso (por defecto {configuracion()["WORKERS"]})')
+        parser.add_argument('--procesos', type=int, default=1,
+                            help='Procesos a lanzar, cada uno con --hilos workers')
+        parser.add_argument('--intervalo', type=float, default=None,
+                            help='Segundos entre revisiones de la cola vacía')
+
+    def handle(self, *args, **options):
+        hilos = options['hilos'] or configuracion()['WORKERS']
+        detener = threading.Event()
+        # SIGTERM (systemd, docker stop) termina igual que Ctrl+C: se terminan las tareas en curso
+        signal.signal(signal.SIGTERM, lambda *_: detener.set())
+
+        if options['procesos'] > 1:
+            self._lanzar_procesos(options['procesos'], hilos, options['intervalo'], detener)
+        else:
+            self.stdout.write(f'{hilos} workers esperando tareas')
+            with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='worker') as pool:
+                for _ in range(hilos):
+                    pool.submit(trabajar, detener, options['intervalo'])
+                try:
+                    while not detener.wait(1):
+                        pass
+                except KeyboardInterrupt:
+                    detener.set()
+
+        pendientes = Tarea.objects.filter(estado__in=('p', 'e')).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Workers detenidos:\n'
+                f'   - {options["procesos"]} proceso(s) con {hilos} hilo(s)\n'
+                f'   - {pendientes} tareas pendientes en la cola'
+            )
+        )
+
+    def _lanzar_procesos(self, procesos, hilos, intervalo, detener):
+        #Cada proceso hijo es un run_workers de un solo proceso; las señales se reenvían
+        comando = [sys.executable, sys.argv[0], 'run_workers', '--hilos', str(hilos)]
+        if intervalo:
+            comando += ['--intervalo', str(intervalo)]
+        hijos = [subprocess.Popen(comando) for _ in range(procesos)]
+        self.stdout.write(f'{procesos} procesos con {hilos} workers cada uno')
+        try:
+            while not detener.wait(1) and all(hijo.poll() is None for hijo in hijos):
+                pass
+        except KeyboardInterrupt:
+            pass
+        for hijo in hijos:
+            if hijo.poll() is None:
+                hijo.terminate()
+        for hijo in hijos:
+            hijo.wait()
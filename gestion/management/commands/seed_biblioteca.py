@@ -0,0 +1,280 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.core.management.color import no_style
+from django.db.models import Max
+from django.utils import timezone
+from gestion.models import (
+    Autor, Editorial, Libro, Multa, Prestamo, UsuarioBiblioteca, TARIFA_RETRASO,
+)
+from gestion.cambios import LIBRO, MULTA, PRESTAMO, USUARIO as CAMBIO_USUARIO, registrar
+from gestion.secuencias import reservar_codigos
+from gestion.versiones import CATALOGO, USUARIO, tocar
+
+NOMBRES = [
+    'María', 'José', 'Luis', 'Ana', 'Carlos', 'Lucía', 'Jorge', 'Sofía', 'Pedro', 'Valeria',
+    'Miguel', 'Camila', 'Andrés', 'Daniela', 'Diego', 'Gabriela', 'Fernando', 'Paula', 'Javier', 'Isabel',
+]
+APELLIDOS = [
+    'Pérez', 'González', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Ramírez', 'Torres', 'Flores', 'Vera',
+    'Mora', 'Castro', 'Vargas', 'Ortiz', 'Cedeño', 'Zambrano', 'Andrade', 'Salazar', 'Guerrero', 'Paredes',
+]
+PALABRAS = [
+    'sombra', 'viento', 'ciudad', 'mar', 'noche', 'tiempo', 'amor', 'guerra', 'cielo', 'fuego',
+    'piedra', 'camino', 'sol', 'luna', 'jardín', 'río', 'memoria', 'silencio', 'reino', 'selva',
+]
+PAISES = ['Ecuador', 'Colombia', 'Perú', 'México', 'España', 'Argentina', 'Chile']
+TIPOS_USUARIO = (['estudiante'] * 7) + (['profesor'] * 2) + ['externo']
+
+
+def cedula_ecuatoriana(numero):
+    """Genera la cédula válida número ``numero`` (provincia 01-24 + dígito verificador)"""
+    provincia = numero % 24 + 1
+    cuerpo = f'{provincia:02d}{(numero // 24) % 10_000_000:07d}'
+    coeficientes = [2, 1, 2, 1, 2, 1, 2, 1, 2]
+    suma = 0
+    for digito, coeficiente in zip(cuerpo, coeficientes):
+        producto = int(digito) * coeficiente
+        suma += producto - 9 if producto >= 10 else producto
+    verificador = 0 if suma % 10 == 0 else 10 - (suma % 10)
+    return f'{cuerpo}{verificador}'
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos realistas (autores, libros, usuarios, préstamos y multas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--autores', type=int, default=10_000)
+        parser.add_argument('--editoriales', type=int, default=500)
+        parser.add_argument('--libros', type=int, default=100_000)
+        parser.add_argument('--usuarios', type=int, default=50_000)
+        parser.add_argument('--prestamos', type=int, default=1_000_000)
+        parser.add_argument('--semilla', type=int, default=2024)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dias', type=int, default=730, help='Antigüedad máxima de los préstamos')
+        parser.add_argument('--tasa-vencidos', type=float, default=0.08,
+                            help='Fracción de préstamos activos que ya vencieron')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['semilla'])
+        self.batch = options['batch_size']
+        self.hoy = timezone.now().date()
+        self.activos_por_libro = {}
+        inicio = time.perf_counter()
+
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                # Carga masiva: menos fsync, misma integridad al terminar
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        ultimos = {
+            modelo: modelo.objects.aggregate(m=Max('id'))['m'] or 0
+            for modelo in (Libro, UsuarioBiblioteca, Prestamo, Multa)
+        }
+        editoriales = self._editoriales(options['editoriales'])
+        autores = self._autores(options['autores'])
+        libros = self._libros(options['libros'], autores, editoriales)
+        usuarios = self._usuarios(options['usuarios'])
+        prestamos = self._prestamos(options['prestamos'], libros, usuarios, options)
+        self._recalcular_contadores()
+        # Los INSERT directos no emiten señales: se invalidan las versiones de la API
+        tocar(CATALOGO)
+        tocar(USUARIO, UsuarioBiblioteca.objects.values('id'))
+        # Registro de cambios: un INSERT ... SELECT por modelo con las filas nuevas
+        for modelo, nombre in ((UsuarioBiblioteca, CAMBIO_USUARIO), (Libro, LIBRO), (Prestamo, PRESTAMO), (Multa, MULTA)):
+            registrar(nombre, modelo.objects.filter(id__gt=ultimos[modelo]))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Datos generados en {time.perf_counter() - inicio:.1f}s:\n'
+                f'   - {len(editoriales)} editoriales, {len(autores)} autores, {len(libros)} libros\n'
+                f'   - {len(usuarios)} usuarios\n'
+                f'   - {prestamos[0]} préstamos, {prestamos[1]} multas'
+            )
+        )
+
+    def _insertar(self, modelo, objetos):
+        #bulk_create por lotes dentro de una transacción por lote
+        creados = []
+        for i in range(0, len(objetos), self.batch):
+            with transaction.atomic():
+                creados.extend(modelo.objects.bulk_create(objetos[i:i + self.batch]))
+        return creados
+
+    def _editoriales(self, cantidad):
+        rnd = self.rnd
+        return [e.id for e in self._insertar(Editorial, [
+            Editorial(nombre=f'Ediciones {rnd.choice(PALABRAS).title()} {i}', pais=rnd.choice(PAISES))
+            for i in range(cantidad)
+        ])]
+
+    def _autores(self, cantidad):
+        rnd = self.rnd
+        return [a.id for a in self._insertar(Autor, [
+            Autor(nombre=rnd.choice(NOMBRES), apellido=f'{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}')
+            for _ in range(cantidad)
+        ])]
+
+    def _libros(self, cantidad, autores, editoriales):
+        rnd = self.rnd
+        base_isbn = (Libro.objects.aggregate(m=Max('id'))['m'] or 0) * 10
+        libros = []
+        for i in range(cantidad):
+            anio = rnd.randint(1950, self.hoy.year)
+            libros.append(Libro(
+                titulo=' '.join(rnd.sample(PALABRAS, 2)).title()[:20],
+                # Algunos autores y editoriales concentran gran parte del catálogo
+                autor_id=autores[min(int(rnd.paretovariate(1.2)) - 1, len(autores) - 1)]
+                if rnd.random() < 0.3 else rnd.choice(autores),
+                editorial_id=rnd.choice(editoriales) if editoriales and rnd.random() < 0.9 else None,
+                isbn=f'98{base_isbn + i:011d}',
+                paginas=rnd.randint(80, 900),
+                fecha_publicacion=date(anio, 1, 1),
+                costo=Decimal(rnd.randint(800, 6000)) / 100,
+                ejemplares=rnd.choices([1, 2, 3, 5, 10], weights=[50, 25, 12, 8, 5])[0],
+            ))
+        return [(l.id, l.ejemplares, l.costo) for l in self._insertar(Libro, libros)]
+
+    def _usuarios(self, cantidad):
+        rnd = self.rnd
+        existentes = set(UsuarioBiblioteca.objects.values_list('cedula', flat=True))
+        usuarios = []
+        numero = rnd.randint(0, 10_000_000)
+        while len(usuarios) < cantidad:
+            cedula = cedula_ecuatoriana(numero)
+            numero += 1
+            if cedula in existentes:
+                continue
+            existentes.add(cedula)
+            nombre = f'{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}'
+            usuarios.append(UsuarioBiblioteca(
+                nombre=nombre,
+                cedula=cedula,
+                email=f'{cedula}@correo.test',
+                tipo=rnd.choice(TIPOS_USUARIO),
+                activo=rnd.random() < 0.95,
+            ))
+        return [u.id for u in self._insertar(UsuarioBiblioteca, usuarios)]
+
+    def _prestamos(self, cantidad, libros, usuarios, options):
+        rnd = self.rnd
+        if not libros or not usuarios:
+            return 0, 0
+        # Popularidad tipo Zipf: pocos títulos concentran la mayoría de préstamos
+        pesos = [1 / (i + 1) ** 0.9 for i in range(len(libros))]
+        acumulados = []
+        total = 0
+        for peso in pesos:
+            total += peso
+            acumulados.append(total)
+
+        ops = connection.ops
+        fecha = ops.adapt_datefield_value
+        decimal = ops.adapt_decimalfield_value
+        # Carga fuera de línea: ids explícitos para enlazar las multas sin releer
+        siguiente_prestamo = (Prestamo.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        siguiente_multa = (Multa.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        sql_prestamo = self._sql_insert(Prestamo, [
+            'id', 'codigo', 'libro_id', 'usuario_biblioteca_id', 'fecha_prestamos',
+            'fecha_max', 'fecha_devolucion', 'estado', 'estado_libro',
+        ])
+        sql_multa = self._sql_insert(Multa, ['id', 'codigo', 'prestamo_id', 'tipo', 'monto', 'pagada', 'fecha'])
+
+        self.activos_por_libro = {}
+        n_prestamos = n_multas = 0
+        dias = options['dias']
+        # Probabilidad de que un préstamo no reciente siga activo (ya vencido) para
+        # que, en promedio, --tasa-vencidos sea la fracción vencida de los activos.
+        # Con antigüedad triangular(0, dias, 0), P(reciente) = 1 - (1 - 3/dias)^2
+        tasa = min(max(options['tasa_vencidos'], 0.0), 1.0)
+        recientes = 1 - (1 - 3 / dias) ** 2 if dias > 3 else 1.0
+        if tasa >= 1 or recientes >= 1:
+            prob_vencido = tasa
+        else:
+            prob_vencido = min(1.0, tasa * recientes / ((1 - tasa) * (1 - recientes)))
+
+        for inicio in range(0, cantidad, self.batch):
+            tamano = min(self.batch, cantidad - inicio)
+            elegidos = rnd.choices(libros, cum_weights=acumulados, k=tamano)
+            filas_prestamo = []
+            multas = []
+            for (libro_id, ejemplares, costo), codigo in zip(
+                elegidos, reservar_codigos('prestamo', 'BLB', tamano)
+            ):
+                prestamo_id = siguiente_prestamo
+                siguiente_prestamo += 1
+                antiguedad = int(rnd.triangular(0, dias, 0))
+                fecha_prestamo = self.hoy - timedelta(days=antiguedad)
+                fecha_max = fecha_prestamo + timedelta(days=2)
+                # Reciente o vencido sin devolver, sin superar los ejemplares del libro
+                activo = (
+                    (antiguedad <= 2 or rnd.random() < prob_vencido)
+                    and self.activos_por_libro.get(libro_id, 0) < ejemplares
+                )
+                if activo:
+                    self.activos_por_libro[libro_id] = self.activos_por_libro.get(libro_id, 0) + 1
+                    estado = 'm' if fecha_max < self.hoy else 'p'
+                    devolucion = None
+                    estado_libro = 'bueno'
+                else:
+                    estado = 'd'
+                    retraso = rnd.choices([0, 1, 3, 7, 20], weights=[80, 8, 6, 4, 2])[0]
+                    devolucion = min(fecha_max + timedelta(days=retraso), self.hoy)
+                    estado_libro = rnd.choices(['bueno', 'danado', 'perdido'], weights=[96, 3, 1])[0]
+                filas_prestamo.append((
+                    prestamo_id, codigo, libro_id, rnd.choice(usuarios), fecha(fecha_prestamo),
+                    fecha(fecha_max), fecha(devolucion), estado, estado_libro,
+                ))
+
+                # Multas con la misma mezcla que genera devolver_libro()
+                fecha_ref = devolucion or self.hoy
+                fecha_multa = devolucion or fecha_max + timedelta(days=1)
+                pagada = estado == 'd' and rnd.random() < 0.85
+                if fecha_ref > fecha_max:
+                    multas.append((prestamo_id, 'r', (fecha_ref - fecha_max).days * TARIFA_RETRASO, pagada, fecha_multa))
+                if estado_libro == 'danado':
+                    multas.append((prestamo_id, 'd', costo * Decimal('0.5'), pagada, fecha_multa))
+                elif estado_libro == 'perdido':
+                    multas.append((prestamo_id, 'p', costo * 2, pagada, fecha_multa))
+
+            filas_multa = []
+            for (prestamo_id, tipo, monto, pagada, fecha_multa), codigo in zip(
+                multas, reservar_codigos('multa', 'MLT', len(multas))
+            ):
+                filas_multa.append((
+                    siguiente_multa, codigo, prestamo_id, tipo, decimal(monto, 6, 2), pagada, fecha(fecha_multa),
+                ))
+                siguiente_multa += 1
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql_prestamo, filas_prestamo)
+                cursor.executemany(sql_multa, filas_multa)
+            n_prestamos += len(filas_prestamo)
+            n_multas += len(filas_multa)
+
+        with connection.cursor() as cursor:
+            for sql in ops.sequence_reset_sql(no_style(), [Prestamo, Multa]):
+                cursor.execute(sql)
+        return n_prestamos, n_multas
+
+    def _sql_insert(self, modelo, columnas):
+        qn = connection.ops.quote_name
+        return (
+            f'INSERT INTO {qn(modelo._meta.db_table)} ({", ".join(qn(c) for c in columnas)}) '
+            f'VALUES ({", ".join(["%s"] * len(columnas))})'
+        )
+
+    def _recalcular_contadores(self):
+        #Los INSERT directos no pasan por Prestamo.save(): se suma el contador al final
+        sql = (
+            'UPDATE gestion_libro SET ejemplares_prestados = ejemplares_prestados + %s, '
+            'disponible = (ejemplares_prestados + %s < ejemplares), version = version + 1 WHERE id = %s'
+        )
+        filas = [(activos, activos, libro_id) for libro_id, activos in self.activos_por_libro.items()]
+        for i in range(0, len(filas), self.batch):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, filas[i:i + self.batch])
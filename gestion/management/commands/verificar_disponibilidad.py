@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+from gestion.cambios import LIBRO, registrar
+from gestion.models import Libro, ESTADOS_ACTIVOS
+from gestion.versiones import CATALOGO, tocar
+
+
+class Command(BaseCommand):
+    help = 'Compara el contador de ejemplares prestados con los préstamos activos y corrige diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corregir',
+            action='store_true',
+            help='Actualiza los libros con contador desfasado (por defecto solo informa)',
+        )
+
+    def handle(self, *args, **options):
+        # Conteo real de préstamos activos calculado en una sola consulta
+        libros = Libro.objects.annotate(
+            activos=Count('prestamos', filter=Q(prestamos__estado__in=ESTADOS_ACTIVOS))
+        ).only('id', 'titulo', 'ejemplares', 'ejemplares_prestados', 'disponible')
+
+        desfasados = []
+        for libro in libros.iterator(chunk_size=2000):
+            if libro.ejemplares_prestados != libro.activos:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Libro #{libro.id} "{libro.titulo}": contador={libro.ejemplares_prestados}, '
+                        f'préstamos activos={libro.activos}'
+                    )
+                )
+                libro.ejemplares_prestados = libro.activos
+                libro.disponible = libro.activos < libro.ejemplares
+                libro.version = F('version') + 1
+                desfasados.append(libro)
+
+        if desfasados and options['corregir']:
+            with transaction.atomic():
+                Libro.objects.bulk_update(
+                    desfasados, ['ejemplares_prestados', 'disponible', 'version'], batch_size=500
+                )
+                tocar(CATALOGO)
+                registrar(LIBRO, [libro.id for libro in desfasados])
+
+        accion = 'corregidos' if options['corregir'] else 'detectados (use --corregir)'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Verificación completada:\n'
+                f'   - {len(desfasados)} libros desfasados {accion}'
+            )
+        )
@@ -1,31 +1,132 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
 from django.utils import timezone
 from gestion.models import Prestamo, Multa
+from gestion.multas import prestamos_vencidos, procesar_vencidos, registrar_ejecucion, ultima_ejecucion
+
+
+def _procesar_rango(fecha_actual, desde_id, hasta_id, chunk_size, fecha_desde):
+    #Se ejecuta en un proceso hijo con su propia conexión a la base de datos
+    try:
+        return procesar_vencidos(fecha_actual, desde_id, hasta_id, chunk_size, fecha_desde)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
     help = 'Verifica préstamos vencidos y crea multas automáticamente'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Procesa los préstamos por bloques con operaciones masivas',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Préstamos por bloque en modo --bulk (por defecto 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos que se reparten los préstamos por rango de id (implica --bulk)',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Solo procesa préstamos vencidos desde la última ejecución (implica --bulk)',
+        )
+
+    def handle(self, *args, **options):
         #Ejecuta la verificación de préstamos vencidos
         fecha_actual = timezone.now().date()
-        
+
+        if options['bulk'] or options['workers'] > 1 or options['incremental']:
+            # Las multas existentes no se reescriben: Multa.monto_vigente las
+            # calcula desde fecha_max, así que basta con los nuevos vencidos
+            fecha_desde = ultima_ejecucion() if options['incremental'] else None
+            multas_creadas, multas_actualizadas, revisados = self._handle_bulk(
+                fecha_actual, fecha_desde, options
+            )
+        else:
+            multas_creadas, multas_actualizadas, revisados = self._handle_por_prestamo(fecha_actual)
+
+        registrar_ejecucion(fecha_actual)
+
+        # Resumen
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ Proceso completado:\n'
+                f'   - {multas_creadas} multas creadas\n'
+                f'   - {multas_actualizadas} multas actualizadas\n'
+                f'   - {revisados} préstamos vencidos revisados'
+            )
+        )
+
+    def _handle_bulk(self, fecha_actual, fecha_desde, options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+
+        if workers <= 1:
+            resultados = [procesar_vencidos(fecha_actual, chunk_size=chunk_size, fecha_desde=fecha_desde)]
+        else:
+            rango = prestamos_vencidos(fecha_actual, fecha_desde).aggregate(minimo=Min('id'), maximo=Max('id'))
+            if rango['minimo'] is None:
+                resultados = []
+            else:
+                # Rangos de id contiguos, uno por proceso
+                paso = (rango['maximo'] - rango['minimo']) // workers + 1
+                rangos = [
+                    (desde, min(desde + paso - 1, rango['maximo']))
+                    for desde in range(rango['minimo'], rango['maximo'] + 1, paso)
+                ]
+                # Las conexiones abiertas no deben heredarse al hacer fork
+                connections.close_all()
+                contexto = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+                    futuros = [
+                        pool.submit(_procesar_rango, fecha_actual, desde, hasta, chunk_size, fecha_desde)
+                        for desde, hasta in rangos
+                    ]
+                    resultados = [f.result() for f in futuros]
+
+        creadas = actualizadas = revisados = 0
+        for resultado in resultados:
+            creadas += resultado.creadas
+            actualizadas += resultado.actualizadas
+            revisados += resultado.revisados
+            # Una línea por préstamo, como el modo por préstamo; -v 0 solo deja el resumen
+            if options['verbosity'] >= 1:
+                for nivel, mensaje in resultado.mensajes:
+                    self.stdout.write(getattr(self.style, nivel)(mensaje))
+        return creadas, actualizadas, revisados
+
+    def _handle_por_prestamo(self, fecha_actual):
         # Buscar préstamos en estado Prestado que ya pasaron la fecha máxima
         prestamos_vencidos = Prestamo.objects.filter(
             estado='p',
             fecha_max__lt=fecha_actual
         )
-        
+
         multas_creadas = 0
         multas_actualizadas = 0
-        
+        revisados = 0
+
         for prestamo in prestamos_vencidos:
+            revisados += 1
             # Calcular días de retraso
             dias_retraso = (fecha_actual - prestamo.fecha_max).days
-            
+
             # Verificar si ya existe multa por retraso
             multa_existente = prestamo.multas.filter(tipo='r').first()
-            
+
             if multa_existente:
                 # Actualizar monto de la multa existente
                 multa_existente.monto = dias_retraso * 1.0
@@ -44,24 +145,16 @@ class Command(BaseCommand):
                     monto=dias_retraso * 1.0,
                     fecha=fecha_actual
                 )
-                
+
                 # Cambiar estado del préstamo a Multado
                 prestamo.estado = 'm'
                 prestamo.save()
-                
+
                 multas_creadas += 1
                 self.stdout.write(
                     self.style.SUCCESS(
                         f'Nueva multa creada: Préstamo #{prestamo.id} - ${dias_retraso}.00'
                     )
                 )
-        
-        # Resumen
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'\n✅ Proceso completado:\n'
-                f'   - {multas_creadas} multas creadas\n'
-                f'   - {multas_actualizadas} multas actualizadas\n'
-                f'   - {prestamos_vencidos.count()} préstamos vencidos revisados'
-            )
-        )
\ No newline at end of file
+
+        return multas_creadas, multas_actualizadas, revisados
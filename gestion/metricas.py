@@ -0,0 +1,245 @@
+"""Métricas de latencia y consultas por vista.
+
+``MetricasMiddleware`` registra, para cada nombre de URL resuelto, el tiempo
+total de la petición, la cantidad de consultas y el tiempo en la base de datos.
+Los valores se guardan en histogramas log-lineales (estilo HDR) en memoria del
+proceso: cada proceso del servidor tiene sus propias métricas.
+
+El contador de la petición en curso va en una ``ContextVar`` y cada conexión
+tiene instalado ``_contar``, así que también se cuentan las consultas que una
+vista async hace en otros hilos (``sync_to_async``, pools con el contexto copiado).
+"""
+import contextvars
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+# Sub-cubetas por potencia de 2: error relativo máximo ~3% (1/32)
+SUB_CUBETAS_BITS = 5
+SUB_CUBETAS = 1 << SUB_CUBETAS_BITS
+PERCENTILES = (0.5, 0.95, 0.99)
+
+CONFIGURACION = {
+    'ACTIVO': True,
+    # Fracción de peticiones que se miden (1.0 = todas)
+    'MUESTREO': 1.0,
+    # Token opcional para que Prometheus lea /metricas/prometheus/ sin sesión
+    'TOKEN': None,
+}
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_METRICAS', {})}
+
+
+class ContadorConsultas:
+    """``execute_wrapper`` que cuenta consultas y tiempo en la base de datos"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+_contador_actual = contextvars.ContextVar('contador_consultas', default=None)
+
+
+def _contar(execute, sql, params, many, context):
+    contador = _contador_actual.get()
+    if contador is None:
+        return execute(sql, params, many, context)
+    return contador(execute, sql, params, many, context)
+
+
+def _instalar(connection, **kwargs):
+    if _contar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar)
+
+
+connection_created.connect(_instalar, dispatch_uid='metricas_contar')
+
+
+def _indice(valor):
+    #Valores < SUB_CUBETAS son exactos; luego SUB_CUBETAS cubetas por cada potencia de 2
+    if valor < SUB_CUBETAS:
+        return valor
+    exponente = valor.bit_length() - SUB_CUBETAS_BITS - 1
+    return (exponente + 1) * SUB_CUBETAS + (valor >> exponente) - SUB_CUBETAS
+
+
+def _valor(indice):
+    #Punto medio de la cubeta
+    if indice < SUB_CUBETAS:
+        return indice
+    exponente = indice // SUB_CUBETAS - 1
+    inferior = (indice % SUB_CUBETAS + SUB_CUBETAS) << exponente
+    return inferior + ((1 << exponente) - 1) / 2
+
+
+class Histograma:
+    """Histograma de enteros no negativos con precisión relativa constante"""
+
+    def __init__(self):
+        self.cubetas = {}
+        self.cantidad = 0
+        self.suma = 0
+        self.maximo = 0
+
+    def registrar(self, valor):
+        valor = max(0, int(valor))
+        indice = _indice(valor)
+        self.cubetas[indice] = self.cubetas.get(indice, 0) + 1
+        self.cantidad += 1
+        self.suma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def percentil(self, p):
+        if not self.cantidad:
+            return 0
+        objetivo = max(1, round(p * self.cantidad))
+        acumulado = 0
+        for indice in sorted(self.cubetas):
+            acumulado += self.cubetas[indice]
+            if acumulado >= objetivo:
+                return min(_valor(indice), self.maximo)
+        return self.maximo
+
+
+class MetricasVista:
+    # Latencias en microsegundos para que el histograma trabaje con enteros
+    def __init__(self):
+        self.latencia_us = Histograma()
+        self.consultas = Histograma()
+        self.bd_us = Histograma()
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._vistas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, vista, segundos, consultas, segundos_bd):
+        with self._lock:
+            metricas = self._vistas.get(vista)
+            if metricas is None:
+                metricas = self._vistas[vista] = MetricasVista()
+            metricas.latencia_us.registrar(segundos * 1e6)
+            metricas.consultas.registrar(consultas)
+            metricas.bd_us.registrar(segundos_bd * 1e6)
+
+    def reiniciar(self):
+        with self._lock:
+            self._vistas = {}
+
+    def resumen(self):
+        """Percentiles por vista: latencia y tiempo de BD en ms, consultas por petición"""
+        with self._lock:
+            resultado = {}
+            for vista, m in sorted(self._vistas.items()):
+                resultado[vista] = {
+                    'peticiones': m.latencia_us.cantidad,
+                    'latencia_ms': _percentiles(m.latencia_us, 1e-3),
+                    'consultas': _percentiles(m.consultas, 1),
+                    'bd_ms': _percentiles(m.bd_us, 1e-3),
+                }
+            return resultado
+
+    def prometheus(self):
+        """Exposición en formato de texto de Prometheus (tipo summary)"""
+        series = (
+            ('gestion_vista_latencia_segundos', 'Duración de la petición por vista', 'latencia_us', 1e-6),
+            ('gestion_vista_consultas', 'Consultas SQL por petición', 'consultas', 1),
+            ('gestion_vista_bd_segundos', 'Tiempo en la base de datos por petición', 'bd_us', 1e-6),
+        )
+        with self._lock:
+            lineas = []
+            for nombre, ayuda, atributo, escala in series:
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} summary')
+                for vista, m in sorted(self._vistas.items()):
+                    histograma = getattr(m, atributo)
+                    etiqueta = vista.replace('\\', '\\\\').replace('"', '\\"')
+                    for p in PERCENTILES:
+                        lineas.append(
+                            f'{nombre}{{vista="{etiqueta}",quantile="{p}"}} {histograma.percentil(p) * escala:g}'
+                        )
+                    lineas.append(f'{nombre}_sum{{vista="{etiqueta}"}} {histograma.suma * escala:g}')
+                    lineas.append(f'{nombre}_count{{vista="{etiqueta}"}} {histograma.cantidad}')
+            return '\n'.join(lineas) + '\n'
+
+
+def _percentiles(histograma, escala):
+    datos = {f'p{int(p * 100)}': round(histograma.percentil(p) * escala, 3) for p in PERCENTILES}
+    datos['max'] = round(histograma.maximo * escala, 3)
+    return datos
+
+
+registro = RegistroMetricas()
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        opciones = configuracion()
+        self.activo = opciones['ACTIVO']
+        self.muestreo = opciones['MUESTREO']
+        # Bajo ASGI la cadena es async y las vistas async no ocupan un hilo
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def _medir(self):
+        return self.activo and (self.muestreo >= 1 or random.random() < self.muestreo)
+
+    def _registrar(self, request, segundos, contador):
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia and coincidencia.view_name else '<sin_resolver>'
+        registro.registrar(vista, segundos, contador.consultas, contador.segundos)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not self._medir():
+            return self.get_response(request)
+
+        # La conexión de este hilo pudo abrirse antes de importar este módulo
+        _instalar(connection)
+        contador = ContadorConsultas()
+        token = _contador_actual.set(contador)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _contador_actual.reset(token)
+        self._registrar(request, time.perf_counter() - inicio, contador)
+        return response
+
+    async def __acall__(self, request):
+        if not self._medir():
+            return await self.get_response(request)
+
+        contador = ContadorConsultas()
+        token = _contador_actual.set(contador)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _contador_actual.reset(token)
+        self._registrar(request, time.perf_counter() - inicio, contador)
+        return response
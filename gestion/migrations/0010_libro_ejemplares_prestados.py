@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def calcular_ejemplares_prestados(apps, schema_editor):
+    """Inicializa el contador con los préstamos activos existentes"""
+    Libro = apps.get_model('gestion', 'Libro')
+    libros = Libro.objects.annotate(
+        activos=Count('prestamos', filter=Q(prestamos__estado__in=['p', 'm']))
+    ).filter(activos__gt=0)
+    for libro in libros:
+        libro.ejemplares_prestados = libro.activos
+    Libro.objects.bulk_update(libros, ['ejemplares_prestados'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_add_codigos_secuenciales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='ejemplares_prestados',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_ejemplares_prestados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='multa',
+            name='codigo',
+            field=models.CharField(blank=True, editable=False, max_length=20, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='prestamo',
+            name='codigo',
+            field=models.CharField(blank=True, editable=False, max_length=20, unique=True),
+        ),
+    ]
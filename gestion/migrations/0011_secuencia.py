@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+def _ultimo_numero(modelo):
+    ultimo = 0
+    for codigo in modelo.objects.exclude(codigo__isnull=True).values_list('codigo', flat=True).iterator():
+        try:
+            ultimo = max(ultimo, int(codigo.split('-')[1]))
+        except (IndexError, ValueError):
+            continue
+    return ultimo
+
+
+def inicializar_secuencias(apps, schema_editor):
+    """Arranca las secuencias desde el mayor código existente"""
+    Secuencia = apps.get_model('gestion', 'Secuencia')
+    Prestamo = apps.get_model('gestion', 'Prestamo')
+    Multa = apps.get_model('gestion', 'Multa')
+    Secuencia.objects.create(nombre='prestamo', valor=_ultimo_numero(Prestamo))
+    Secuencia.objects.create(nombre='multa', valor=_ultimo_numero(Multa))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_libro_ejemplares_prestados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Secuencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=30, unique=True)),
+                ('valor', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Secuencias',
+            },
+        ),
+        migrations.RunPython(inicializar_secuencias, migrations.RunPython.noop),
+    ]
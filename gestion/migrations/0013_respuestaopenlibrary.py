@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_marcaejecucion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaOpenLibrary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('consulta', models.CharField(max_length=255)),
+                ('datos', models.JSONField()),
+                ('actualizado', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Respuestas de OpenLibrary',
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+# Índice FTS5 del catálogo (solo SQLite). Lo mantienen triggers, así también
+# se actualiza con bulk_create/update() que no disparan señales de Django.
+SQL_LIBRO = """
+    SELECT l.id, l.titulo, COALESCE(a.nombre || ' ' || a.apellido, ''),
+           COALESCE(e.nombre, ''), COALESCE(l.isbn, '')
+    FROM gestion_libro l
+    LEFT JOIN gestion_autor a ON a.id = l.autor_id
+    LEFT JOIN gestion_editorial e ON e.id = l.editorial_id
+"""
+
+CREAR = [
+    """CREATE VIRTUAL TABLE gestion_libro_fts USING fts5(
+        titulo, autor, editorial, isbn,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"INSERT INTO gestion_libro_fts(rowid, titulo, autor, editorial, isbn) {SQL_LIBRO}",
+    f"""CREATE TRIGGER gestion_libro_fts_ai AFTER INSERT ON gestion_libro BEGIN
+        INSERT INTO gestion_libro_fts(rowid, titulo, autor, editorial, isbn) {SQL_LIBRO} WHERE l.id = new.id;
+    END""",
+    f"""CREATE TRIGGER gestion_libro_fts_au AFTER UPDATE OF titulo, autor_id, editorial_id, isbn ON gestion_libro BEGIN
+        DELETE FROM gestion_libro_fts WHERE rowid = old.id;
+        INSERT INTO gestion_libro_fts(rowid, titulo, autor, editorial, isbn) {SQL_LIBRO} WHERE l.id = new.id;
+    END""",
+    """CREATE TRIGGER gestion_libro_fts_ad AFTER DELETE ON gestion_libro BEGIN
+        DELETE FROM gestion_libro_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER gestion_autor_fts_au AFTER UPDATE OF nombre, apellido ON gestion_autor BEGIN
+        DELETE FROM gestion_libro_fts WHERE rowid IN (SELECT id FROM gestion_libro WHERE autor_id = new.id);
+        INSERT INTO gestion_libro_fts(rowid, titulo, autor, editorial, isbn) {SQL_LIBRO} WHERE l.autor_id = new.id;
+    END""",
+    f"""CREATE TRIGGER gestion_editorial_fts_au AFTER UPDATE OF nombre ON gestion_editorial BEGIN
+        DELETE FROM gestion_libro_fts WHERE rowid IN (SELECT id FROM gestion_libro WHERE editorial_id = new.id);
+        INSERT INTO gestion_libro_fts(rowid, titulo, autor, editorial, isbn) {SQL_LIBRO} WHERE l.editorial_id = new.id;
+    END""",
+]
+
+ELIMINAR = [
+    "DROP TRIGGER IF EXISTS gestion_editorial_fts_au",
+    "DROP TRIGGER IF EXISTS gestion_autor_fts_au",
+    "DROP TRIGGER IF EXISTS gestion_libro_fts_ad",
+    "DROP TRIGGER IF EXISTS gestion_libro_fts_au",
+    "DROP TRIGGER IF EXISTS gestion_libro_fts_ai",
+    "DROP TABLE IF EXISTS gestion_libro_fts",
+]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return  # Sin FTS5 la búsqueda usa icontains
+        for sql in CREAR:
+            cursor.execute(sql)
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in ELIMINAR:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_respuestaopenlibrary'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_libro_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(fields=['prestamo', 'tipo'], name='multa_prestamo_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(condition=models.Q(('pagada', False)), fields=['prestamo'], name='multa_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_max'], name='prestamo_estado_fmax_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['libro', 'estado'], name='prestamo_libro_estado_idx'),
+        ),
+    ]
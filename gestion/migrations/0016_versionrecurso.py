@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_indices_prestamo_multa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionRecurso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recurso', models.CharField(max_length=30)),
+                ('objeto_id', models.BigIntegerField(default=0)),
+                ('valor', models.PositiveBigIntegerField(default=0)),
+                ('modificado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Versiones de recursos',
+                'constraints': [models.UniqueConstraint(fields=('recurso', 'objeto_id'), name='version_recurso_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def registrar_existentes(apps, schema_editor):
+    """Un cambio por cada objeto existente: leer desde el cursor 0 es una copia completa"""
+    Cambio = apps.get_model('gestion', 'Cambio')
+    qn = schema_editor.connection.ops.quote_name
+    ahora = schema_editor.connection.ops.adapt_datetimefield_value(django.utils.timezone.now())
+    for modelo, nombre in (('usuario', 'UsuarioBiblioteca'), ('libro', 'Libro'), ('prestamo', 'Prestamo'), ('multa', 'Multa')):
+        tabla = apps.get_model('gestion', nombre)._meta.db_table
+        schema_editor.execute(
+            f'INSERT INTO {qn(Cambio._meta.db_table)} (modelo, objeto_id, borrado, fecha) '
+            f'SELECT %s, id, %s, %s FROM {qn(tabla)} ORDER BY id',
+            [modelo, False, ahora],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_versionrecurso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('libro', 'Libro'), ('prestamo', 'Préstamo'), ('multa', 'Multa'), ('usuario', 'Usuario')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('borrado', models.BooleanField(default=False)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Cambios',
+                'indexes': [models.Index(fields=['modelo', 'objeto_id', 'id'], name='cambio_objeto_idx'), models.Index(fields=['borrado', 'fecha'], name='cambio_borrado_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_existentes, migrations.RunPython.noop),
+    ]
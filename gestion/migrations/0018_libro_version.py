@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:06
+
+from importlib import import_module
+
+import gestion.models
+from django.db import migrations, models
+
+fts = import_module('gestion.migrations.0014_libro_fts')
+# Triggers del índice FTS: SQLite reconstruye gestion_libro para agregar la
+# columna y el RENAME falla si hay triggers que la referencian
+TRIGGERS = [sql for sql in fts.CREAR if sql.lstrip().startswith('CREATE TRIGGER')]
+
+
+def _existe_fts(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'gestion_libro_fts'")
+    return cursor.fetchone() is not None
+
+
+def quitar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in fts.ELIMINAR:
+            if sql.startswith('DROP TRIGGER'):
+                cursor.execute(sql)
+
+
+def crear_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if _existe_fts(cursor):
+            for sql in TRIGGERS:
+                cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0017_cambio'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_triggers, crear_triggers),
+        migrations.AddField(
+            model_name='libro',
+            name='version',
+            field=models.PositiveBigIntegerField(default=gestion.models.version_inicial, editable=False),
+        ),
+        migrations.RunPython(crear_triggers, quitar_triggers),
+    ]
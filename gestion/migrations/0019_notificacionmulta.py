@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0018_libro_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionMulta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(default=django.utils.timezone.now)),
+                ('estado', models.CharField(choices=[('p', 'Pendiente'), ('e', 'Enviando'), ('v', 'Enviada'), ('f', 'Fallida'), ('d', 'Descartada')], default='p', max_length=1)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, editable=False, max_length=32)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('enviada', models.DateTimeField(blank=True, null=True)),
+                ('prestamo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to='gestion.prestamo')),
+            ],
+            options={
+                'verbose_name_plural': 'Notificaciones de multas',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='notificacion_cola_idx')],
+                'constraints': [models.UniqueConstraint(fields=('prestamo', 'fecha'), name='notificacion_prestamo_dia')],
+            },
+        ),
+    ]
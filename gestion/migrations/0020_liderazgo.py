@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0019_notificacionmulta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Liderazgo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('titular', models.CharField(blank=True, max_length=100)),
+                ('vence', models.DateTimeField(default=django.utils.timezone.now)),
+                ('desde', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Liderazgos',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0020_liderazgo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('p', 'Pendiente'), ('e', 'En curso'), ('c', 'Completada'), ('f', 'Fallida')], default='p', max_length=1)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, editable=False, max_length=32)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Tareas',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='tarea_cola_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,116 @@
-from django.db import models
+import time
+
+from django.db import models, transaction
+from django.db.models import Case, DateField, DecimalField, F, Func, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from decimal import Decimal
 # Create your models here.
 
+# Monto por día de retraso de las multas tipo 'r'
+TARIFA_RETRASO = Decimal('1.00')
+
+class Secuencia(models.Model):
+    """Contador persistente para los códigos BLB-/MLT-"""
+    nombre = models.CharField(max_length=30, unique=True)
+    valor = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Secuencias"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+class MarcaEjecucion(models.Model):
+    """Última fecha procesada por una tarea incremental"""
+    nombre = models.CharField(max_length=50, unique=True)
+    ultima_fecha = models.DateField()
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Marcas de ejecución"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultima_fecha}"
+
+class Liderazgo(models.Model):
+    """Concesión de un rol exclusivo entre procesos (ver gestion/liderazgo.py).
+
+    ``titular`` la renueva con cada latido; si deja de hacerlo, al pasar
+    ``vence`` otro proceso puede tomarla.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    titular = models.CharField(max_length=100, blank=True)
+    vence = models.DateTimeField(default=timezone.now)
+    desde = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Liderazgos"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.titular or '-'} hasta {self.vence:%H:%M:%S}"
+
+class RespuestaOpenLibrary(models.Model):
+    """Respuesta JSON de OpenLibrary guardada por consulta normalizada"""
+    clave = models.CharField(max_length=64, unique=True)
+    consulta = models.CharField(max_length=255)
+    datos = models.JSONField()
+    actualizado = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name_plural = "Respuestas de OpenLibrary"
+
+    def __str__(self):
+        return self.consulta
+
+class VersionRecurso(models.Model):
+    """Versión de un recurso de la API (catálogo, préstamos de un usuario...).
+
+    Se incrementa con un UPDATE cada vez que cambian sus datos; la API la usa
+    como ETag/Last-Modified sin consultar las tablas del recurso. La fila se
+    crea la primera vez que un cliente consulta el recurso.
+    """
+    recurso = models.CharField(max_length=30)
+    objeto_id = models.BigIntegerField(default=0)
+    valor = models.PositiveBigIntegerField(default=0)
+    modificado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Versiones de recursos"
+        constraints = [
+            models.UniqueConstraint(fields=['recurso', 'objeto_id'], name='version_recurso_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.recurso}:{self.objeto_id} v{self.valor}"
+
+class Cambio(models.Model):
+    """Entrada del registro de cambios para la sincronización incremental.
+
+    El id es el cursor de los clientes. El registro se compacta (solo queda el
+    último cambio de cada objeto), así que leerlo desde 0 equivale a una copia
+    completa de los datos.
+    """
+    MODELOS = [('libro', 'Libro'), ('prestamo', 'Préstamo'), ('multa', 'Multa'), ('usuario', 'Usuario')]
+
+    modelo = models.CharField(max_length=10, choices=MODELOS)
+    objeto_id = models.BigIntegerField()
+    borrado = models.BooleanField(default=False)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Cambios"
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id', 'id'], name='cambio_objeto_idx'),
+            models.Index(fields=['borrado', 'fecha'], name='cambio_borrado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.modelo}:{self.objeto_id}{' (borrado)' if self.borrado else ''}"
+
+
 class Editorial(models.Model):
     nombre = models.CharField(max_length=100)
     pais = models.CharField(max_length=50, blank=True, null=True)
@@ -26,6 +133,63 @@ class Autor(models.Model):
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
+# Estados de préstamo que ocupan un ejemplar (Prestado o Multado)
+ESTADOS_ACTIVOS = ('p', 'm')
+
+
+def version_inicial():
+    #Arranca en un valor tomado del reloj: un id reutilizado no coincide con tarjetas en caché
+    return time.time_ns() // 1000
+
+
+class LibroQuerySet(models.QuerySet):
+    def con_disponibilidad(self):
+        #Anota los ejemplares disponibles leyendo solo columnas del libro
+        return self.annotate(
+            cantidad_disponible=F('ejemplares') - F('ejemplares_prestados')
+        )
+
+    def disponibles(self):
+        return self.filter(ejemplares_prestados__lt=F('ejemplares'))
+
+    def catalogo(self, autor=None, editorial=None, disponible=None):
+        #Listado del catálogo con autor/editorial cargados y filtros opcionales
+        libros = self.select_related('autor', 'editorial').con_disponibilidad()
+        if autor:
+            libros = libros.filter(autor_id=autor)
+        if editorial:
+            libros = libros.filter(editorial_id=editorial)
+        if disponible == '1':
+            libros = libros.disponibles()
+        elif disponible == '0':
+            libros = libros.filter(ejemplares_prestados__gte=F('ejemplares'))
+        return libros
+
+    def reservar(self, cantidad=1):
+        """Presta ``cantidad`` ejemplares de cada libro que aún los tenga libres.
+
+        Es un único UPDATE condicional, por lo que la comprobación y el
+        incremento no pueden intercalarse con otra petición. En el mismo UPDATE
+        se marca el libro como no disponible al prestar los últimos ejemplares
+        (las expresiones usan los valores anteriores de la fila). Devuelve la
+        cantidad de libros actualizados.
+        """
+        reservados = self.filter(ejemplares_prestados__lte=F('ejemplares') - cantidad).update(
+            ejemplares_prestados=F('ejemplares_prestados') + cantidad,
+            version=F('version') + 1,
+            disponible=Case(
+                When(ejemplares_prestados__gte=F('ejemplares') - cantidad, then=Value(False)),
+                default=F('disponible'),
+            ),
+        )
+        if reservados:
+            from .cambios import registrar, LIBRO
+            from .versiones import tocar, CATALOGO
+            tocar(CATALOGO)
+            registrar(LIBRO, self)
+        return reservados
+
+
 class Libro(models.Model):
     titulo = models.CharField(max_length=20)
     autor = models.ForeignKey(Autor, related_name = "libros", on_delete=models.PROTECT)
@@ -36,21 +200,139 @@ class Libro(models.Model):
     costo = models.DecimalField(max_digits=6, decimal_places=2, default=20.00)
     ejemplares = models.PositiveIntegerField(default=1)
     disponible = models.BooleanField(default=True)
+    # Contador de préstamos activos, mantenido por Prestamo.save()
+    ejemplares_prestados = models.PositiveIntegerField(default=0, editable=False)
+    # Se incrementa con cada cambio del libro, su disponibilidad, autor o editorial;
+    # es parte de la clave de caché de su tarjeta en el catálogo (ver tarjetas.py)
+    version = models.PositiveBigIntegerField(default=version_inicial, editable=False)
+
+    objects = LibroQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "Libros"
 
     def __str__(self):
         return f"{self.titulo}"
+
+    def save(self, *args, **kwargs):
+        # El contador solo se modifica con UPDATE atómicos desde Prestamo;
+        # un save() normal no debe pisarlo con un valor en memoria desactualizado
+        if not self._state.adding:
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    f.name for f in self._meta.concrete_fields
+                    if not f.primary_key and f.name not in ('ejemplares_prestados', 'version')
+                ]
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+            self.version = F('version') + 1
+        super().save(*args, **kwargs)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=['version'])
     
     @property
     def ejemplares_disponibles(self):
-        #Calcula ejemplares disponibles basándose en préstamos activos
-        prestamos_activos = self.prestamos.filter(
-            estado__in=['p', 'm']  # Prestado o Multado
-        ).count()
-        return self.ejemplares - prestamos_activos
+        #Ejemplares disponibles según el contador de préstamos activos
+        return self.ejemplares - self.ejemplares_prestados
+
+    @classmethod
+    def ajustar_prestados(cls, libro_id, delta):
+        #Incrementa o decrementa el contador de forma atómica en la base de datos
+        libros = cls.objects.filter(pk=libro_id)
+        if delta < 0:
+            libros = libros.filter(ejemplares_prestados__gte=-delta)
+        actualizados = libros.update(ejemplares_prestados=F('ejemplares_prestados') + delta, version=F('version') + 1)
+        if actualizados:
+            from .cambios import registrar, LIBRO
+            from .versiones import tocar, CATALOGO
+            tocar(CATALOGO)
+            registrar(LIBRO, [libro_id])
+        return actualizados
+
+    @classmethod
+    def reservar_ejemplar(cls, libro_id):
+        """Presta un ejemplar solo si queda alguno libre; devuelve False si no"""
+        return bool(cls.objects.filter(pk=libro_id).reservar(1))
     
+class DiasEntre(Func):
+    """Días enteros entre dos fechas (``fin - inicio``) calculados en la base de datos"""
+    arity = 2
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)',
+                           arg_joiner=', ', **extra_context)
+
+
+def _dias_retraso(fecha_max, fecha_devolucion, fecha):
+    #Días desde fecha_max hasta la devolución (o `fecha` si no se devolvió), nunca negativos
+    fin = Value(fecha, output_field=DateField())
+    if fecha_devolucion is not None:
+        fin = Coalesce(fecha_devolucion, fin)
+    return Coalesce(Greatest(DiasEntre(fin, fecha_max), Value(0)), Value(0))
+
+
+def _monto_vigente(fecha):
+    #Monto de una multa a `fecha` (ver Multa.monto_vigente); rutas relativas a Multa
+    return Case(
+        When(
+            tipo='r', prestamo__estado__in=ESTADOS_ACTIVOS, prestamo__fecha_max__isnull=False,
+            then=Greatest(
+                F('monto'),
+                _dias_retraso(F('prestamo__fecha_max'), None, fecha) * Value(TARIFA_RETRASO),
+            ),
+        ),
+        default=F('monto'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+class PrestamoQuerySet(models.QuerySet):
+    def con_dias_retraso(self, fecha=None):
+        #Anota solo `dias_retraso` (ver con_retraso)
+        fecha = fecha or timezone.now().date()
+        return self.annotate(dias_retraso=_dias_retraso(F('fecha_max'), F('fecha_devolucion'), fecha))
+
+    def con_retraso(self, fecha=None):
+        """Anota ``dias_retraso``, ``multa_proyectada``, ``total_multas`` y ``multas_retraso`` en SQL.
+
+        ``multa_proyectada`` es la multa por retraso que corresponde hoy a un
+        préstamo activo; ``total_multas`` suma los montos vigentes de las multas
+        registradas y ``multas_retraso`` solo los de las multas por retraso.
+        """
+        fecha = fecha or timezone.now().date()
+        decimal = DecimalField(max_digits=10, decimal_places=2)
+
+        def suma(multas):
+            total = multas.filter(prestamo=OuterRef('pk')).order_by().values('prestamo').annotate(
+                total=Sum(_monto_vigente(fecha))
+            ).values('total')
+            return Coalesce(Subquery(total, output_field=decimal), Value(Decimal('0.00')), output_field=decimal)
+
+        return self.con_dias_retraso(fecha).annotate(
+            multa_proyectada=Case(
+                When(estado__in=ESTADOS_ACTIVOS, then=F('dias_retraso') * Value(TARIFA_RETRASO)),
+                default=Value(Decimal('0.00')),
+                output_field=decimal,
+            ),
+            total_multas=suma(Multa.objects.all()),
+            multas_retraso=suma(Multa.objects.filter(tipo='r')),
+        )
+
+    def vencidos(self, fecha=None):
+        #Préstamos activos con la fecha máxima superada
+        fecha = fecha or timezone.now().date()
+        return self.filter(estado__in=ESTADOS_ACTIVOS, fecha_max__lt=fecha)
+
+
 class Prestamo(models.Model):
     ESTADOS = [
         ('b', 'Borrador'),
@@ -81,13 +363,47 @@ class Prestamo(models.Model):
             ("gestionar_prestamos", "Puede gestionar_prestamos"),
         )
         verbose_name_plural = "Préstamos"
+        indexes = [
+            # Préstamos vencidos: estado='p' (o IN activos) AND fecha_max < hoy. Con IN activos
+            # SQLite recorre un rango de fecha_max por estado; un índice parcial sobre los
+            # activos no serviría: SQLite no lo usa si el IN llega con parámetros, como lo envía el ORM
+            models.Index(fields=['estado', 'fecha_max'], name='prestamo_estado_fmax_idx'),
+            # Préstamos activos de un libro (contador de disponibilidad)
+            models.Index(fields=['libro', 'estado'], name='prestamo_libro_estado_idx'),
+        ]
     
     def __str__(self):
         usuario_nombre = self.usuario_biblioteca.nombre if self.usuario_biblioteca else "Sin usuario"
         return f"{self.codigo} - {self.libro.titulo} - {usuario_nombre}"
+
+    objects = PrestamoQuerySet.as_manager()
+
+    # Estado y libro tal como están guardados en la base de datos
+    _guardado = (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._guardado = (instance.__dict__.get('estado'), instance.__dict__.get('libro_id'))
+        return instance
+
+    def _sincronizar_contador(self):
+        #Refleja en Libro.ejemplares_prestados la entrada/salida de estados activos
+        estado_previo, libro_previo = self._guardado
+        activo_antes = estado_previo in ESTADOS_ACTIVOS
+        activo_ahora = self.estado in ESTADOS_ACTIVOS
+        if activo_antes and activo_ahora and libro_previo == self.libro_id:
+            return
+        if activo_antes:
+            Libro.ajustar_prestados(libro_previo, -1)
+        if activo_ahora:
+            Libro.ajustar_prestados(self.libro_id, 1)
     
     @property
     def dias_retraso(self):
+        # Valor calculado en SQL por PrestamoQuerySet.con_retraso(), si está
+        if '_dias_retraso' in self.__dict__:
+            return self.__dict__['_dias_retraso']
         hoy= timezone.now().date()
         fecha_ref = self.fecha_devolucion or hoy
         if fecha_ref > self.fecha_max:
@@ -95,6 +411,10 @@ class Prestamo(models.Model):
         else:
             return 0
     
+    @dias_retraso.setter
+    def dias_retraso(self, valor):
+        self.__dict__['_dias_retraso'] = valor
+    
     @property
     def multa_retraso(self):
         tarifa =0.50
@@ -103,23 +423,20 @@ class Prestamo(models.Model):
     def save(self, *args, **kwargs):
         #Genera código secuencial al crear el préstamo
         if not self.pk and not self.codigo:  # Solo al crear
-            # Obtener el último código
-            ultimo_prestamo = Prestamo.objects.order_by('-id').first()
-            
-            if ultimo_prestamo and ultimo_prestamo.codigo:
-                # Extraer el número del último código (BLB-001 -> 1)
-                try:
-                    ultimo_num = int(ultimo_prestamo.codigo.split('-')[1])
-                    nuevo_num = ultimo_num + 1
-                except (IndexError, ValueError):
-                    nuevo_num = 1
-            else:
-                nuevo_num = 1
-            
-            # Generar nuevo código con formato BLB-XXX
-            self.codigo = f"BLB-{nuevo_num:03d}"
+            from .secuencias import siguiente_codigo
+            self.codigo = siguiente_codigo('prestamo', 'BLB')
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._sincronizar_contador()
+        self._guardado = (self.estado, self.libro_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            if self._guardado[0] in ESTADOS_ACTIVOS:
+                Libro.ajustar_prestados(self._guardado[1], -1)
+        return resultado
     
     def generar_prestamo(self):
         """Activa el préstamo después de validaciones"""
@@ -135,26 +452,45 @@ class Prestamo(models.Model):
         if not self.usuario_biblioteca:
             raise ValidationError('Debe asignar un usuario de biblioteca antes de generar el préstamo')
         
-        # Validación 2: Verificar que haya ejemplares disponibles
+        # Validación 2: Verificar que haya ejemplares disponibles.
+        # Lectura previa sin bloqueo: si ya no quedan ejemplares se rechaza sin escribir.
+        # La comprobación definitiva es el UPDATE condicional de más abajo.
+        self.libro.refresh_from_db(fields=['ejemplares', 'ejemplares_prestados'])
         if self.libro.ejemplares_disponibles <= 0:
             raise ValidationError(
                 f'No hay ejemplares disponibles de "{self.libro.titulo}". '
                 f'Todos están prestados.'
             )
         
-        # Calcular fecha máxima (2 días desde hoy)
-        if not self.fecha_max:
-            self.fecha_max = timezone.now().date() + timedelta(days=2)
+        if not self.pk:
+            self.save()
         
-        # Cambiar estado a Prestado
-        self.estado = 'p'  # ← ASEGÚRATE QUE ESTÉ AQUÍ
+        # Calcular fecha máxima (2 días desde hoy)
+        fecha_max = self.fecha_max or timezone.now().date() + timedelta(days=2)
         
-        # Actualizar disponibilidad del libro si es el último ejemplar
-        if self.libro.ejemplares_disponibles == 1:
-            self.libro.disponible = False
-            self.libro.save()
+        # Dos UPDATE condicionales en la misma transacción: el primero solo pasa
+        # si el préstamo sigue en Borrador y el segundo solo si queda un ejemplar.
+        # La base de datos bloquea cada fila, así que dos peticiones simultáneas
+        # no pueden prestar el mismo ejemplar ni activar dos veces el préstamo.
+        with transaction.atomic():
+            activado = Prestamo.objects.filter(pk=self.pk, estado='b').update(estado='p', fecha_max=fecha_max)
+            if not activado:
+                raise ValidationError('Este préstamo ya fue generado por otra operación')
+            from .cambios import registrar, PRESTAMO
+            from .versiones import tocar, USUARIO
+            tocar(USUARIO, [self.usuario_biblioteca_id])
+            registrar(PRESTAMO, [self.pk])
+            
+            if not Libro.reservar_ejemplar(self.libro_id):
+                raise ValidationError(
+                    f'No hay ejemplares disponibles de "{self.libro.titulo}". '
+                    f'Todos están prestados.'
+                )
         
-        self.save()  # ← ESTA LÍNEA ES CRÍTICA
+        # El contador ya se incrementó; save() no debe volver a hacerlo
+        self.estado = 'p'
+        self.fecha_max = fecha_max
+        self._guardado = (self.estado, self.libro_id)
         return True
     
     def devolver_libro(self):
@@ -165,6 +501,10 @@ class Prestamo(models.Model):
         if self.estado not in ['p', 'm']:
             raise ValidationError('Solo se pueden devolver préstamos en estado Prestado o Multado')
         
+        with transaction.atomic():
+            return self._procesar_devolucion()
+
+    def _procesar_devolucion(self):
         fecha_actual = timezone.now().date()
         self.fecha_devolucion = fecha_actual
         
@@ -223,18 +563,25 @@ class Prestamo(models.Model):
         
         # Restaurar disponibilidad del libro
         self.libro.disponible = True
-        self.libro.save()
+        self.libro.save(update_fields=['disponible'])
         
         self.save()
         
         # Calcular total de multas
-        total_multas = sum(float(m.monto) for m in self.multas.all())
+        total_multas = sum((m.monto_vigente for m in self.multas.all()), Decimal('0.00'))
         
         if total_multas > 0:
             return f'Libro devuelto. Total multas: ${total_multas:.2f}'
         else:
             return 'Libro devuelto sin multas'
     
+class MultaQuerySet(models.QuerySet):
+    def con_monto_vigente(self, fecha=None):
+        #Anota `monto_actual`: igual que Multa.monto_vigente pero calculado en SQL
+        fecha = fecha or timezone.now().date()
+        return self.annotate(monto_actual=_monto_vigente(fecha))
+
+
 class Multa(models.Model):
     TIPOS = [
         ('r', 'Retraso'),
@@ -249,33 +596,39 @@ class Multa(models.Model):
     pagada = models.BooleanField(default=False)
     fecha = models.DateField(default=timezone.now)
 
+    objects = MultaQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Multas"
+        indexes = [
+            # Multa de retraso/daño de un préstamo: (prestamo, tipo)
+            models.Index(fields=['prestamo', 'tipo'], name='multa_prestamo_tipo_idx'),
+            # Solo multas pendientes de pago
+            models.Index(fields=['prestamo'], condition=Q(pagada=False), name='multa_pendiente_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """Genera código secuencial al crear la multa"""
         if not self.pk and not self.codigo:  # Solo al crear
-            # Obtener el último código
-            ultima_multa = Multa.objects.order_by('-id').first()
-            
-            if ultima_multa and ultima_multa.codigo:
-                # Extraer el número del último código (MLT-001 -> 1)
-                try:
-                    ultimo_num = int(ultima_multa.codigo.split('-')[1])
-                    nuevo_num = ultimo_num + 1
-                except (IndexError, ValueError):
-                    nuevo_num = 1
-            else:
-                nuevo_num = 1
-            
-            # Generar nuevo código con formato MLT-XXX
-            self.codigo = f"MLT-{nuevo_num:03d}"
+            from .secuencias import siguiente_codigo
+            self.codigo = siguiente_codigo('multa', 'MLT')
         
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.codigo} - Multa {self.get_tipo_display()} - ${self.monto}"
 
+    @property
+    def monto_vigente(self):
+        #La multa por retraso de un préstamo sin devolver se calcula desde fecha_max al leerla
+        if 'monto_actual' in self.__dict__:
+            # SQLite devuelve las expresiones decimales sin escala fija
+            return Decimal(self.monto_actual).quantize(Decimal('0.01'))
+        prestamo = self.prestamo
+        if self.tipo == 'r' and prestamo.estado in ESTADOS_ACTIVOS and prestamo.fecha_max:
+            return max(self.monto, prestamo.dias_retraso * TARIFA_RETRASO)
+        return self.monto
+
     # ==================== VALIDADOR DE CÉDULA ====================
 def validar_cedula_ecuatoriana(cedula):
     cedula = str(cedula).strip()
@@ -313,4 +666,82 @@ class UsuarioBiblioteca(models.Model):
     activo = models.BooleanField(default=True)
     
     def __str__(self):
-        return f"{self.nombre} ({self.cedula})"
\ No newline at end of file
+        return f"{self.nombre} ({self.cedula})"
+
+# ==================== NOTIFICACIONES DE MULTAS ====================
+class NotificacionMulta(models.Model):
+    """Aviso de multa pendiente en cola de envío (ver gestion/notificaciones.py).
+
+    Como máximo una por préstamo y día. Un worker la reclama (estado Enviando
+    con ``proximo_intento`` como plazo) y la envía por una conexión compartida.
+    """
+    ESTADOS = [
+        ('p', 'Pendiente'),
+        ('e', 'Enviando'),
+        ('v', 'Enviada'),
+        ('f', 'Fallida'),
+        ('d', 'Descartada'),
+    ]
+
+    prestamo = models.ForeignKey(Prestamo, related_name="notificaciones", on_delete=models.CASCADE)
+    fecha = models.DateField(default=timezone.now)
+    estado = models.CharField(max_length=1, choices=ESTADOS, default='p')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True, editable=False)
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+    enviada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Notificaciones de multas"
+        constraints = [
+            models.UniqueConstraint(fields=['prestamo', 'fecha'], name='notificacion_prestamo_dia'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='notificacion_cola_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notificación {self.prestamo_id} {self.fecha} ({self.get_estado_display()})"
+
+# ==================== COLA DE TAREAS ====================
+class Tarea(models.Model):
+    """Operación lenta encolada para los workers (ver gestion/tareas.py).
+
+    La vista solo inserta la fila; un worker la reclama (estado En curso con
+    ``proximo_intento`` como plazo), la ejecuta y guarda el resultado.
+    """
+    ESTADOS = [
+        ('p', 'Pendiente'),
+        ('e', 'En curso'),
+        ('c', 'Completada'),
+        ('f', 'Fallida'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=1, choices=ESTADOS, default='p')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True, editable=False)
+    resultado = models.JSONField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="tareas", null=True, blank=True,
+                                on_delete=models.SET_NULL)
+    creada = models.DateTimeField(default=timezone.now)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Tareas"
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='tarea_cola_idx'),
+        ]
+
+    @property
+    def terminal(self):
+        return self.estado in ('c', 'f')
+
+    def __str__(self):
+        return f"Tarea #{self.id} {self.tipo} ({self.get_estado_display()})"
@@ -0,0 +1,117 @@
+"""Cálculo masivo de multas por retraso.
+
+Procesa los préstamos vencidos por bloques de ids: los días de retraso se
+calculan en SQL, las multas se crean/actualizan con ``bulk_create`` y
+``bulk_update`` y los préstamos pasan a Multado con un único UPDATE por bloque.
+"""
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .cambios import MULTA, PRESTAMO, registrar
+from .models import MarcaEjecucion, Multa, Prestamo, TARIFA_RETRASO
+from .secuencias import reservar_codigos
+from .versiones import tocar_usuarios_de_prestamos
+
+MARCA_VENCIDOS = 'verificar_prestamos_vencidos'
+
+
+@dataclass
+class ResultadoVencidos:
+    creadas: int = 0
+    actualizadas: int = 0
+    revisados: int = 0
+    mensajes: list = field(default_factory=list)
+
+    def sumar(self, otro):
+        self.creadas += otro.creadas
+        self.actualizadas += otro.actualizadas
+        self.revisados += otro.revisados
+        self.mensajes.extend(otro.mensajes)
+
+
+def prestamos_vencidos(fecha_actual, fecha_desde=None):
+    #Préstamos Prestados con fecha máxima superada y su retraso calculado en SQL
+    vencidos = Prestamo.objects.filter(
+        estado='p',
+        fecha_max__lt=fecha_actual,
+    )
+    if fecha_desde is not None:
+        # Solo los que vencieron desde la última ejecución
+        vencidos = vencidos.filter(fecha_max__gte=fecha_desde)
+    return vencidos.con_dias_retraso(fecha_actual)
+
+
+def _procesar_bloque(filas, fecha_actual):
+    resultado = ResultadoVencidos(revisados=len(filas))
+    ids = [prestamo_id for prestamo_id, _ in filas]
+
+    existentes = {}
+    for multa in Multa.objects.filter(prestamo_id__in=ids, tipo='r').order_by('id'):
+        existentes.setdefault(multa.prestamo_id, multa)
+
+    actualizar = []
+    nuevas = []
+    for prestamo_id, dias in filas:
+        monto = dias * TARIFA_RETRASO
+        multa = existentes.get(prestamo_id)
+        if multa:
+            multa.monto = monto
+            actualizar.append(multa)
+            resultado.mensajes.append(('WARNING', f'Multa actualizada: Préstamo #{prestamo_id} - ${monto}'))
+        else:
+            nuevas.append(Multa(prestamo_id=prestamo_id, tipo='r', monto=monto, fecha=fecha_actual))
+            resultado.mensajes.append(('SUCCESS', f'Nueva multa creada: Préstamo #{prestamo_id} - ${monto}'))
+
+    with transaction.atomic():
+        if actualizar:
+            Multa.objects.bulk_update(actualizar, ['monto'])
+        if nuevas:
+            # bulk_create no pasa por Multa.save(), los códigos se reservan aquí
+            for multa, codigo in zip(nuevas, reservar_codigos('multa', 'MLT', len(nuevas))):
+                multa.codigo = codigo
+            Multa.objects.bulk_create(nuevas)
+            Prestamo.objects.filter(id__in=[m.prestamo_id for m in nuevas]).update(estado='m')
+        if actualizar or nuevas:
+            tocar_usuarios_de_prestamos(ids)
+            registrar(MULTA, [m.pk for m in actualizar])
+        if nuevas:
+            registrar(MULTA, Multa.objects.filter(codigo__in=[m.codigo for m in nuevas]))
+            registrar(PRESTAMO, [m.prestamo_id for m in nuevas])
+
+    resultado.actualizadas = len(actualizar)
+    resultado.creadas = len(nuevas)
+    return resultado
+
+
+def procesar_vencidos(fecha_actual, desde_id=None, hasta_id=None, chunk_size=1000, fecha_desde=None):
+    """Genera o actualiza las multas por retraso de los préstamos vencidos.
+
+    Recorre los préstamos con paginación por id (``desde_id`` <= id <= ``hasta_id``)
+    en bloques de ``chunk_size`` y devuelve un ``ResultadoVencidos``. Con
+    ``fecha_desde`` solo se consideran los préstamos con ``fecha_max`` posterior.
+    """
+    resultado = ResultadoVencidos()
+    vencidos = prestamos_vencidos(fecha_actual, fecha_desde).order_by('id')
+    if hasta_id is not None:
+        vencidos = vencidos.filter(id__lte=hasta_id)
+    ultimo_id = desde_id - 1 if desde_id is not None else None
+
+    while True:
+        bloque = vencidos if ultimo_id is None else vencidos.filter(id__gt=ultimo_id)
+        filas = list(bloque.values_list('id', 'dias_retraso')[:chunk_size])
+        if not filas:
+            break
+        resultado.sumar(_procesar_bloque(filas, fecha_actual))
+        ultimo_id = filas[-1][0]
+
+    return resultado
+
+
+def ultima_ejecucion(nombre=MARCA_VENCIDOS):
+    #Fecha de la última ejecución completada o None si nunca se ejecutó
+    return MarcaEjecucion.objects.filter(nombre=nombre).values_list('ultima_fecha', flat=True).first()
+
+
+def registrar_ejecucion(fecha, nombre=MARCA_VENCIDOS):
+    MarcaEjecucion.objects.update_or_create(nombre=nombre, defaults={'ultima_fecha': fecha})
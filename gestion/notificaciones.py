@@ -0,0 +1,277 @@
+"""Cola de notificaciones de multas por correo.
+
+Las vistas solo encolan (``encolar``/``encolar_multados``): una fila de
+``NotificacionMulta`` por préstamo y día, así que pedir dos veces el mismo aviso
+no envía dos correos. ``procesar_pendientes`` reclama un lote con un UPDATE
+condicional (dos workers no envían la misma fila), arma los mensajes con dos
+consultas y los envía por una sola conexión del backend de correo. Los fallos se
+reintentan con espera exponencial hasta ``MAX_INTENTOS``.
+
+``enviar_resumenes`` es el envío programado: un solo correo por usuario con
+todas sus multas pendientes, leídas con una única consulta ordenada por usuario.
+"""
+import uuid
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Prefetch
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+
+from .models import MarcaEjecucion, Multa, NotificacionMulta, Prestamo
+
+CONFIGURACION = {
+    # Notificaciones reclamadas y enviadas por conexión
+    'LOTE': 100,
+    'MAX_INTENTOS': 5,
+    # Espera antes del primer reintento (se duplica en cada fallo), en segundos
+    'ESPERA_REINTENTO': 60,
+    # Plazo para enviar un lote reclamado; después otro worker puede retomarlo
+    'PLAZO_ENVIO': 300,
+}
+
+MARCA_RESUMEN = 'resumen_multas'
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_NOTIFICACIONES', {})}
+
+
+def _notificables():
+    #Préstamos con alguna multa sin pagar y usuario con email
+    return Prestamo.objects.filter(
+        multas__pagada=False, usuario_biblioteca__isnull=False,
+    ).exclude(usuario_biblioteca__email='').distinct()
+
+
+def encolar(prestamo_ids, fecha=None):
+    """Encola un aviso por cada préstamo notificable; devuelve cuántos son nuevos hoy"""
+    fecha = fecha or timezone.now().date()
+    ids = set(_notificables().filter(pk__in=prestamo_ids).values_list('pk', flat=True))
+    return _insertar(ids, fecha)
+
+
+def encolar_multados(fecha=None):
+    """Encola un aviso para cada préstamo con multas pendientes"""
+    fecha = fecha or timezone.now().date()
+    return _insertar(set(_notificables().values_list('pk', flat=True)), fecha)
+
+
+def _insertar(ids, fecha):
+    if not ids:
+        return 0
+    existentes = set(
+        NotificacionMulta.objects.filter(prestamo_id__in=ids, fecha=fecha).values_list('prestamo_id', flat=True)
+    )
+    # ignore_conflicts: otra petición pudo encolar el mismo préstamo entre medio
+    NotificacionMulta.objects.bulk_create(
+        [NotificacionMulta(prestamo_id=i, fecha=fecha) for i in sorted(ids - existentes)],
+        ignore_conflicts=True,
+        batch_size=500,
+    )
+    return len(ids - existentes)
+
+
+@dataclass
+class ResultadoEnvio:
+    enviadas: int = 0
+    reintentos: int = 0
+    fallidas: int = 0
+    descartadas: int = 0
+    errores: list = field(default_factory=list)
+
+    @property
+    def procesadas(self):
+        return self.enviadas + self.reintentos + self.fallidas + self.descartadas
+
+
+def reclamar(lote=None, ahora=None):
+    """Marca como Enviando hasta ``lote`` notificaciones listas y las devuelve.
+
+    También retoma las que quedaron en Enviando con el plazo vencido (un
+    worker que se detuvo a mitad de un lote).
+    """
+    opciones = configuracion()
+    ahora = ahora or timezone.now()
+    listas = NotificacionMulta.objects.filter(estado__in=('p', 'e'), proximo_intento__lte=ahora)
+    ids = list(listas.order_by('proximo_intento', 'id').values_list('id', flat=True)[:lote or opciones['LOTE']])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    listas.filter(pk__in=ids).update(
+        estado='e', lote=token, proximo_intento=ahora + timedelta(seconds=opciones['PLAZO_ENVIO'])
+    )
+    return list(
+        NotificacionMulta.objects.filter(lote=token, estado='e')
+        .select_related('prestamo__usuario_biblioteca', 'prestamo__libro__autor')
+        .prefetch_related(Prefetch('prestamo__multas', queryset=Multa.objects.con_monto_vigente().order_by('id')))
+    )
+
+
+def mensaje(prestamo, conexion=None):
+    """Correo de multa pendiente de ``prestamo`` (texto y HTML)"""
+    multas = list(prestamo.multas.all())
+    contexto = {
+        'prestamo': prestamo,
+        'total_multas': sum(m.monto_vigente for m in multas),
+        'usuario': prestamo.usuario_biblioteca,
+        'libro': prestamo.libro,
+    }
+    correo = EmailMultiAlternatives(
+        subject=f'Multa pendiente - Préstamo #{prestamo.id}',
+        body=render_to_string('email_multa.txt', contexto),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[prestamo.usuario_biblioteca.email],
+        connection=conexion,
+    )
+    correo.attach_alternative(render_to_string('email_multa.html', contexto), 'text/html')
+    return correo
+
+
+def procesar_pendientes(lote=None, ahora=None):
+    """Reclama un lote de notificaciones y las envía por una sola conexión"""
+    opciones = configuracion()
+    ahora = ahora or timezone.now()
+    resultado = ResultadoEnvio()
+    notificaciones = reclamar(lote, ahora)
+    if not notificaciones:
+        return resultado
+
+    conexion = get_connection()
+    conexion.open()
+    try:
+        for notificacion in notificaciones:
+            prestamo = notificacion.prestamo
+            if not any(not m.pagada for m in prestamo.multas.all()):
+                # Se pagó entre el encolado y el envío
+                notificacion.estado = 'd'
+                resultado.descartadas += 1
+                continue
+            notificacion.intentos += 1
+            try:
+                mensaje(prestamo, conexion).send()
+            except Exception as e:
+                resultado.errores.append(f'Préstamo #{prestamo.id}: {e}')
+                notificacion.ultimo_error = str(e)
+                if notificacion.intentos >= opciones['MAX_INTENTOS']:
+                    notificacion.estado = 'f'
+                    resultado.fallidas += 1
+                else:
+                    espera = opciones['ESPERA_REINTENTO'] * 2 ** (notificacion.intentos - 1)
+                    notificacion.estado = 'p'
+                    notificacion.proximo_intento = ahora + timedelta(seconds=espera)
+                    resultado.reintentos += 1
+                # La conexión pudo quedar en mal estado (p. ej. el servidor SMTP la cerró)
+                conexion.close()
+                conexion.open()
+            else:
+                notificacion.estado = 'v'
+                notificacion.enviada = timezone.now()
+                notificacion.ultimo_error = ''
+                resultado.enviadas += 1
+    finally:
+        conexion.close()
+        NotificacionMulta.objects.bulk_update(
+            notificaciones, ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'enviada']
+        )
+    return resultado
+
+
+
+@dataclass
+class Resumen:
+    usuario_id: int
+    nombre: str
+    email: str
+    multas: list = field(default_factory=list)
+    total: Decimal = Decimal('0.00')
+
+
+def resumenes(fecha=None):
+    """Genera un ``Resumen`` por usuario con multas pendientes y email.
+
+    Es una sola consulta (montos vigentes calculados en SQL) recorrida con
+    ``iterator()`` y agrupada en Python, así que la memoria no crece con la
+    cantidad de usuarios.
+    """
+    fecha = fecha or timezone.now().date()
+    tipos = dict(Multa.TIPOS)
+    filas = (
+        # Como en _notificables: préstamos con usuario y email (el email puede ser NULL)
+        Multa.objects.filter(pagada=False, prestamo__usuario_biblioteca__isnull=False)
+        .exclude(prestamo__usuario_biblioteca__email__isnull=True)
+        .exclude(prestamo__usuario_biblioteca__email='')
+        .con_monto_vigente(fecha)
+        .order_by('prestamo__usuario_biblioteca_id', 'prestamo_id', 'id')
+        .values_list(
+            'prestamo__usuario_biblioteca_id', 'prestamo__usuario_biblioteca__nombre',
+            'prestamo__usuario_biblioteca__email', 'prestamo__codigo', 'prestamo__libro__titulo',
+            'prestamo__fecha_max', 'tipo', 'monto_actual',
+        )
+        .iterator(chunk_size=2000)
+    )
+    for usuario_id, grupo in groupby(filas, key=lambda fila: fila[0]):
+        resumen = None
+        for _, nombre, email, codigo, titulo, fecha_max, tipo, monto in grupo:
+            if resumen is None:
+                resumen = Resumen(usuario_id, nombre, email)
+            monto = Decimal(monto).quantize(Decimal('0.01'))
+            resumen.multas.append({
+                'prestamo': codigo, 'libro': titulo, 'fecha_max': fecha_max, 'tipo': tipos[tipo], 'monto': monto,
+            })
+            resumen.total += monto
+        yield resumen
+
+
+def _enviar(conexion, correo, resultado):
+    #De a uno: si send_messages falla a mitad de un lote, los ya entregados no se
+    #distinguen de los pendientes y reenviar el lote duplicaría correos
+    try:
+        resultado.enviadas += conexion.send_messages([correo]) or 0
+    except Exception as e:
+        resultado.fallidas += 1
+        resultado.errores.append(f'{correo.to[0]}: {e}')
+        # La conexión pudo quedar en mal estado (p. ej. el servidor SMTP la cerró)
+        conexion.close()
+        conexion.open()
+
+
+def enviar_resumenes(fecha=None, forzar=False):
+    """Envía el resumen diario de multas pendientes a cada usuario.
+
+    Las plantillas se compilan una vez y los correos se envían de a uno sobre
+    la misma conexión, a medida que se arman. Se registra la fecha en
+    ``MarcaEjecucion``: una segunda ejecución el mismo día no envía nada salvo
+    con ``forzar``. Devuelve ``None`` si se omitió.
+    """
+    fecha = fecha or timezone.now().date()
+    ultima = MarcaEjecucion.objects.filter(nombre=MARCA_RESUMEN).values_list('ultima_fecha', flat=True).first()
+    if ultima == fecha and not forzar:
+        return None
+
+    texto = get_template('email_resumen_multas.txt')
+    html = get_template('email_resumen_multas.html')
+    resultado = ResultadoEnvio()
+    conexion = get_connection()
+    conexion.open()
+    try:
+        for resumen in resumenes(fecha):
+            contexto = {'nombre': resumen.nombre, 'multas': resumen.multas, 'total': resumen.total, 'fecha': fecha}
+            correo = EmailMultiAlternatives(
+                subject=f'Resumen de multas pendientes: ${resumen.total}',
+                body=texto.render(contexto),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[resumen.email],
+                connection=conexion,
+            )
+            correo.attach_alternative(html.render(contexto), 'text/html')
+            _enviar(conexion, correo, resultado)
+    finally:
+        conexion.close()
+
+    MarcaEjecucion.objects.update_or_create(nombre=MARCA_RESUMEN, defaults={'ultima_fecha': fecha})
+    return resultado
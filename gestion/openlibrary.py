@@ -0,0 +1,258 @@
+"""Cliente de OpenLibrary con caché en dos niveles.
+
+1. LRU en memoria del proceso (respuestas en microsegundos).
+2. Tabla ``RespuestaOpenLibrary`` compartida entre procesos y reinicios.
+
+Las entradas vencen según ``TTL``; si OpenLibrary no responde se devuelve la
+última respuesta guardada aunque esté vencida. El transporte HTTP es un
+callable ``transporte(url, params, timeout) -> dict`` para poder probarlo
+contra un servidor local.
+
+Las vistas async usan ``abuscar``: la consulta (que puede bloquear hasta
+``TIMEOUT`` en ``requests``) corre en un pool acotado de ``HILOS_ASYNC`` hilos,
+así un OpenLibrary lento no ocupa el bucle de eventos ni los hilos del resto
+del sitio.
+"""
+import asyncio
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import RespuestaOpenLibrary
+
+CONFIGURACION = {
+    'URL_BASE': 'https://openlibrary.org',
+    'TIMEOUT': 10,
+    'TTL': 24 * 60 * 60,
+    'MAX_MEMORIA': 256,
+    'MAX_PERSISTENTE': 10000,
+    # Respuestas nuevas guardadas entre dos desalojos de la tabla (puede pasarse
+    # de MAX_PERSISTENTE hasta en esa cantidad por proceso)
+    'DESALOJO_CADA': 100,
+    # ISBNs por resultado que se precargan tras una búsqueda
+    'ISBN_POR_RESULTADO': 5,
+    # Hilos para las consultas de las vistas async (las demás esperan en cola)
+    'HILOS_ASYNC': 32,
+    # Segundos que una vista async espera la respuesta antes de desistir
+    'ESPERA_ASYNC': 8,
+}
+
+
+def configuracion(**opciones):
+    #Valores por defecto combinados con settings.GESTION_OPENLIBRARY
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_OPENLIBRARY', {}), **opciones}
+
+
+class ErrorOpenLibrary(Exception):
+    pass
+
+
+def transporte_requests(url, params, timeout):
+    response = requests.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def normalizar(texto):
+    return ' '.join(str(texto).lower().split())
+
+
+class CacheOpenLibrary:
+    def __init__(self, transporte=None, **opciones):
+        self.config = configuracion(**opciones)
+        self.transporte = transporte or transporte_requests
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'aciertos_memoria': 0, 'aciertos_bd': 0, 'fallos': 0, 'obsoletas': 0}
+        self._nuevas_bd = 0
+
+    def _contar(self, estadistica):
+        #El cliente se comparte entre los hilos del pool async
+        with self._lock:
+            self.stats[estadistica] += 1
+
+    # ---- nivel 1: memoria ----
+    def _leer_memoria(self, clave):
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+            return entrada
+
+    def _guardar_memoria(self, clave, guardado, datos):
+        with self._lock:
+            self._memoria[clave] = (guardado, datos)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.config['MAX_MEMORIA']:
+                self._memoria.popitem(last=False)
+
+    # ---- nivel 2: base de datos ----
+    def _leer_bd(self, clave):
+        fila = RespuestaOpenLibrary.objects.filter(clave=clave).values_list('actualizado', 'datos').first()
+        if fila is None:
+            return None
+        return fila[0].timestamp(), fila[1]
+
+    def _guardar_bd(self, clave, consulta, datos):
+        _, creada = RespuestaOpenLibrary.objects.update_or_create(
+            clave=clave,
+            defaults={'consulta': consulta[:255], 'datos': datos, 'actualizado': timezone.now()},
+        )
+        if not creada:
+            return
+        with self._lock:
+            self._nuevas_bd += 1
+            desalojar = self._nuevas_bd >= self.config['DESALOJO_CADA']
+            if desalojar:
+                self._nuevas_bd = 0
+        if desalojar:
+            self._desalojar_bd()
+
+    def _desalojar_bd(self):
+        #Elimina las respuestas más antiguas cuando se supera el máximo
+        maximo = self.config['MAX_PERSISTENTE']
+        corte = (
+            RespuestaOpenLibrary.objects.order_by('-actualizado')
+            .values_list('actualizado', flat=True)[maximo:maximo + 1]
+        )
+        corte = list(corte)
+        if corte:
+            RespuestaOpenLibrary.objects.filter(actualizado__lte=corte[0]).delete()
+
+    def _vigente(self, guardado):
+        return time.time() - guardado < self.config['TTL']
+
+    def obtener(self, consulta, ruta, params):
+        """Devuelve el JSON de ``URL_BASE + ruta`` usando la caché por ``consulta``"""
+        clave = hashlib.sha256(consulta.encode()).hexdigest()
+
+        entrada = self._leer_memoria(clave)
+        if entrada and self._vigente(entrada[0]):
+            self._contar('aciertos_memoria')
+            return entrada[1]
+
+        entrada_bd = self._leer_bd(clave)
+        if entrada_bd and self._vigente(entrada_bd[0]):
+            self._contar('aciertos_bd')
+            self._guardar_memoria(clave, *entrada_bd)
+            return entrada_bd[1]
+
+        self._contar('fallos')
+        try:
+            datos = self.transporte(self.config['URL_BASE'] + ruta, params, self.config['TIMEOUT'])
+        except Exception as e:
+            # Sin conexión con OpenLibrary: mejor una respuesta vencida que ninguna
+            obsoleta = max(filter(None, [entrada, entrada_bd]), default=None, key=lambda e: e[0])
+            if obsoleta is None:
+                raise ErrorOpenLibrary(str(e)) from e
+            self._contar('obsoletas')
+            return obsoleta[1]
+
+        self._guardar_memoria(clave, time.time(), datos)
+        self._guardar_bd(clave, consulta, datos)
+        return datos
+
+    def precargar(self, consulta, datos):
+        #Guarda en memoria una respuesta obtenida por otra consulta
+        clave = hashlib.sha256(consulta.encode()).hexdigest()
+        self._guardar_memoria(clave, time.time(), datos)
+
+    def estadisticas(self):
+        with self._lock:
+            return {**self.stats, 'en_memoria': len(self._memoria)}
+
+    def prometheus(self):
+        """Estadísticas de la caché en formato de texto de Prometheus"""
+        datos = self.estadisticas()
+        lineas = [
+            '# HELP gestion_openlibrary_cache_total Consultas a OpenLibrary por resultado de la caché',
+            '# TYPE gestion_openlibrary_cache_total counter',
+        ]
+        for resultado in ('aciertos_memoria', 'aciertos_bd', 'fallos', 'obsoletas'):
+            lineas.append(f'gestion_openlibrary_cache_total{{resultado="{resultado}"}} {datos[resultado]}')
+        lineas += [
+            '# HELP gestion_openlibrary_cache_en_memoria Respuestas en la caché en memoria del proceso',
+            '# TYPE gestion_openlibrary_cache_en_memoria gauge',
+            f'gestion_openlibrary_cache_en_memoria {datos["en_memoria"]}',
+        ]
+        return '\n'.join(lineas) + '\n'
+
+    def limpiar_memoria(self):
+        with self._lock:
+            self._memoria.clear()
+
+    # ---- consultas de la aplicación ----
+    def buscar(self, campo, texto, limite=10):
+        """Busca por ``campo`` ('title' o 'author') y devuelve la lista de documentos"""
+        texto = normalizar(texto)
+        datos = self.obtener(f'search:{campo}:{texto}:{limite}', '/search.json', {campo: texto, 'limit': limite})
+        docs = datos.get('docs', [])
+        # La importación por ISBN suele repetir un resultado recién buscado
+        for doc in docs:
+            for isbn in (doc.get('isbn') or [])[:self.config['ISBN_POR_RESULTADO']]:
+                self.precargar(f'isbn:{normalizar(isbn)}', {'docs': [doc]})
+        return docs
+
+    def buscar_isbn(self, isbn):
+        isbn = normalizar(isbn)
+        return self.obtener(f'isbn:{isbn}', '/search.json', {'isbn': isbn}).get('docs', [])
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_cliente():
+    """Instancia compartida por el proceso"""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = CacheOpenLibrary()
+        return _cliente
+
+
+_ejecutor = None
+
+
+def ejecutor():
+    """Pool acotado compartido por las vistas async del proceso"""
+    global _ejecutor
+    with _cliente_lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=configuracion()['HILOS_ASYNC'], thread_name_prefix='openlibrary'
+            )
+        return _ejecutor
+
+
+def _en_hilo(funcion, *args):
+    #El nivel persistente de la caché abre una conexión a la BD en el hilo del pool
+    try:
+        return funcion(*args)
+    finally:
+        close_old_connections()
+
+
+async def abuscar(campo, texto, limite=10, espera=None):
+    """``buscar`` para vistas async, con un tiempo máximo de espera.
+
+    Al agotarse ``espera`` (``TimeoutError``) o si Django cancela la vista
+    porque el cliente cerró la conexión, una consulta que todavía estaba en
+    cola se descarta. Una que ya empezó termina en su hilo (como mucho
+    ``TIMEOUT`` segundos) y su respuesta queda en la caché para el reintento.
+    """
+    loop = asyncio.get_running_loop()
+    # Con el contexto copiado, las métricas cuentan las consultas hechas en el hilo
+    contexto = contextvars.copy_context()
+    futuro = loop.run_in_executor(
+        ejecutor(), contexto.run, _en_hilo, obtener_cliente().buscar, campo, texto, limite
+    )
+    return await asyncio.wait_for(futuro, espera or configuracion()['ESPERA_ASYNC'])
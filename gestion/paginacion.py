@@ -0,0 +1,74 @@
+"""Paginación por cursor (keyset) sobre la clave primaria.
+
+En lugar de ``OFFSET`` y ``COUNT(*)`` cada página pide ``id > cursor`` (o
+``id < cursor`` hacia atrás) con ``LIMIT por_pagina + 1``, así el costo de una
+página no depende del tamaño de la tabla ni de la posición.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+
+
+@dataclass
+class PaginaKeyset:
+    objetos: list
+    cursor_siguiente: int = None
+    cursor_anterior: int = None
+    total: int = None
+
+    @property
+    def tiene_siguiente(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def tiene_anterior(self):
+        return self.cursor_anterior is not None
+
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def tamano_pagina(valor, por_defecto=None):
+    #Tamaño de página pedido por el cliente, acotado al máximo configurado
+    maximo = getattr(settings, 'GESTION_PAGINA_MAXIMA', 100)
+    por_defecto = por_defecto or getattr(settings, 'GESTION_CATALOGO_POR_PAGINA', 24)
+    tamano = _entero(valor) or por_defecto
+    return max(1, min(tamano, maximo))
+
+
+def paginar_keyset(queryset, despues=None, antes=None, por_pagina=24, contar=False):
+    """Devuelve una ``PaginaKeyset`` de ``queryset`` ordenado por id.
+
+    ``despues`` y ``antes`` son los ids de borde recibidos en la URL; si no se
+    indica ninguno se devuelve la primera página. El total solo se calcula con
+    ``contar=True``.
+    """
+    despues = _entero(despues)
+    antes = _entero(antes)
+    total = queryset.count() if contar else None
+
+    if antes is not None and despues is None:
+        filas = list(queryset.filter(pk__lt=antes).order_by('-pk')[:por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        objetos = list(reversed(filas[:por_pagina]))
+        return PaginaKeyset(
+            objetos=objetos,
+            cursor_siguiente=objetos[-1].pk if objetos else None,
+            cursor_anterior=objetos[0].pk if hay_mas else None,
+            total=total,
+        )
+
+    if despues is not None:
+        queryset = queryset.filter(pk__gt=despues)
+    filas = list(queryset.order_by('pk')[:por_pagina + 1])
+    objetos = filas[:por_pagina]
+    return PaginaKeyset(
+        objetos=objetos,
+        cursor_siguiente=objetos[-1].pk if len(filas) > por_pagina else None,
+        cursor_anterior=objetos[0].pk if despues is not None and objetos else None,
+        total=total,
+    )
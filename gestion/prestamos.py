@@ -0,0 +1,282 @@
+"""Operaciones de préstamo sobre varios libros a la vez."""
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cambios import LIBRO, MULTA, PRESTAMO, registrar
+from .models import ESTADOS_ACTIVOS, TARIFA_RETRASO, Libro, Multa, Prestamo
+from .secuencias import reservar_codigos
+from .versiones import CATALOGO, USUARIO, tocar, tocar_usuarios_de_prestamos
+
+# Días de préstamo, igual que Prestamo.generar_prestamo
+DIAS_PRESTAMO = 2
+
+
+@dataclass
+class Recibo:
+    usuario: object
+    fecha_max: object
+    prestamos: list = field(default_factory=list)
+
+    @property
+    def cantidad(self):
+        return len(self.prestamos)
+
+
+def prestar_libros(usuario, libro_ids):
+    """Presta todos los libros de ``libro_ids`` a ``usuario`` o ninguno.
+
+    La disponibilidad se valida con una sola consulta y los contadores se
+    incrementan con un UPDATE condicional por cada cantidad distinta de
+    ejemplares pedidos (normalmente uno solo), así que dos mostradores no
+    pueden llevarse el mismo ejemplar. Los préstamos se insertan con
+    ``bulk_create`` usando códigos reservados en bloque.
+    """
+    if usuario is None:
+        raise ValidationError('Debe asignar un usuario de biblioteca antes de generar el préstamo')
+    pedidos = Counter(int(libro_id) for libro_id in libro_ids)
+    if not pedidos:
+        raise ValidationError('Seleccione al menos un libro')
+
+    libros = Libro.objects.con_disponibilidad().in_bulk(pedidos)
+    faltantes = [str(libro_id) for libro_id in pedidos if libro_id not in libros]
+    if faltantes:
+        raise ValidationError(f'Libros inexistentes: {", ".join(faltantes)}')
+    agotados = [
+        libros[libro_id].titulo for libro_id, cantidad in pedidos.items()
+        if libros[libro_id].cantidad_disponible < cantidad
+    ]
+    if agotados:
+        raise ValidationError(f'No hay ejemplares disponibles de: {", ".join(agotados)}')
+
+    fecha_max = timezone.now().date() + timedelta(days=DIAS_PRESTAMO)
+    por_cantidad = {}
+    for libro_id, cantidad in pedidos.items():
+        por_cantidad.setdefault(cantidad, []).append(libro_id)
+
+    with transaction.atomic():
+        for cantidad, ids in por_cantidad.items():
+            if Libro.objects.filter(pk__in=ids).reservar(cantidad) != len(ids):
+                # Otra petición se llevó algún ejemplar entre la validación y el UPDATE
+                raise ValidationError('Algunos libros se prestaron mientras se procesaba la solicitud')
+
+        libros_ordenados = [libros[libro_id] for libro_id in pedidos.elements()]
+        codigos = reservar_codigos('prestamo', 'BLB', len(libros_ordenados))
+        prestamos = Prestamo.objects.bulk_create(
+            Prestamo(
+                codigo=codigo,
+                libro=libro,
+                usuario_biblioteca=usuario,
+                fecha_max=fecha_max,
+                estado='p',
+            )
+            for codigo, libro in zip(codigos, libros_ordenados)
+        )
+        for prestamo in prestamos:
+            prestamo._guardado = (prestamo.estado, prestamo.libro_id)
+        tocar(USUARIO, [usuario.pk])
+        registrar(PRESTAMO, Prestamo.objects.filter(codigo__in=codigos))
+    return Recibo(usuario=usuario, fecha_max=fecha_max, prestamos=prestamos)
+
+
+@dataclass
+class ItemDevolucion:
+    """Un libro del buzón: por código de préstamo o por ISBN + cédula del usuario"""
+    codigo: str = ''
+    isbn: str = ''
+    cedula: str = ''
+    estado_libro: str = 'bueno'
+
+    @property
+    def referencia(self):
+        return self.codigo or f'{self.isbn}/{self.cedula}'
+
+
+@dataclass
+class ResultadoDevolucion:
+    referencia: str
+    ok: bool
+    detalle: str
+    codigo: str = ''
+    total_multas: Decimal = Decimal('0.00')
+
+    def como_dict(self):
+        return {
+            'referencia': self.referencia,
+            'ok': self.ok,
+            'detalle': self.detalle,
+            'codigo': self.codigo,
+            'total_multas': str(self.total_multas),
+        }
+
+
+def leer_devoluciones(texto):
+    """Convierte líneas ``codigo[,estado]`` o ``isbn,cedula[,estado]`` en ItemDevolucion"""
+    estados = dict(Prestamo.ESTADOS_LIBRO)
+    items = []
+    for linea in texto.splitlines():
+        campos = [c.strip() for c in linea.replace(';', ',').split(',') if c.strip()]
+        if not campos or campos[0].startswith('#'):
+            continue
+        estado_libro = campos.pop() if len(campos) > 1 and campos[-1] in estados else 'bueno'
+        if len(campos) == 1:
+            items.append(ItemDevolucion(codigo=campos[0], estado_libro=estado_libro))
+        else:
+            items.append(ItemDevolucion(isbn=campos[0], cedula=campos[1], estado_libro=estado_libro))
+    return items
+
+
+def item_desde_dict(datos):
+    return ItemDevolucion(
+        codigo=str(datos.get('codigo') or '').strip(),
+        isbn=str(datos.get('isbn') or '').strip(),
+        cedula=str(datos.get('cedula') or '').strip(),
+        estado_libro=str(datos.get('estado_libro') or 'bueno'),
+    )
+
+
+def _resolver_prestamos(items):
+    #Dos consultas como máximo: por código y por (ISBN, cédula) entre los préstamos activos
+    codigos = {item.codigo for item in items if item.codigo}
+    por_codigo = {
+        p.codigo: p for p in Prestamo.objects.select_related('libro').select_for_update(of=('self',)).filter(codigo__in=codigos)
+    } if codigos else {}
+
+    pares = {(item.isbn, item.cedula) for item in items if not item.codigo}
+    por_par = {}
+    if pares:
+        candidatos = Prestamo.objects.select_related('libro', 'usuario_biblioteca').select_for_update(of=('self',)).filter(
+            libro__isbn__in={isbn for isbn, _ in pares},
+            usuario_biblioteca__cedula__in={cedula for _, cedula in pares},
+            estado__in=ESTADOS_ACTIVOS,
+        ).order_by('fecha_max', 'id')
+        for prestamo in candidatos:
+            # Si el usuario tiene el mismo libro dos veces, se devuelve primero el más antiguo
+            por_par.setdefault((prestamo.libro.isbn, prestamo.usuario_biblioteca.cedula), []).append(prestamo)
+
+    resueltos = []
+    for item in items:
+        if item.codigo:
+            resueltos.append(por_codigo.get(item.codigo))
+        else:
+            pendientes = por_par.get((item.isbn, item.cedula))
+            resueltos.append(pendientes.pop(0) if pendientes else None)
+    return resueltos
+
+
+def devolver_lote(items, fecha=None):
+    """Procesa la devolución de muchos préstamos a la vez.
+
+    Aplica las mismas reglas que ``Prestamo.devolver_libro`` (pérdida, daño y
+    retraso), pero carga los préstamos y sus multas con pocas consultas y
+    escribe todo con operaciones masivas en una transacción. Los elementos que
+    no se pueden devolver se informan en su resultado y no detienen el lote.
+    """
+    # Los préstamos se bloquean al leerlos (select_for_update en bases que lo
+    # soportan) para que otra devolución simultánea no descuente dos veces
+    with transaction.atomic():
+        return _devolver_lote(items, fecha or timezone.now().date())
+
+
+def _devolver_lote(items, fecha):
+    estados_validos = dict(Prestamo.ESTADOS_LIBRO)
+    resultados = [None] * len(items)
+    aceptados = []
+    vistos = set()
+
+    for i, (item, prestamo) in enumerate(zip(items, _resolver_prestamos(items))):
+        if item.estado_libro not in estados_validos:
+            detalle = f'Estado del libro inválido: {item.estado_libro}'
+        elif prestamo is None:
+            detalle = 'Préstamo no encontrado'
+        elif prestamo.pk in vistos:
+            detalle = 'Préstamo repetido en el lote'
+        elif prestamo.estado not in ESTADOS_ACTIVOS:
+            detalle = 'Solo se pueden devolver préstamos en estado Prestado o Multado'
+        else:
+            vistos.add(prestamo.pk)
+            aceptados.append((i, item, prestamo))
+            continue
+        resultados[i] = ResultadoDevolucion(item.referencia, False, detalle, prestamo.codigo if prestamo else '')
+
+    if not aceptados:
+        return resultados
+
+    multas = {}
+    for multa in Multa.objects.filter(prestamo_id__in=vistos):
+        multas.setdefault(multa.prestamo_id, []).append(multa)
+
+    nuevas, actualizadas, borrar = [], [], []
+    for i, item, prestamo in aceptados:
+        existentes = multas.get(prestamo.pk, [])
+        if item.estado_libro == 'perdido':
+            # La pérdida cancela las demás multas
+            borrar.extend(m.pk for m in existentes)
+            existentes = [Multa(prestamo=prestamo, tipo='p', monto=prestamo.libro.costo * 2, fecha=fecha)]
+            nuevas.extend(existentes)
+        else:
+            tipos = {m.tipo: m for m in existentes}
+            if item.estado_libro == 'danado' and 'd' not in tipos:
+                multa = Multa(prestamo=prestamo, tipo='d', monto=prestamo.libro.costo * Decimal('0.5'), fecha=fecha)
+                nuevas.append(multa)
+                existentes = existentes + [multa]
+            if prestamo.fecha_max and fecha > prestamo.fecha_max:
+                monto = (fecha - prestamo.fecha_max).days * TARIFA_RETRASO
+                if 'r' in tipos:
+                    tipos['r'].monto = monto
+                    actualizadas.append(tipos['r'])
+                else:
+                    multa = Multa(prestamo=prestamo, tipo='r', monto=monto, fecha=fecha)
+                    nuevas.append(multa)
+                    existentes = existentes + [multa]
+
+        prestamo.estado = 'd'
+        prestamo.estado_libro = item.estado_libro
+        prestamo.fecha_devolucion = fecha
+        total = sum((Decimal(m.monto) for m in existentes), Decimal('0.00'))
+        detalle = f'Libro devuelto. Total multas: ${total:.2f}' if total > 0 else 'Libro devuelto sin multas'
+        resultados[i] = ResultadoDevolucion(item.referencia, True, detalle, prestamo.codigo, total)
+
+    if borrar:
+        Multa.objects.filter(pk__in=borrar).delete()
+    if actualizadas:
+        Multa.objects.bulk_update(actualizadas, ['monto'])
+    if nuevas:
+        for multa, codigo in zip(nuevas, reservar_codigos('multa', 'MLT', len(nuevas))):
+            multa.codigo = codigo
+        Multa.objects.bulk_create(nuevas)
+
+    prestamos = [prestamo for _, _, prestamo in aceptados]
+    Prestamo.objects.bulk_update(prestamos, ['estado', 'estado_libro', 'fecha_devolucion'])
+
+    # Contadores: un UPDATE por cada cantidad distinta de ejemplares devueltos del mismo libro
+    devueltos = Counter(prestamo.libro_id for prestamo in prestamos)
+    por_cantidad = {}
+    for libro_id, cantidad in devueltos.items():
+        por_cantidad.setdefault(cantidad, []).append(libro_id)
+    for cantidad, ids in por_cantidad.items():
+        Libro.objects.filter(pk__in=ids, ejemplares_prestados__gte=cantidad).update(
+            ejemplares_prestados=F('ejemplares_prestados') - cantidad,
+            version=F('version') + 1,
+        )
+    # Igual que devolver_libro: un libro perdido no vuelve a marcarse disponible
+    recuperados = {p.libro_id for _, item, p in aceptados if item.estado_libro != 'perdido'}
+    Libro.objects.filter(pk__in=recuperados, disponible=False).update(disponible=True, version=F('version') + 1)
+    tocar(CATALOGO)
+    tocar_usuarios_de_prestamos(vistos)
+    # Las multas borradas ya quedaron registradas por la señal post_delete
+    registrar(PRESTAMO, vistos)
+    registrar(LIBRO, devueltos)
+    registrar(MULTA, [m.pk for m in actualizadas])
+    if nuevas:
+        registrar(MULTA, Multa.objects.filter(codigo__in=[m.codigo for m in nuevas]))
+
+    for prestamo in prestamos:
+        prestamo._guardado = (prestamo.estado, prestamo.libro_id)
+    return resultados
@@ -1,24 +1,108 @@
+"""Tareas programadas (APScheduler con los jobs guardados en la base).
+
+Solo un proceso ejecuta los jobs: el que tiene la concesión ``scheduler`` de
+``gestion.liderazgo``. ``Coordinador`` la renueva en cada latido, arranca el
+scheduler al obtenerla y lo detiene si la pierde. En producción corre en su
+propio proceso (``manage.py run_scheduler``), así los workers web no cargan
+con el scheduler; se pueden lanzar varias réplicas y, si cae el líder, otra
+toma el relevo al vencer la concesión.
+"""
+import functools
+import logging
+import threading
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from django_apscheduler.jobstores import DjangoJobStore
+from django_apscheduler.models import DjangoJob
+from django.conf import settings
 from django.core.management import call_command
-import logging
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from gestion import liderazgo
 
 logger = logging.getLogger(__name__)
 
+# Fila de Liderazgo que da derecho a ejecutar los jobs
+NOMBRE = 'scheduler'
+# Titular del coordinador que arrancó el scheduler de este proceso. Se fija al
+# arrancarlo y no al importar el módulo: un proceso hijo de un fork tendría el
+# mismo host y pid heredados que su padre
+_titular = None
+
+CONFIGURACION = {
+    # Arrancar el scheduler con runserver (desarrollo)
+    'CON_RUNSERVER': True,
+    # Segundos de atraso con los que todavía se ejecuta un job (p. ej. si el
+    # líder cayó justo a la hora programada y el relevo llega después)
+    'TOLERANCIA': 3600,
+}
+
 
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_SCHEDULER', {})}
+
+
+def solo_lider(job):
+    """Omite el job si este proceso ya no tiene la concesión.
+
+    Cubre el intervalo entre perder la concesión y detener el scheduler; las
+    tareas son incrementales, así que la siguiente ejecución recupera lo omitido.
+    """
+    @functools.wraps(job)
+    def envoltura():
+        close_old_connections()
+        if _titular is None or not liderazgo.es_lider(NOMBRE, _titular):
+            logger.warning(f"{job.__name__} omitido: este proceso no es el líder del scheduler")
+            return
+        job()
+    return envoltura
+
+
+@solo_lider
 def verificar_prestamos_job():
     """Job que ejecuta el comando de verificación de préstamos vencidos"""
     try:
         logger.info("Ejecutando verificación de préstamos vencidos...")
-        call_command('verificar_prestamos_vencidos')
+        # Solo los préstamos que vencieron desde la última ejecución
+        call_command('verificar_prestamos_vencidos', incremental=True)
         logger.info("Verificación completada exitosamente")
     except Exception as e:
         logger.error(f"Error al ejecutar verificación: {str(e)}")
 
 
-def start_scheduler():
-    """Inicia el scheduler en segundo plano"""
-    scheduler = BackgroundScheduler()
+@solo_lider
+def compactar_cambios_job():
+    """Job que compacta el registro de cambios de la API"""
+    try:
+        call_command('compactar_cambios')
+    except Exception as e:
+        logger.error(f"Error al compactar el registro de cambios: {str(e)}")
+
+
+@solo_lider
+def enviar_notificaciones_job():
+    """Job que envía las notificaciones de multas encoladas"""
+    try:
+        call_command('enviar_notificaciones')
+    except Exception as e:
+        logger.error(f"Error al enviar notificaciones: {str(e)}")
+
+
+@solo_lider
+def enviar_resumen_multas_job():
+    """Job que envía el resumen diario de multas pendientes por usuario"""
+    try:
+        call_command('enviar_resumen_multas')
+    except Exception as e:
+        logger.error(f"Error al enviar el resumen de multas: {str(e)}")
+
+
+def crear_scheduler():
+    """Scheduler con todos los jobs, sin iniciar"""
+    scheduler = BackgroundScheduler(
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': configuracion()['TOLERANCIA']}
+    )
     scheduler.add_jobstore(DjangoJobStore(), "default")
     
     # Programar job para ejecutarse todos los días a las 9:00 AM
@@ -31,6 +115,98 @@ def start_scheduler():
         replace_existing=True,
     )
     
-    scheduler.start()
-    logger.info("✅ Scheduler iniciado - verificación programada para las 9:00 AM todos los días")
-    print("✅ Scheduler iniciado - verificación programada para las 9:00 AM todos los días")
\ No newline at end of file
+    # Compactación del registro de cambios, de madrugada
+    scheduler.add_job(
+        compactar_cambios_job,
+        'cron',
+        hour=3,
+        minute=0,
+        id='compactar_cambios',
+        replace_existing=True,
+    )
+    
+    # Cola de notificaciones de multas
+    scheduler.add_job(
+        enviar_notificaciones_job,
+        'interval',
+        minutes=5,
+        id='enviar_notificaciones',
+        replace_existing=True,
+    )
+    
+    # Resumen diario de multas, después de generar las multas del día
+    scheduler.add_job(
+        enviar_resumen_multas_job,
+        'cron',
+        hour=20,
+        minute=0,
+        id='enviar_resumen_multas',
+        replace_existing=True,
+    )
+    
+    # replace_existing recalcula la próxima ejecución; los jobs que el líder
+    # anterior no llegó a ejecutar conservan su hora para correr al iniciar
+    atrasados = DjangoJob.objects.filter(next_run_time__lte=timezone.now()).values_list('id', 'next_run_time')
+    for job_id, proxima in atrasados:
+        if scheduler.get_job(job_id):
+            scheduler.modify_job(job_id, next_run_time=proxima)
+    return scheduler
+
+
+class Coordinador:
+    """Mantiene la concesión y arranca o detiene el scheduler según el liderazgo"""
+
+    def __init__(self, titular=None, crear=crear_scheduler):
+        self.titular = titular or liderazgo.titular_local()
+        self.crear = crear
+        self.scheduler = None
+
+    def latido(self, ahora=None):
+        """Renueva o intenta tomar la concesión; devuelve True si este proceso es el líder"""
+        try:
+            lider = liderazgo.adquirir(NOMBRE, self.titular, ahora)
+        except DatabaseError as e:
+            # Sin poder renovar, la concesión vencerá y otro proceso la tomará
+            logger.error(f"No se pudo renovar el liderazgo del scheduler: {str(e)}")
+            lider = False
+        finally:
+            close_old_connections()
+
+        if lider and self.scheduler is None:
+            global _titular
+            _titular = self.titular
+            self.scheduler = self.crear()
+            self.scheduler.start()
+            logger.info(f"✅ Scheduler iniciado en {self.titular}")
+        elif not lider and self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+            logger.warning(f"Scheduler detenido en {self.titular}: se perdió el liderazgo")
+        return lider
+
+    def ejecutar(self, detener):
+        """Late cada ``LATIDO`` segundos hasta que se active el evento ``detener``"""
+        try:
+            while not detener.is_set():
+                self.latido()
+                detener.wait(liderazgo.configuracion()['LATIDO'])
+        finally:
+            self.soltar()
+
+    def soltar(self):
+        #Espera a los jobs en curso y cede la concesión para un relevo inmediato
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=True)
+            self.scheduler = None
+            liderazgo.liberar(NOMBRE, self.titular)
+            close_old_connections()
+
+
+def start_scheduler():
+    """Inicia el coordinador en un hilo en segundo plano (runserver)"""
+    coordinador = Coordinador(liderazgo.titular_local())
+    hilo = threading.Thread(
+        target=coordinador.ejecutar, args=(threading.Event(),), name='coordinador-scheduler', daemon=True
+    )
+    hilo.start()
+    return hilo
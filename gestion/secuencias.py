@@ -0,0 +1,86 @@
+"""Asignación de números secuenciales para los códigos BLB-/MLT-.
+
+Cada secuencia es una fila de ``Secuencia`` que se incrementa con un UPDATE
+atómico (``valor = valor + n``) y luego se lee dentro de la misma transacción,
+así dos procesos nunca obtienen el mismo número y no hace falta leer la última
+fila de la tabla antes de insertar.
+
+Con ``GESTION_CODIGOS_BLOQUE > 1`` cada proceso reserva bloques de números y los
+entrega desde memoria. Los números de un bloque son únicos pero pueden no ser
+consecutivos entre procesos.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Secuencia
+
+
+def _reservar(nombre, cantidad):
+    #Reserva `cantidad` números y devuelve el rango asignado
+    with transaction.atomic():
+        actualizadas = Secuencia.objects.filter(nombre=nombre).update(valor=F('valor') + cantidad)
+        if not actualizadas:
+            Secuencia.objects.get_or_create(nombre=nombre)
+            Secuencia.objects.filter(nombre=nombre).update(valor=F('valor') + cantidad)
+        valor = Secuencia.objects.filter(nombre=nombre).values_list('valor', flat=True).get()
+    return range(valor - cantidad + 1, valor + 1)
+
+
+class AsignadorSecuencia:
+    """Entrega números de una secuencia, reservando bloques por proceso"""
+
+    def __init__(self, nombre, bloque=1):
+        self.nombre = nombre
+        self.bloque = max(1, bloque)
+        self._pendientes = iter(())
+        self._lock = threading.Lock()
+
+    def siguiente(self):
+        # Dentro de una transacción la reserva podría revertirse y otro proceso
+        # recibiría los mismos números; en ese caso no se usa el bloque en memoria
+        if self.bloque == 1 or self._en_transaccion():
+            return _reservar(self.nombre, 1)[0]
+        with self._lock:
+            numero = next(self._pendientes, None)
+            if numero is None:
+                self._pendientes = iter(_reservar(self.nombre, self.bloque))
+                numero = next(self._pendientes)
+            return numero
+
+    def _en_transaccion(self):
+        return transaction.get_connection().in_atomic_block
+
+    def reservar(self, cantidad):
+        #Reserva varios números de una sola vez (inserciones masivas)
+        if cantidad <= 0:
+            return range(0)
+        return _reservar(self.nombre, cantidad)
+
+
+_asignadores = {}
+_asignadores_lock = threading.Lock()
+
+
+def obtener_asignador(nombre):
+    with _asignadores_lock:
+        if nombre not in _asignadores:
+            bloque = getattr(settings, 'GESTION_CODIGOS_BLOQUE', 1)
+            _asignadores[nombre] = AsignadorSecuencia(nombre, bloque)
+        return _asignadores[nombre]
+
+
+def formatear_codigo(prefijo, numero):
+    return f"{prefijo}-{numero:03d}"
+
+
+def siguiente_codigo(nombre, prefijo):
+    """Devuelve el siguiente código, p. ej. ``siguiente_codigo('prestamo', 'BLB')``"""
+    return formatear_codigo(prefijo, obtener_asignador(nombre).siguiente())
+
+
+def reservar_codigos(nombre, prefijo, cantidad):
+    """Devuelve una lista de `cantidad` códigos consecutivos"""
+    return [formatear_codigo(prefijo, n) for n in obtener_asignador(nombre).reservar(cantidad)]
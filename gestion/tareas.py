@@ -0,0 +1,225 @@
+"""Cola de tareas persistente para las operaciones lentas (sin broker externo).
+
+Las vistas llaman a ``encolar`` (un INSERT en ``Tarea``) y responden enseguida;
+el cliente consulta el estado en ``/tareas/<id>/``. Los workers de
+``manage.py run_workers`` reclaman filas con un UPDATE condicional (dos workers
+no ejecutan la misma tarea), las ejecutan y guardan el resultado. Una tarea que
+falla se reintenta con espera exponencial hasta ``max_intentos``; una que quedó
+En curso porque su worker murió se retoma al vencer ``PLAZO``. Mientras la
+tarea corre, un hilo del worker renueva el plazo cada ``PLAZO / 3`` segundos,
+así que una tarea larga no se ejecuta dos veces aunque dure más que ``PLAZO``.
+
+Cada tipo de tarea es una función registrada con ``@tarea('nombre')`` que
+recibe los argumentos guardados y devuelve un valor serializable a JSON. Si el
+resultado es un dict con ``mensaje``, ese texto se muestra al consultar el estado.
+"""
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Prestamo, Tarea
+
+CONFIGURACION = {
+    # Hilos por proceso de run_workers
+    'WORKERS': 4,
+    'MAX_INTENTOS': 3,
+    # Espera antes del primer reintento (se duplica en cada fallo), en segundos
+    'ESPERA_REINTENTO': 30,
+    # Plazo sin renovar tras el cual otro worker puede retomar una tarea reclamada
+    # (el worker lo renueva cada PLAZO / 3 mientras la tarea corre)
+    'PLAZO': 600,
+    # Segundos entre revisiones de la cola vacía
+    'INTERVALO': 2,
+}
+
+TAREAS = {}
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_TAREAS', {})}
+
+
+def tarea(nombre):
+    """Registra la función como tipo de tarea ``nombre``"""
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def _campos(tipo, usuario, max_intentos, argumentos):
+    if tipo not in TAREAS:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+    return {
+        'tipo': tipo,
+        'argumentos': argumentos,
+        'usuario': usuario if usuario is not None and usuario.is_authenticated else None,
+        'max_intentos': max_intentos or configuracion()['MAX_INTENTOS'],
+    }
+
+
+def encolar(tipo, usuario=None, max_intentos=None, **argumentos):
+    """Inserta una tarea pendiente y la devuelve; no ejecuta nada"""
+    return Tarea.objects.create(**_campos(tipo, usuario, max_intentos, argumentos))
+
+
+async def aencolar(tipo, usuario=None, max_intentos=None, **argumentos):
+    """``encolar`` para vistas async"""
+    return await Tarea.objects.acreate(**_campos(tipo, usuario, max_intentos, argumentos))
+
+
+def reclamar(lote=1, ahora=None):
+    """Marca En curso hasta ``lote`` tareas listas y las devuelve.
+
+    El intento se cuenta al reclamar: una tarea que hace caer al worker
+    también agota sus intentos.
+    """
+    ahora = ahora or timezone.now()
+    # Vencidas En curso sin intentos restantes: su worker cayó en el último intento
+    Tarea.objects.filter(estado='e', proximo_intento__lte=ahora, intentos__gte=F('max_intentos')).update(
+        estado='f', terminada=ahora, ultimo_error='El worker no terminó la tarea dentro del plazo',
+    )
+    listas = Tarea.objects.filter(
+        estado__in=('p', 'e'), proximo_intento__lte=ahora, intentos__lt=F('max_intentos'),
+    )
+    ids = list(listas.order_by('proximo_intento', 'id').values_list('id', flat=True)[:lote])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    listas.filter(pk__in=ids).update(
+        estado='e', lote=token, intentos=F('intentos') + 1,
+        proximo_intento=ahora + timedelta(seconds=configuracion()['PLAZO']),
+    )
+    return list(Tarea.objects.filter(lote=token, estado='e'))
+
+
+def renovar(tarea, ahora=None):
+    """Extiende el plazo de una tarea En curso; False si otro worker ya la retomó"""
+    ahora = ahora or timezone.now()
+    return bool(Tarea.objects.filter(pk=tarea.pk, lote=tarea.lote, estado='e').update(
+        proximo_intento=ahora + timedelta(seconds=configuracion()['PLAZO']),
+    ))
+
+
+def _mantener_plazo(tarea, terminada, intervalo):
+    #Hilo auxiliar: renueva el plazo hasta que la tarea termina o se pierde
+    try:
+        while not terminada.wait(intervalo):
+            if not renovar(tarea):
+                break
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _renovando(tarea, intervalo):
+    terminada = threading.Event()
+    hilo = threading.Thread(target=_mantener_plazo, args=(tarea, terminada, intervalo), daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        terminada.set()
+        hilo.join()
+
+
+def ejecutar(tarea, ahora=None):
+    """Ejecuta una tarea reclamada y guarda su estado; devuelve True si terminó bien"""
+    opciones = configuracion()
+    cambios = {'terminada': None}
+    try:
+        with _renovando(tarea, opciones['PLAZO'] / 3):
+            resultado = TAREAS[tarea.tipo](**tarea.argumentos)
+    except Exception as e:
+        cambios['ultimo_error'] = f'{type(e).__name__}: {e}'
+        if tarea.intentos >= tarea.max_intentos or tarea.tipo not in TAREAS:
+            cambios.update(estado='f', terminada=timezone.now())
+        else:
+            espera = opciones['ESPERA_REINTENTO'] * 2 ** (tarea.intentos - 1)
+            cambios.update(estado='p', proximo_intento=(ahora or timezone.now()) + timedelta(seconds=espera))
+        exito = False
+    else:
+        cambios.update(estado='c', resultado=resultado, ultimo_error='', terminada=timezone.now())
+        exito = True
+    # Solo si nadie la retomó mientras tanto (plazo vencido)
+    Tarea.objects.filter(pk=tarea.pk, lote=tarea.lote).update(**cambios)
+    for campo, valor in cambios.items():
+        setattr(tarea, campo, valor)
+    return exito
+
+
+def procesar(lote=1, ahora=None):
+    """Reclama y ejecuta hasta ``lote`` tareas; devuelve cuántas procesó"""
+    tareas = reclamar(lote, ahora)
+    for pendiente in tareas:
+        ejecutar(pendiente, ahora)
+    return len(tareas)
+
+
+def trabajar(detener, intervalo=None):
+    """Bucle de un worker: procesa tareas hasta que se active el evento ``detener``"""
+    intervalo = intervalo or configuracion()['INTERVALO']
+    try:
+        while not detener.is_set():
+            procesadas = procesar()
+            close_old_connections()
+            if not procesadas:
+                detener.wait(intervalo)
+    finally:
+        close_old_connections()
+
+
+def estado(tarea):
+    """Datos de la tarea para la consulta de estado"""
+    resultado = tarea.resultado if isinstance(tarea.resultado, dict) else {}
+    return {
+        'id': tarea.id,
+        'tipo': tarea.tipo,
+        'estado': tarea.get_estado_display(),
+        'terminada': tarea.terminal,
+        'intentos': tarea.intentos,
+        'mensaje': resultado.get('mensaje') or tarea.ultimo_error,
+        'resultado': tarea.resultado,
+    }
+
+
+# ==================== TIPOS DE TAREA ====================
+
+@tarea('importar_libro')
+def importar_libro(isbn):
+    from .importacion import importar_libro as importar
+    return {'mensaje': importar(isbn).detalle}
+
+
+@tarea('importar_isbns')
+def importar_isbns(isbns):
+    from .importacion import importar_isbns as importar
+    resultados = importar(isbns)
+    importados = sum(1 for r in resultados if r.estado == 'importado')
+    return {
+        'mensaje': f'{importados} de {len(resultados)} libros importados',
+        'resultados': [asdict(r) for r in resultados],
+    }
+
+
+@tarea('generar_prestamos')
+def generar_prestamos(ids):
+    generados = 0
+    errores = []
+    for prestamo in Prestamo.objects.filter(pk__in=ids, estado='b').select_related('libro'):
+        try:
+            prestamo.generar_prestamo()
+            generados += 1
+        except Exception as e:
+            errores.append(f"Préstamo {prestamo.codigo}: {str(e)}")
+    mensaje = f'{generados} préstamo(s) generado(s) exitosamente'
+    if errores:
+        mensaje += f'. Errores: {"; ".join(errores)}'
+    return {'mensaje': mensaje, 'generados': generados, 'errores': errores}
@@ -0,0 +1,75 @@
+"""Caché de las tarjetas del catálogo (``libros.html``).
+
+Cada tarjeta se guarda ya renderizada con la clave ``<id>:<version>`` del libro.
+``Libro.version`` se incrementa en el mismo UPDATE que cambia el libro o su
+disponibilidad y cuando cambia su autor o su editorial, así que una tarjeta
+desactualizada no se vuelve a leer nunca (expira sola) y no hace falta borrar
+claves. Las tarjetas de una página se leen con un único ``get_many``, por lo
+que funciona igual con la caché en memoria local o en archivos.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Autor, Editorial, Libro
+
+PLANTILLA = 'gestion/templates/tarjeta_libro.html'
+# Incrementar al modificar la plantilla para no servir tarjetas con el HTML anterior
+VERSION_PLANTILLA = 1
+
+CONFIGURACION = {
+    'ACTIVO': True,
+    # Alias de settings.CACHES
+    'CACHE': 'default',
+    'TIMEOUT': 24 * 60 * 60,
+}
+
+
+def configuracion():
+    return {**CONFIGURACION, **getattr(settings, 'GESTION_TARJETAS', {})}
+
+
+def clave(libro):
+    return f'tarjeta_libro:{VERSION_PLANTILLA}:{libro.pk}:{libro.version}'
+
+
+def tarjetas(libros):
+    """HTML de la tarjeta de cada libro, en el mismo orden.
+
+    Los libros deben venir de ``Libro.objects.catalogo()`` (autor, editorial y
+    disponibilidad cargados). Solo se renderizan las tarjetas que no estaban
+    en la caché, y se guardan todas juntas con ``set_many``.
+    """
+    opciones = configuracion()
+    if not opciones['ACTIVO']:
+        return [render_to_string(PLANTILLA, {'libro': libro}) for libro in libros]
+
+    cache = caches[opciones['CACHE']]
+    claves = [clave(libro) for libro in libros]
+    guardadas = cache.get_many(claves)
+    nuevas = {}
+    resultado = []
+    for libro, k in zip(libros, claves):
+        html = guardadas.get(k)
+        if html is None:
+            html = nuevas[k] = render_to_string(PLANTILLA, {'libro': libro})
+        resultado.append(mark_safe(html))
+    if nuevas:
+        cache.set_many(nuevas, opciones['TIMEOUT'])
+    return resultado
+
+
+def _invalidar_libros_de(sender, instance, created=False, **kwargs):
+    # El nombre del autor y de la editorial aparecen en las tarjetas; al borrar
+    # una editorial sus libros quedan sin ella por un UPDATE que no pasa por save()
+    if not created:
+        Libro.objects.filter(**{sender._meta.model_name: instance}).update(version=F('version') + 1)
+
+
+def conectar():
+    for modelo in (Autor, Editorial):
+        post_save.connect(_invalidar_libros_de, sender=modelo, dispatch_uid=f'tarjeta_{modelo.__name__}_save')
+        pre_delete.connect(_invalidar_libros_de, sender=modelo, dispatch_uid=f'tarjeta_{modelo.__name__}_delete')
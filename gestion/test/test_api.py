@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from gestion.cambios import compactar
+from gestion.models import Autor, Cambio, Libro, Multa, Prestamo, UsuarioBiblioteca
+
+
+class ApiCatalogoTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        self.libros = [Libro.objects.create(titulo=f'Libro {i}', autor=self.autor, ejemplares=2) for i in range(5)]
+
+    def test_listado_paginado_por_cursor(self):
+        datos = self.client.get(reverse('api_libros'), {'por_pagina': 2}).json()
+        self.assertEqual([l['titulo'] for l in datos['resultados']], ['Libro 0', 'Libro 1'])
+        self.assertEqual(datos['resultados'][0]['disponibles'], 2)
+        siguiente = self.client.get(datos['siguiente']).json()
+        self.assertEqual([l['titulo'] for l in siguiente['resultados']], ['Libro 2', 'Libro 3'])
+        self.assertIsNotNone(siguiente['anterior'])
+
+    def test_304_sin_consultar_el_catalogo(self):
+        url = reverse('api_libros')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in consultas if 'gestion_libro' in q['sql']])
+
+    def test_prestar_cambia_la_version(self):
+        url = reverse('api_disponibilidad', args=[self.libros[0].id])
+        etag = self.client.get(url)['ETag']
+        usuario = UsuarioBiblioteca.objects.create(nombre='U', cedula='1714567890', email='u@test.com')
+        Prestamo.objects.create(libro=self.libros[0], usuario_biblioteca=usuario).generar_prestamo()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['disponibles'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ApiUsuarioTest(TestCase):
+    def setUp(self):
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        self.libro = Libro.objects.create(titulo='Libro', autor=autor, ejemplares=5)
+        self.usuario = UsuarioBiblioteca.objects.create(nombre='U', cedula='1714567890', email='u@test.com')
+        self.prestamo = Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario)
+        self.prestamo.generar_prestamo()
+        User.objects.create_user(username='kiosco', password='pass')
+        self.client.login(username='kiosco', password='pass')
+
+    def test_requiere_sesion(self):
+        self.client.logout()
+        response = self.client.get(reverse('api_prestamos_usuario', args=[self.usuario.id]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_multa_nueva_invalida_el_etag_del_usuario(self):
+        url = reverse('api_multas_usuario', args=[self.usuario.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['resultados'], [])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Multa.objects.create(prestamo=self.prestamo, tipo='d', monto=10)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['resultados'][0]['monto_vigente'], '10.00')
+
+    def test_devolucion_en_lote_invalida_el_etag(self):
+        from gestion.prestamos import ItemDevolucion, devolver_lote
+        url = reverse('api_prestamos_usuario', args=[self.usuario.id])
+        etag = self.client.get(url, {'activos': '1'})['ETag']
+        devolver_lote([ItemDevolucion(codigo=self.prestamo.codigo)])
+        response = self.client.get(url, {'activos': '1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['resultados'], [])
+
+
+    def test_cambio_de_dia_invalida_el_etag(self):
+        from unittest import mock
+        Prestamo.objects.filter(pk=self.prestamo.pk).update(fecha_max=timezone.now().date())
+        url = reverse('api_prestamos_usuario', args=[self.usuario.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['resultados'][0]['dias_retraso'], 0)
+        etag, modificado = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        manana = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=manana):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['resultados'][0]['dias_retraso'], 1)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado)
+            self.assertEqual(response.status_code, 200)
+
+
+class ApiCambiosTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        self.libro = Libro.objects.create(titulo='Libro', autor=self.autor, ejemplares=3)
+        self.usuario = UsuarioBiblioteca.objects.create(nombre='U', cedula='1714567890', email='u@test.com')
+        User.objects.create_superuser(username='admin', password='pass')
+        self.client.login(username='admin', password='pass')
+        self.url = reverse('api_cambios')
+
+    def leer(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_desde_el_cursor_solo_trae_lo_nuevo(self):
+        cursor = self.leer()['cursor']
+        self.libro.titulo = 'Nuevo'
+        self.libro.save()
+        self.libro.save()
+
+        datos = self.leer(desde=cursor)
+        self.assertEqual(len(datos['cambios']), 1)
+        cambio = datos['cambios'][0]
+        self.assertEqual((cambio['modelo'], cambio['id'], cambio['operacion']), ('libro', self.libro.id, 'guardado'))
+        self.assertEqual(cambio['datos']['titulo'], 'Nuevo')
+        self.assertEqual(self.leer(desde=datos['cursor'])['cambios'], [])
+
+    def test_rutas_masivas_y_borrados(self):
+        from gestion.prestamos import ItemDevolucion, devolver_lote
+        prestamo = Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario)
+        prestamo.generar_prestamo()
+        cursor = self.leer()['cursor']
+
+        Prestamo.objects.filter(pk=prestamo.pk).update(fecha_max=timezone.now().date() - timedelta(days=2))
+        devolver_lote([ItemDevolucion(codigo=prestamo.codigo, estado_libro='danado')])
+        cambios = {(c['modelo'], c['operacion']) for c in self.leer(desde=cursor)['cambios']}
+        self.assertEqual(cambios, {('prestamo', 'guardado'), ('libro', 'guardado'), ('multa', 'guardado')})
+
+        cursor = self.leer(desde=cursor)['cursor']
+        esperados = {('prestamo', prestamo.id)} | {('multa', i) for i in prestamo.multas.values_list('id', flat=True)}
+        prestamo.multas.all().delete()
+        prestamo.delete()
+        borrados = {(c['modelo'], c['id']) for c in self.leer(desde=cursor)['cambios'] if c['operacion'] == 'borrado'}
+        self.assertEqual(borrados, esperados)
+
+    def test_cursor_no_pasa_cambios_recientes(self):
+        from django.test import override_settings
+        from gestion import cambios
+        cursor = self.leer()['cursor']
+        Libro.objects.create(titulo='Nuevo', autor=self.autor)
+        with override_settings(GESTION_CAMBIOS={'VISIBILIDAD': 5}):
+            # Un id menor aún sin confirmar no quedaría detrás del cursor
+            datos = self.leer(desde=cursor)
+            self.assertEqual((datos['cambios'], datos['cursor'], datos['hay_mas']), ([], cursor, False))
+            lote = cambios.leer(cursor, ahora=timezone.now() + timedelta(seconds=6))
+            self.assertEqual([c.modelo for c, _ in lote.cambios], ['libro'])
+            self.assertFalse(lote.hay_mas)
+
+    def test_lotes_con_limite(self):
+        for i in range(5):
+            Libro.objects.create(titulo=f'L{i}', autor=self.autor)
+        datos = self.leer(limite=3)
+        self.assertEqual(len(datos['cambios']), 3)
+        self.assertTrue(datos['hay_mas'])
+        vistos = [c['id'] for c in datos['cambios']]
+        while datos['hay_mas']:
+            datos = self.leer(desde=datos['cursor'], limite=3)
+            vistos += [c['id'] for c in datos['cambios'] if c['modelo'] == 'libro']
+        self.assertEqual(set(Libro.objects.values_list('id', flat=True)) - set(vistos), set())
+
+    def test_compactacion_y_horizonte(self):
+        for _ in range(3):
+            self.libro.save()
+        otro = Libro.objects.create(titulo='Borrado', autor=self.autor)
+        otro.delete()
+        cursor_viejo = Cambio.objects.order_by('id').first().id
+
+        Cambio.objects.filter(borrado=True).update(fecha=timezone.now() - timedelta(days=40))
+        superados, borrados = compactar(retencion_dias=30)
+        self.assertEqual(borrados, 1)
+        self.assertEqual(Cambio.objects.filter(modelo='libro', objeto_id=self.libro.id).count(), 1)
+
+        response = self.client.get(self.url, {'desde': cursor_viejo})
+        self.assertEqual(response.status_code, 410)
+        # Desde 0 se obtiene la copia completa del estado actual
+        ids = {(c['modelo'], c['id']) for c in self.leer(desde=0)['cambios']}
+        self.assertEqual(ids, {('libro', self.libro.id), ('usuario', self.usuario.id)})
+
+    def test_requiere_permiso(self):
+        User.objects.create_user(username='lector', password='pass')
+        self.client.login(username='lector', password='pass')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
@@ -0,0 +1,53 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from gestion.models import ESTADOS_ACTIVOS, Multa, Prestamo
+from gestion.multas import prestamos_vencidos
+
+
+def plan(queryset):
+    #Filas de EXPLAIN QUERY PLAN (columna "detail") para el SQL del queryset
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [fila[-1] for fila in cursor.fetchall()]
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es específico de SQLite')
+class PlanesDeConsultaTest(TestCase):
+    """Las consultas frecuentes deben resolverse con índices y no recorriendo la tabla"""
+
+    def assertUsaIndice(self, queryset, tabla, indices):
+        detalles = [d for d in plan(queryset) if f' {tabla} ' in f' {d} ']
+        self.assertTrue(detalles, f'La consulta no accede a {tabla}')
+        for detalle in detalles:
+            # "SCAN tabla USING INDEX parcial" recorre solo el índice parcial; "SCAN tabla" recorre todo
+            self.assertNotRegex(detalle, r'^SCAN (?!.*INDEX)', f'Recorrido completo de {tabla}: {detalle}')
+        self.assertTrue(
+            any(indice in detalle for detalle in detalles for indice in indices),
+            f'{tabla} no usa {" ni ".join(indices)}: {detalles}',
+        )
+
+    def test_prestamos_vencidos(self):
+        hoy = timezone.now().date()
+        self.assertUsaIndice(prestamos_vencidos(hoy), 'gestion_prestamo', ['prestamo_estado_fmax_idx'])
+
+    def test_prestamos_activos_vencidos(self):
+        self.assertUsaIndice(Prestamo.objects.vencidos(), 'gestion_prestamo', ['prestamo_estado_fmax_idx'])
+
+    def test_prestamos_activos_de_un_libro(self):
+        activos = Prestamo.objects.filter(libro_id=1, estado__in=ESTADOS_ACTIVOS)
+        self.assertUsaIndice(activos, 'gestion_prestamo', ['prestamo_libro_estado_idx'])
+
+    def test_multa_de_un_prestamo_por_tipo(self):
+        multas = Multa.objects.filter(prestamo_id__in=[1, 2, 3], tipo='r')
+        self.assertUsaIndice(multas, 'gestion_multa', ['multa_prestamo_tipo_idx'])
+
+    def test_multas_pendientes(self):
+        self.assertUsaIndice(Multa.objects.filter(pagada=False), 'gestion_multa', ['multa_pendiente_idx'])
+
+    def test_multas_pendientes_de_un_prestamo(self):
+        pendientes = Multa.objects.filter(prestamo_id=1, pagada=False)
+        self.assertUsaIndice(pendientes, 'gestion_multa', ['multa_pendiente_idx', 'multa_prestamo_tipo_idx'])
@@ -1,11 +1,12 @@
-from django.test import TestCase
-from gestion.models import Autor, Libro, Prestamo, Editorial, Multa
+from django.test import TestCase, TransactionTestCase
+from gestion.models import Autor, Libro, Prestamo, Editorial, Multa, ESTADOS_ACTIVOS
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
 from gestion.models import UsuarioBiblioteca, validar_cedula_ecuatoriana
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
+from django.db import transaction
 from io import StringIO
 
 
@@ -284,11 +285,12 @@ class DevolucionPrestamoTest(TestCase):
         self.prestamo.fecha_max = timezone.now().date() - timedelta(days=5)
         self.prestamo.save()
         
-        self.prestamo.devolver_libro()
+        resultado = self.prestamo.devolver_libro()
         
         multa = self.prestamo.multas.filter(tipo='r').first()
         self.assertIsNotNone(multa)
         self.assertEqual(float(multa.monto), 5.0)  # $1 por día x 5 días
+        self.assertIn('Total multas: $5.00', resultado)
     
     def test_devolucion_libro_danado(self):
         #Devolución con libro dañado genera multa del 50%
@@ -542,4 +544,400 @@ class CodigosSecuencialesTest(TestCase):
             monto=5.00
         )
         
-        self.assertIn('MLT-', str(multa))
\ No newline at end of file
+        self.assertIn('MLT-', str(multa))
+
+class ContadorDisponibilidadTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.libro = Libro.objects.create(
+            titulo="Libro Test",
+            autor=self.autor,
+            ejemplares=2
+        )
+        self.usuario_bib = UsuarioBiblioteca.objects.create(
+            nombre="Test User",
+            cedula="1714567890",
+            email="test@test.com"
+        )
+
+    def test_generar_y_devolver_mantienen_contador(self):
+        prestamo = Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib)
+        prestamo.generar_prestamo()
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 1)
+        self.assertEqual(self.libro.ejemplares_disponibles, 1)
+
+        prestamo.devolver_libro()
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 0)
+
+    def test_save_de_libro_no_pisa_contador(self):
+        libro_en_memoria = Libro.objects.get(id=self.libro.id)
+        Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib, estado='p')
+        libro_en_memoria.titulo = "Otro titulo"
+        libro_en_memoria.save()
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 1)
+
+    def test_anotacion_disponibilidad(self):
+        Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib, estado='m')
+        libro = Libro.objects.con_disponibilidad().get(id=self.libro.id)
+        self.assertEqual(libro.cantidad_disponible, 1)
+        self.assertEqual(Libro.objects.disponibles().count(), 1)
+
+    def test_comando_corrige_desfase(self):
+        Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib, estado='p')
+        Libro.objects.filter(id=self.libro.id).update(ejemplares_prestados=0)
+
+        out = StringIO()
+        call_command('verificar_disponibilidad', '--corregir', stdout=out)
+
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 1)
+        self.assertIn('1 libros desfasados corregidos', out.getvalue())
+
+
+class SecuenciaCodigosTest(TestCase):
+    def test_reservar_codigos_consecutivos(self):
+        from gestion.secuencias import reservar_codigos, siguiente_codigo
+        self.assertEqual(reservar_codigos('prestamo', 'BLB', 3), ['BLB-001', 'BLB-002', 'BLB-003'])
+        self.assertEqual(siguiente_codigo('prestamo', 'BLB'), 'BLB-004')
+
+    def test_secuencia_inexistente_se_crea(self):
+        from gestion.secuencias import siguiente_codigo
+        self.assertEqual(siguiente_codigo('nueva', 'NEW'), 'NEW-001')
+        self.assertEqual(siguiente_codigo('nueva', 'NEW'), 'NEW-002')
+
+    def test_asignador_por_bloques_fuera_de_transaccion(self):
+        from gestion.secuencias import AsignadorSecuencia
+        from gestion.models import Secuencia
+        from unittest import mock
+        asignador = AsignadorSecuencia('bloques', bloque=10)
+        with mock.patch.object(asignador, '_en_transaccion', return_value=False):
+            numeros = [asignador.siguiente() for _ in range(12)]
+        self.assertEqual(numeros, list(range(1, 13)))
+        # Se reservaron dos bloques completos con solo dos UPDATE
+        self.assertEqual(Secuencia.objects.get(nombre='bloques').valor, 20)
+
+
+class ComandoVerificarPrestamosBulkTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.libro = Libro.objects.create(titulo="Libro Test", autor=self.autor, ejemplares=5)
+        self.usuario_bib = UsuarioBiblioteca.objects.create(
+            nombre="Test User",
+            cedula="1714567890",
+            email="test@test.com"
+        )
+
+    def _prestamo_vencido(self, dias):
+        from datetime import timedelta
+        return Prestamo.objects.create(
+            libro=self.libro,
+            usuario_biblioteca=self.usuario_bib,
+            fecha_max=timezone.now().date() - timedelta(days=dias),
+            estado='p'
+        )
+
+    def test_bulk_crea_y_actualiza_multas(self):
+        nuevo = self._prestamo_vencido(3)
+        con_multa = self._prestamo_vencido(5)
+        multa = Multa.objects.create(prestamo=con_multa, tipo='r', monto=3.0)
+        self._prestamo_vencido(0)  # Vence hoy, no genera multa
+
+        out = StringIO()
+        call_command('verificar_prestamos_vencidos', '--bulk', '--chunk-size', '1', stdout=out)
+
+        nuevo.refresh_from_db()
+        self.assertEqual(nuevo.estado, 'm')
+        self.assertEqual(float(nuevo.multas.get(tipo='r').monto), 3.0)
+        self.assertTrue(nuevo.multas.get(tipo='r').codigo.startswith('MLT-'))
+        multa.refresh_from_db()
+        self.assertEqual(float(multa.monto), 5.0)
+        self.assertIn('1 multas creadas', out.getvalue())
+        self.assertIn('1 multas actualizadas', out.getvalue())
+        self.assertIn('2 préstamos vencidos revisados', out.getvalue())
+        # Igual que el modo por préstamo, una línea por préstamo
+        self.assertIn(f'Nueva multa creada: Préstamo #{nuevo.id}', out.getvalue())
+        self.assertIn(f'Multa actualizada: Préstamo #{con_multa.id}', out.getvalue())
+
+        out = StringIO()
+        call_command('verificar_prestamos_vencidos', '--bulk', verbosity=0, stdout=out)
+        self.assertNotIn('Multa actualizada', out.getvalue())
+
+    def test_bulk_numero_de_consultas_no_depende_de_prestamos(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from gestion.models import MarcaEjecucion
+        MarcaEjecucion.objects.create(nombre='verificar_prestamos_vencidos', ultima_fecha=timezone.now().date())
+        consultas = []
+        for cantidad in (2, 20):
+            Multa.objects.all().delete()
+            Prestamo.objects.all().delete()
+            for _ in range(cantidad):
+                self._prestamo_vencido(2)
+            with CaptureQueriesContext(connection) as ctx:
+                call_command('verificar_prestamos_vencidos', '--bulk', stdout=StringIO())
+            consultas.append(len(ctx.captured_queries))
+        self.assertEqual(consultas[0], consultas[1])
+
+
+class VerificacionIncrementalTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.libro = Libro.objects.create(titulo="Libro Test", autor=self.autor, ejemplares=5)
+
+    def test_incremental_solo_procesa_nuevos_vencidos(self):
+        from datetime import timedelta
+        from gestion.models import MarcaEjecucion
+        hoy = timezone.now().date()
+        MarcaEjecucion.objects.create(nombre='verificar_prestamos_vencidos', ultima_fecha=hoy - timedelta(days=1))
+        antiguo = Prestamo.objects.create(libro=self.libro, fecha_max=hoy - timedelta(days=10), estado='p')
+        nuevo = Prestamo.objects.create(libro=self.libro, fecha_max=hoy - timedelta(days=1), estado='p')
+
+        out = StringIO()
+        call_command('verificar_prestamos_vencidos', '--incremental', stdout=out)
+
+        self.assertFalse(antiguo.multas.exists())
+        self.assertEqual(nuevo.multas.count(), 1)
+        self.assertIn('1 préstamos vencidos revisados', out.getvalue())
+        self.assertEqual(MarcaEjecucion.objects.get().ultima_fecha, hoy)
+
+    def test_monto_vigente_se_calcula_desde_fecha_max(self):
+        from datetime import timedelta
+        prestamo = Prestamo.objects.create(
+            libro=self.libro,
+            fecha_max=timezone.now().date() - timedelta(days=4),
+            estado='m'
+        )
+        multa = Multa.objects.create(prestamo=prestamo, tipo='r', monto=1.0)
+        self.assertEqual(float(multa.monto_vigente), 4.0)
+
+        prestamo.estado = 'd'
+        self.assertEqual(float(multa.monto_vigente), 1.0)
+
+
+class SeedBibliotecaTest(TestCase):
+    def sembrar(self, **opciones):
+        call_command(
+            'seed_biblioteca', autores=5, editoriales=2, libros=20, usuarios=10,
+            prestamos=200, batch_size=50, stdout=StringIO(), **opciones,
+        )
+
+    def filas(self):
+        return (
+            list(UsuarioBiblioteca.objects.order_by('id').values_list('cedula', 'nombre')),
+            list(Libro.objects.order_by('id').values_list('titulo', 'isbn', 'ejemplares')),
+            list(Prestamo.objects.order_by('id').values_list(
+                'codigo', 'libro__titulo', 'usuario_biblioteca__cedula',
+                'fecha_prestamos', 'fecha_max', 'fecha_devolucion', 'estado',
+            )),
+            list(Multa.objects.order_by('id').values_list('codigo', 'prestamo__codigo', 'tipo', 'monto', 'fecha')),
+        )
+
+    def test_misma_semilla_mismos_datos(self):
+        # Cada corrida parte de la base vacía: la primera se revierte al terminar
+        with transaction.atomic():
+            self.sembrar(semilla=7)
+            primera = self.filas()
+            transaction.set_rollback(True)
+        self.assertFalse(Prestamo.objects.exists())
+        self.sembrar(semilla=7)
+        self.assertEqual(self.filas(), primera)
+        self.assertTrue(primera[3])
+
+    def test_tasa_vencidos_es_fraccion_de_los_activos(self):
+        call_command(
+            'seed_biblioteca', autores=5, editoriales=2, libros=1000, usuarios=50,
+            prestamos=2000, dias=60, tasa_vencidos=0.5, batch_size=1000, stdout=StringIO(),
+        )
+        activos = Prestamo.objects.filter(estado__in=ESTADOS_ACTIVOS)
+        fraccion = activos.filter(estado='m').count() / activos.count()
+        self.assertAlmostEqual(fraccion, 0.5, delta=0.1)
+
+    def test_seed_genera_datos_validos(self):
+        self.sembrar()
+        self.assertEqual(Libro.objects.count(), 20)
+        self.assertEqual(Prestamo.objects.count(), 200)
+        for cedula in UsuarioBiblioteca.objects.values_list('cedula', flat=True):
+            validar_cedula_ecuatoriana(cedula)
+        # El contador de ejemplares coincide con los préstamos activos generados
+        out = StringIO()
+        call_command('verificar_disponibilidad', stdout=out)
+        self.assertIn('0 libros desfasados', out.getvalue())
+        # Los códigos siguen la secuencia
+        prestamo = Prestamo.objects.create(libro=Libro.objects.first())
+        self.assertEqual(prestamo.codigo, 'BLB-201')
+
+
+class BenchmarkBibliotecaTest(TestCase):
+    def test_benchmark_devuelve_json_y_no_modifica_datos(self):
+        import json
+        call_command('seed_biblioteca', autores=2, editoriales=1, libros=10, usuarios=3, prestamos=0, stdout=StringIO())
+        out = StringIO()
+        call_command(
+            'benchmark_biblioteca', 'generar_prestamo', 'devolver_libro_danado', 'lista_libros',
+            operaciones=3, stdout=out, stderr=StringIO(),
+        )
+        informe = json.loads(out.getvalue())
+        medicion = informe['resultados']['generar_prestamo']
+        self.assertEqual(medicion['operaciones'], 3)
+        self.assertGreater(medicion['consultas'], 0)
+        self.assertGreater(medicion['memoria_pico_kb'], 0)
+        # Todo se ejecuta en transacciones revertidas
+        self.assertFalse(Prestamo.objects.exists())
+        self.assertFalse(Multa.objects.exists())
+
+    def test_compara_contra_baseline(self):
+        from gestion.benchmarks import comparar
+        baseline = {'caso': {'segundos': 1.0, 'consultas': 10}}
+        self.assertEqual(comparar({'caso': {'segundos': 1.1, 'consultas': 10}}, baseline, 0.2), [])
+        regresiones = comparar({'caso': {'segundos': 1.5, 'consultas': 12}}, baseline, 0.2)
+        self.assertEqual(len(regresiones), 2)
+
+
+class PrestamoConcurrenteTest(TransactionTestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.libro = Libro.objects.create(titulo="Concurrido", autor=self.autor, ejemplares=5)
+        self.usuario_bib = UsuarioBiblioteca.objects.create(
+            nombre="Test User", cedula="1714567890", email="test@test.com"
+        )
+
+    def test_hilos_no_prestan_ejemplares_de_mas(self):
+        from gestion.benchmarks import estresar_prestamos
+        prestamos = [
+            Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib) for _ in range(40)
+        ]
+        resultado = estresar_prestamos(self.libro, prestamos, hilos=8)
+
+        self.assertEqual(resultado.errores, [])
+        self.assertEqual(resultado.sobreprestados, 0)
+        self.assertEqual(resultado.prestados, 5)
+        self.assertEqual(resultado.rechazados, 35)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 5)
+        self.assertFalse(self.libro.disponible)
+
+    def test_mismo_borrador_se_activa_una_sola_vez(self):
+        prestamo = Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario_bib)
+        copia = Prestamo.objects.get(pk=prestamo.pk)
+        prestamo.generar_prestamo()
+        # La copia en memoria sigue en Borrador, pero el UPDATE condicional la rechaza
+        with self.assertRaises(ValidationError):
+            copia.generar_prestamo()
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.ejemplares_prestados, 1)
+
+    def test_benchmark_codigos_no_consume_la_secuencia_real(self):
+        out = StringIO()
+        call_command('benchmark_codigos', hilos=1, por_hilo=10, stdout=out)
+        self.assertIn('10 préstamos insertados', out.getvalue())
+        self.assertIn('0 códigos duplicados', out.getvalue())
+        self.assertEqual(Prestamo.objects.create(libro=self.libro).codigo, 'BLB-001')
+
+
+class DevolucionLoteTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.usuario_bib = UsuarioBiblioteca.objects.create(
+            nombre="Test User", cedula="1714567890", email="test@test.com"
+        )
+        self.hace_3 = timezone.now().date() - timedelta(days=3)
+        self.prestamos = []
+        for i in range(4):
+            libro = Libro.objects.create(titulo=f"Libro {i}", autor=self.autor, isbn=f"97800000000{i:02d}", costo=20)
+            prestamo = Prestamo.objects.create(libro=libro, usuario_biblioteca=self.usuario_bib)
+            prestamo.generar_prestamo()
+            self.prestamos.append(prestamo)
+        # Los dos últimos están vencidos hace 3 días y uno ya tiene multa de retraso
+        Prestamo.objects.filter(pk__in=[p.pk for p in self.prestamos[2:]]).update(fecha_max=self.hace_3, estado='m')
+        Multa.objects.create(prestamo=self.prestamos[3], tipo='r', monto=1)
+
+    def test_lote_aplica_las_mismas_multas_que_devolver_libro(self):
+        from decimal import Decimal
+        from gestion.prestamos import ItemDevolucion, devolver_lote
+        p = self.prestamos
+        resultados = devolver_lote([
+            ItemDevolucion(codigo=p[0].codigo),
+            ItemDevolucion(codigo=p[1].codigo, estado_libro='danado'),
+            ItemDevolucion(isbn=p[2].libro.isbn, cedula='1714567890', estado_libro='danado'),
+            ItemDevolucion(codigo=p[3].codigo, estado_libro='perdido'),
+            ItemDevolucion(codigo=p[0].codigo),
+            ItemDevolucion(codigo='BLB-999'),
+        ])
+
+        self.assertEqual([r.ok for r in resultados], [True, True, True, True, False, False])
+        self.assertEqual([r.total_multas for r in resultados[:4]], [Decimal('0'), Decimal('10'), Decimal('13'), Decimal('40')])
+        self.assertEqual(resultados[4].detalle, 'Préstamo repetido en el lote')
+        self.assertEqual(resultados[5].detalle, 'Préstamo no encontrado')
+
+        self.assertFalse(Prestamo.objects.filter(pk__in=[x.pk for x in p]).exclude(estado='d').exists())
+        self.assertEqual(sorted(p[2].multas.values_list('tipo', flat=True)), ['d', 'r'])
+        # La pérdida reemplaza la multa de retraso anterior
+        self.assertEqual(list(p[3].multas.values_list('tipo', 'monto')), [('p', Decimal('40.00'))])
+        self.assertFalse(Libro.objects.filter(ejemplares_prestados__gt=0).exists())
+        self.assertTrue(Multa.objects.exclude(codigo='').filter(prestamo=p[1]).exists())
+
+    def test_comando_y_api(self):
+        import json
+        import tempfile
+        from django.contrib.auth.models import Permission
+        p = self.prestamos
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(f'{p[0].codigo}\n{p[1].libro.isbn},1714567890,danado\n')
+        out = StringIO()
+        call_command('devolver_lote', f.name, stdout=out)
+        self.assertIn('2 préstamos devueltos', out.getvalue())
+
+        user = User.objects.create_user(username='bib', password='pass')
+        user.user_permissions.add(Permission.objects.get(codename='gestionar_prestamos'))
+        self.client.login(username='bib', password='pass')
+        response = self.client.post(
+            reverse('devolver_lote'),
+            json.dumps({'items': [{'codigo': p[2].codigo}, {'codigo': p[0].codigo}]}),
+            content_type='application/json',
+        )
+        datos = response.json()
+        self.assertEqual((datos['devueltos'], datos['errores']), (1, 1))
+        self.assertEqual(datos['resultados'][0]['total_multas'], '3.00')
+
+
+class RetrasoAnotadoTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        self.autor = Autor.objects.create(nombre="Test", apellido="Autor")
+        self.libro = Libro.objects.create(titulo="Libro", autor=self.autor, ejemplares=10)
+        hoy = timezone.now().date()
+        self.al_dia = Prestamo.objects.create(libro=self.libro, estado='p', fecha_max=hoy + timedelta(days=2))
+        self.vencido = Prestamo.objects.create(libro=self.libro, estado='m', fecha_max=hoy - timedelta(days=5))
+        self.devuelto = Prestamo.objects.create(
+            libro=self.libro, estado='d', fecha_max=hoy - timedelta(days=10), fecha_devolucion=hoy - timedelta(days=7)
+        )
+        Multa.objects.create(prestamo=self.vencido, tipo='r', monto=2)
+        Multa.objects.create(prestamo=self.vencido, tipo='d', monto=10)
+
+    def test_anotaciones_coinciden_con_las_propiedades(self):
+        from decimal import Decimal
+        prestamos = {p.pk: p for p in Prestamo.objects.con_retraso()}
+        for original in (self.al_dia, self.vencido, self.devuelto):
+            self.assertEqual(prestamos[original.pk].dias_retraso, Prestamo.objects.get(pk=original.pk).dias_retraso)
+        self.assertEqual(prestamos[self.vencido.pk].dias_retraso, 5)
+        self.assertEqual(prestamos[self.devuelto.pk].dias_retraso, 3)
+        self.assertEqual(prestamos[self.vencido.pk].multa_proyectada, Decimal('5.00'))
+        # Los préstamos devueltos no proyectan multa
+        self.assertEqual(prestamos[self.devuelto.pk].multa_proyectada, Decimal('0'))
+        # Montos vigentes: la multa por retraso guardada en 2 ya vale 5 días
+        self.assertEqual(prestamos[self.vencido.pk].total_multas, Decimal('15'))
+        self.assertEqual(prestamos[self.vencido.pk].multas_retraso, Decimal('5'))
+        self.assertEqual(prestamos[self.al_dia.pk].total_multas, Decimal('0'))
+
+        for multa in Multa.objects.con_monto_vigente():
+            self.assertEqual(multa.monto_actual, Multa.objects.get(pk=multa.pk).monto_vigente)
+
+    def test_filtrar_y_ordenar_por_retraso(self):
+        ordenados = Prestamo.objects.con_retraso().order_by('-dias_retraso').values_list('pk', flat=True)
+        self.assertEqual(list(ordenados), [self.vencido.pk, self.devuelto.pk, self.al_dia.pk])
+        self.assertEqual(list(Prestamo.objects.con_retraso().vencidos()), [self.vencido])
+        self.assertEqual(Prestamo.objects.con_retraso().filter(dias_retraso__gte=4).count(), 1)
@@ -0,0 +1,163 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from gestion import notificaciones
+from gestion.models import Autor, Libro, Multa, NotificacionMulta, Prestamo, UsuarioBiblioteca
+
+
+class BackendContador(locmem.EmailBackend):
+    """locmem que cuenta las conexiones abiertas y puede fallar con ciertos destinatarios"""
+    aperturas = 0
+    rechazados = set()
+
+    def open(self):
+        BackendContador.aperturas += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        #Como SMTP: entrega en orden y falla recién al llegar a un rechazado
+        enviados = 0
+        for mensaje in messages:
+            if set(mensaje.to) & self.rechazados:
+                raise ConnectionError('SMTP no disponible')
+            enviados += super().send_messages([mensaje])
+        return enviados
+
+
+@override_settings(EMAIL_BACKEND='gestion.test.test_notificaciones.BackendContador')
+class NotificacionesMultaTest(TestCase):
+    def setUp(self):
+        BackendContador.aperturas = 0
+        BackendContador.rechazados = set()
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        libro = Libro.objects.create(titulo='Libro', autor=autor, ejemplares=10)
+        self.prestamos = []
+        for i, cedula in enumerate(['1714567890', '0102030405', '0912345675']):
+            usuario = UsuarioBiblioteca.objects.create(nombre=f'U{i}', cedula=cedula, email=f'u{i}@test.com')
+            prestamo = Prestamo.objects.create(libro=libro, usuario_biblioteca=usuario, estado='m')
+            Multa.objects.create(prestamo=prestamo, tipo='r', monto=3)
+            self.prestamos.append(prestamo)
+
+    def test_lote_por_una_sola_conexion(self):
+        self.assertEqual(notificaciones.encolar_multados(), 3)
+        resultado = notificaciones.procesar_pendientes()
+
+        self.assertEqual(resultado.enviadas, 3)
+        self.assertEqual(BackendContador.aperturas, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['u0@test.com', 'u1@test.com', 'u2@test.com'])
+        self.assertIn('Total de multas: $3.00', mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].alternatives[0].mimetype, 'text/html')
+        self.assertEqual(NotificacionMulta.objects.filter(estado='v').count(), 3)
+
+    def test_una_por_prestamo_y_dia(self):
+        prestamo = self.prestamos[0]
+        self.assertEqual(notificaciones.encolar([prestamo.id]), 1)
+        self.assertEqual(notificaciones.encolar([prestamo.id]), 0)
+        self.assertEqual(notificaciones.encolar_multados(), 2)
+        manana = timezone.now().date() + timedelta(days=1)
+        self.assertEqual(notificaciones.encolar([prestamo.id], fecha=manana), 1)
+
+    def test_reintento_con_espera(self):
+        notificaciones.encolar_multados()
+        BackendContador.rechazados = {'u1@test.com'}
+        resultado = notificaciones.procesar_pendientes()
+        self.assertEqual((resultado.enviadas, resultado.reintentos), (2, 1))
+
+        pendiente = NotificacionMulta.objects.get(prestamo=self.prestamos[1])
+        self.assertEqual((pendiente.estado, pendiente.intentos), ('p', 1))
+        self.assertGreater(pendiente.proximo_intento, timezone.now())
+        # Antes de la espera no se vuelve a intentar
+        self.assertEqual(notificaciones.procesar_pendientes().procesadas, 0)
+
+        BackendContador.rechazados = set()
+        resultado = notificaciones.procesar_pendientes(ahora=pendiente.proximo_intento)
+        self.assertEqual(resultado.enviadas, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_reclamo_no_repite_filas(self):
+        notificaciones.encolar_multados()
+        primeras = notificaciones.reclamar(lote=2)
+        segundas = notificaciones.reclamar(lote=2)
+        self.assertEqual(len(primeras), 2)
+        self.assertEqual([n.prestamo_id for n in segundas], [self.prestamos[2].id])
+        # Un lote abandonado se retoma al vencer el plazo
+        vencido = timezone.now() + timedelta(seconds=notificaciones.configuracion()['PLAZO_ENVIO'] + 1)
+        self.assertEqual(len(notificaciones.reclamar(ahora=vencido)), 3)
+
+    def test_multa_pagada_se_descarta(self):
+        notificaciones.encolar([self.prestamos[0].id])
+        Multa.objects.filter(prestamo=self.prestamos[0]).update(pagada=True)
+        resultado = notificaciones.procesar_pendientes()
+        self.assertEqual(resultado.descartadas, 1)
+        self.assertEqual(mail.outbox, [])
+
+    def test_vistas_solo_encolan(self):
+        User.objects.create_superuser(username='admin', password='pass')
+        self.client.login(username='admin', password='pass')
+        self.client.get(reverse('enviar_correo_multa', args=[self.prestamos[0].id]))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(NotificacionMulta.objects.count(), 1)
+
+        self.client.post(reverse('notificar_multados'))
+        self.assertEqual(NotificacionMulta.objects.filter(estado='p').count(), 3)
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(EMAIL_BACKEND='gestion.test.test_notificaciones.BackendContador')
+class ResumenMultasTest(TestCase):
+    def setUp(self):
+        BackendContador.aperturas = 0
+        BackendContador.rechazados = set()
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        libro = Libro.objects.create(titulo='Libro', autor=autor, ejemplares=10)
+        self.ana = UsuarioBiblioteca.objects.create(nombre="Ana O'Neil", cedula='1714567890', email='ana@test.com')
+        self.luis = UsuarioBiblioteca.objects.create(nombre='Luis', cedula='0102030405', email='luis@test.com')
+        sin_email = UsuarioBiblioteca.objects.create(nombre='Sin', cedula='0912345675', email='')
+        for usuario, montos in ((self.ana, [2, 3, 5]), (self.luis, [4]), (sin_email, [1])):
+            for monto in montos:
+                prestamo = Prestamo.objects.create(libro=libro, usuario_biblioteca=usuario, estado='d')
+                Multa.objects.create(prestamo=prestamo, tipo='d', monto=monto)
+        Multa.objects.create(prestamo=prestamo, tipo='p', monto=50, pagada=True)
+        # Préstamo sin usuario: no genera resumen
+        Multa.objects.create(prestamo=Prestamo.objects.create(libro=libro, estado='d'), tipo='d', monto=7)
+
+    def test_un_correo_por_usuario(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = notificaciones.enviar_resumenes()
+        self.assertEqual(resultado.enviadas, 2)
+        self.assertEqual(BackendContador.aperturas, 1)
+        # Una sola consulta de multas para todos los usuarios
+        self.assertEqual(len([q for q in consultas if 'gestion_multa' in q['sql']]), 1)
+
+        correos = {m.to[0]: m for m in mail.outbox}
+        self.assertEqual(set(correos), {'ana@test.com', 'luis@test.com'})
+        self.assertIn("Ana O'Neil", correos['ana@test.com'].body)
+        self.assertIn('Total a pagar: $10.00', correos['ana@test.com'].body)
+        self.assertEqual(correos['ana@test.com'].body.count('Deterioro $'), 3)
+        self.assertIn('Total a pagar: $4.00', correos['luis@test.com'].body)
+
+    def test_una_vez_por_dia(self):
+        notificaciones.enviar_resumenes()
+        self.assertIsNone(notificaciones.enviar_resumenes())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(notificaciones.enviar_resumenes(forzar=True).enviadas, 2)
+
+    def test_un_rechazo_no_detiene_el_lote(self):
+        BackendContador.rechazados = {'ana@test.com'}
+        resultado = notificaciones.enviar_resumenes()
+        self.assertEqual((resultado.enviadas, resultado.fallidas), (1, 1))
+        self.assertEqual([m.to[0] for m in mail.outbox], ['luis@test.com'])
+
+    def test_fallo_a_mitad_no_duplica(self):
+        # Ana (primera) se entrega y Luis falla: Ana no debe recibir el resumen dos veces
+        BackendContador.rechazados = {'luis@test.com'}
+        resultado = notificaciones.enviar_resumenes()
+        self.assertEqual((resultado.enviadas, resultado.fallidas), (1, 1))
+        self.assertEqual([m.to[0] for m in mail.outbox], ['ana@test.com'])
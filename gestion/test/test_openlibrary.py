@@ -0,0 +1,246 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from gestion.models import RespuestaOpenLibrary, Tarea
+from gestion.openlibrary import CacheOpenLibrary, ErrorOpenLibrary, abuscar
+
+DOC = {'title': 'Fundacion', 'author_name': ['Isaac Asimov'], 'isbn': ['9780553293357']}
+
+
+class TransporteFalso:
+    def __init__(self, datos=None):
+        self.datos = datos or {'docs': [DOC]}
+        self.llamadas = []
+        self.caido = False
+
+    def __call__(self, url, params, timeout):
+        self.llamadas.append((url, params))
+        if self.caido:
+            raise ConnectionError('sin conexión')
+        return self.datos
+
+
+class CacheOpenLibraryTest(TestCase):
+    def setUp(self):
+        self.transporte = TransporteFalso()
+        self.cache = CacheOpenLibrary(transporte=self.transporte)
+
+    def test_consulta_repetida_no_llama_al_servidor(self):
+        self.cache.buscar('title', 'Fundacion')
+        self.cache.buscar('title', '  fundacion ')
+        self.assertEqual(len(self.transporte.llamadas), 1)
+        self.assertEqual(self.cache.stats['aciertos_memoria'], 1)
+        self.assertEqual(self.cache.stats['fallos'], 1)
+
+    def test_isbn_de_una_busqueda_previa_no_llama_al_servidor(self):
+        self.cache.buscar('title', 'Fundacion')
+        docs = self.cache.buscar_isbn('9780553293357')
+        self.assertEqual(docs[0]['title'], 'Fundacion')
+        self.assertEqual(len(self.transporte.llamadas), 1)
+
+    def test_nivel_persistente_entre_procesos(self):
+        self.cache.buscar('author', 'Asimov')
+        otro_proceso = CacheOpenLibrary(transporte=self.transporte)
+        otro_proceso.buscar('author', 'Asimov')
+        self.assertEqual(len(self.transporte.llamadas), 1)
+        self.assertEqual(otro_proceso.stats['aciertos_bd'], 1)
+
+    def test_respuesta_vencida_si_el_servidor_no_responde(self):
+        cache = CacheOpenLibrary(transporte=self.transporte, TTL=0)
+        cache.buscar('title', 'Fundacion')
+        self.transporte.caido = True
+        docs = cache.buscar('title', 'Fundacion')
+        self.assertEqual(docs[0]['title'], 'Fundacion')
+        self.assertEqual(cache.stats['obsoletas'], 1)
+
+    def test_error_sin_respuesta_guardada(self):
+        self.transporte.caido = True
+        with self.assertRaises(ErrorOpenLibrary):
+            self.cache.buscar('title', 'Nada')
+
+    def test_desalojo_por_tamano(self):
+        cache = CacheOpenLibrary(transporte=self.transporte, MAX_MEMORIA=2, MAX_PERSISTENTE=2, DESALOJO_CADA=1)
+        for texto in ('a', 'b', 'c'):
+            cache.buscar('title', texto)
+        self.assertEqual(cache.estadisticas()['en_memoria'], 2)
+        self.assertEqual(RespuestaOpenLibrary.objects.count(), 2)
+
+    def test_desalojo_cada_n_respuestas_nuevas(self):
+        cache = CacheOpenLibrary(transporte=self.transporte, MAX_PERSISTENTE=2, DESALOJO_CADA=3)
+        with mock.patch.object(cache, '_desalojar_bd', wraps=cache._desalojar_bd) as desalojar:
+            for texto in ('a', 'b', 'c', 'd', 'e'):
+                cache.buscar('title', texto)
+            self.assertEqual(desalojar.call_count, 1)
+            self.assertEqual(RespuestaOpenLibrary.objects.count(), 4)
+            # Refrescar una respuesta ya guardada no cuenta como nueva
+            cache.limpiar_memoria()
+            RespuestaOpenLibrary.objects.update(actualizado='2000-01-01T00:00:00Z')
+            cache.buscar('title', 'd')
+            self.assertEqual(desalojar.call_count, 1)
+
+    def test_estadisticas_desde_varios_hilos(self):
+        cache = CacheOpenLibrary(transporte=self.transporte)
+        cache.buscar('title', 'Fundacion')
+
+        def consultar():
+            for _ in range(2000):
+                cache.buscar('title', 'Fundacion')
+
+        hilos = [threading.Thread(target=consultar) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(cache.estadisticas()['aciertos_memoria'], 16000)
+
+
+class ServidorLocalTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                cuerpo = json.dumps({'docs': [DOC]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        cls.servidor = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def test_transporte_http_real(self):
+        host, puerto = self.servidor.server_address
+        cache = CacheOpenLibrary(URL_BASE=f'http://{host}:{puerto}')
+        docs = cache.buscar_isbn('9780553293357')
+        self.assertEqual(docs[0]['author_name'], ['Isaac Asimov'])
+
+
+class ImportacionMasivaTest(TestCase):
+    def test_leer_isbns(self):
+        from gestion.importacion import leer_isbns
+        contenido = b'isbn\n978-0553293357\n0439139597; 9780553293357\n'
+        self.assertEqual(leer_isbns(contenido), ['ISBN', '9780553293357', '0439139597'])
+
+    def test_importar_isbns_reporte_por_isbn(self):
+        from gestion.importacion import importar_isbns
+        from gestion.models import Autor, Libro
+        Libro.objects.create(titulo="Existente", autor=Autor.objects.create(nombre="A", apellido="B"), isbn="9780439139595")
+
+        def transporte(url, params, timeout):
+            if params['isbn'] == '0000000000':
+                return {'docs': []}
+            return {'docs': [{
+                'title': f"Libro {params['isbn']}",
+                'author_name': ['Isaac Asimov'],
+                'publisher': ['Bantam'],
+                'first_publish_year': 1951,
+            }]}
+
+        resultados = importar_isbns(
+            ['9780553293357', '9780553293364', '9780439139595', '0000000000', 'abc'],
+            workers=2, batch_size=1, transporte=transporte,
+        )
+        self.assertEqual(
+            [r.estado for r in resultados],
+            ['importado', 'importado', 'existente', 'no_encontrado', 'invalido'],
+        )
+        # Un solo autor y una sola editorial para ambos libros
+        libros = Libro.objects.filter(isbn__in=['9780553293357', '9780553293364'])
+        self.assertEqual({l.autor_id for l in libros}, {Autor.objects.get(apellido='Asimov').id})
+        self.assertEqual(libros.first().editorial.nombre, 'Bantam')
+
+    def test_autor_vacio_usa_el_autor_por_defecto(self):
+        from gestion.importacion import importar_isbns, importar_libro
+        from gestion.models import Autor, Libro
+        autor = Autor.objects.create(nombre="Anónimo", apellido="")
+
+        def transporte(url, params, timeout):
+            nombre = '   ' if params['isbn'] == '9780553293357' else 'Isaac Asimov'
+            return {'docs': [{'title': f"Libro {params['isbn']}", 'author_name': [nombre]}]}
+
+        resultados = importar_isbns(['9780553293357', '9780553293364'], workers=1, transporte=transporte)
+        self.assertEqual([r.estado for r in resultados], ['importado', 'importado'])
+        self.assertEqual(Libro.objects.get(isbn='9780553293357').autor, autor)
+
+        cliente = mock.Mock(buscar_isbn=mock.Mock(return_value=[{'title': 'Otro', 'author_name': ['']}]))
+        self.assertEqual(importar_libro('9780439139595', cliente=cliente).estado, 'importado')
+        self.assertEqual(Libro.objects.get(isbn='9780439139595').autor, autor)
+
+
+class ClienteLento:
+    """Cliente de OpenLibrary que tarda ``demora`` segundos o hasta que se libere"""
+    def __init__(self, demora=0):
+        self.demora = demora
+        self.liberar = threading.Event()
+        self.llamadas = 0
+
+    def buscar(self, campo, texto, limite=10):
+        self.llamadas += 1
+        self.liberar.wait(self.demora)
+        return [DOC]
+
+
+class VistasAsyncTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='bibliotecario', password='pass')
+        self.cliente = ClienteLento()
+        parche = mock.patch('gestion.openlibrary.obtener_cliente', return_value=self.cliente)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.addCleanup(self.cliente.liberar.set)
+
+    async def test_busqueda_async(self):
+        from gestion.metricas import registro
+        registro.reiniciar()
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.post(
+            reverse('importar_libros'), {'buscar_por': 'titulo', 'texto_busqueda': 'Fundacion'}
+        )
+        self.assertContains(respuesta, 'Fundacion')
+        # Las consultas de sesión y usuario corren en otro hilo y también se cuentan
+        self.assertGreater(registro.resumen()['importar_libros']['consultas']['max'], 0)
+
+    @override_settings(GESTION_OPENLIBRARY={'ESPERA_ASYNC': 0.2})
+    async def test_upstream_lento_no_bloquea_la_vista(self):
+        self.cliente.demora = 5
+        await self.async_client.aforce_login(self.usuario)
+        inicio = time.perf_counter()
+        respuesta = await self.async_client.post(
+            reverse('importar_libros'), {'buscar_por': 'titulo', 'texto_busqueda': 'Fundacion'}
+        )
+        self.assertLess(time.perf_counter() - inicio, 2)
+        self.assertContains(respuesta, 'no respondió a tiempo')
+
+    async def test_consultas_concurrentes(self):
+        self.cliente.demora = 0.2
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(abuscar('title', f'libro {i}') for i in range(50)))
+        # 50 consultas de 0.2 s en serie tardarían 10 s
+        self.assertLess(time.perf_counter() - inicio, 3)
+        self.assertEqual(len(resultados), 50)
+
+    async def test_importar_seleccionado_encola(self):
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.get(reverse('importar_libro_seleccionado', args=['9780553293357']))
+        tarea = await Tarea.objects.aget()
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual((tarea.tipo, tarea.usuario_id), ('importar_libro', self.usuario.id))
+        self.assertEqual(self.cliente.llamadas, 0)
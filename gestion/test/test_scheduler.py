@@ -0,0 +1,102 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from gestion import liderazgo, scheduler
+from gestion.models import Liderazgo
+
+
+class SchedulerFalso:
+    """Registra start/shutdown sin crear hilos"""
+    def __init__(self):
+        self.iniciado = False
+
+    def start(self):
+        self.iniciado = True
+
+    def shutdown(self, wait=True):
+        self.iniciado = False
+
+
+class LiderazgoTest(TestCase):
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.duracion = timedelta(seconds=liderazgo.configuracion()['DURACION'])
+
+    def test_un_solo_lider(self):
+        self.assertTrue(liderazgo.adquirir('tarea', 'a', self.ahora))
+        self.assertFalse(liderazgo.adquirir('tarea', 'b', self.ahora))
+        # Renovar extiende la concesión
+        self.assertTrue(liderazgo.adquirir('tarea', 'a', self.ahora + timedelta(seconds=5)))
+        self.assertEqual(Liderazgo.objects.get(nombre='tarea').vence, self.ahora + timedelta(seconds=5) + self.duracion)
+        self.assertFalse(liderazgo.adquirir('tarea', 'b', self.ahora + self.duracion))
+
+    def test_relevo_al_vencer(self):
+        liderazgo.adquirir('tarea', 'a', self.ahora)
+        despues = self.ahora + self.duracion
+        self.assertTrue(liderazgo.adquirir('tarea', 'b', despues))
+        # El líder anterior ya no puede renovar
+        self.assertFalse(liderazgo.adquirir('tarea', 'a', despues))
+        self.assertFalse(liderazgo.es_lider('tarea', 'a', despues))
+        self.assertTrue(liderazgo.es_lider('tarea', 'b', despues))
+
+    def test_liberar(self):
+        liderazgo.adquirir('tarea', 'a', self.ahora)
+        self.assertFalse(liderazgo.liberar('tarea', 'b'))
+        self.assertTrue(liderazgo.liberar('tarea', 'a'))
+        self.assertTrue(liderazgo.adquirir('tarea', 'b'))
+
+
+class CoordinadorTest(TestCase):
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.a = scheduler.Coordinador('a', crear=SchedulerFalso)
+        self.b = scheduler.Coordinador('b', crear=SchedulerFalso)
+        # El titular del proceso es global al módulo: cada test parte sin él
+        parche = mock.patch.object(scheduler, '_titular', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_solo_el_lider_inicia_el_scheduler(self):
+        self.assertTrue(self.a.latido(self.ahora))
+        self.assertFalse(self.b.latido(self.ahora))
+        self.assertTrue(self.a.scheduler.iniciado)
+        self.assertIsNone(self.b.scheduler)
+
+    def test_relevo_detiene_al_lider_anterior(self):
+        self.a.latido(self.ahora)
+        # "a" deja de latir (proceso colgado) y vence la concesión
+        despues = self.ahora + timedelta(seconds=liderazgo.configuracion()['DURACION'])
+        self.assertTrue(self.b.latido(despues))
+        self.assertTrue(self.b.scheduler.iniciado)
+        anterior = self.a.scheduler
+        self.assertFalse(self.a.latido(despues))
+        self.assertFalse(anterior.iniciado)
+        self.assertIsNone(self.a.scheduler)
+
+    def test_soltar_cede_el_liderazgo(self):
+        self.a.latido()
+        self.a.soltar()
+        self.assertIsNone(self.a.scheduler)
+        self.assertTrue(self.b.latido())
+
+    def test_job_omitido_sin_liderazgo(self):
+        with mock.patch.object(scheduler, 'call_command') as comando:
+            # Ningún coordinador arrancó el scheduler en este proceso
+            scheduler.enviar_notificaciones_job()
+            self.assertFalse(comando.called)
+            self.a.latido()
+            scheduler.enviar_notificaciones_job()
+            comando.assert_called_once_with('enviar_notificaciones')
+            # Perdida la concesión, el job se omite aunque el scheduler siga vivo
+            liderazgo.liberar(scheduler.NOMBRE, 'a')
+            scheduler.enviar_notificaciones_job()
+            comando.assert_called_once()
+
+    def test_titular_distinto_por_coordinador(self):
+        # Dos procesos que heredan el módulo ya importado no comparten identidad
+        with mock.patch.object(liderazgo, 'titular_local', side_effect=['host:1:x', 'host:2:y']):
+            self.assertNotEqual(scheduler.Coordinador(crear=SchedulerFalso).titular,
+                                scheduler.Coordinador(crear=SchedulerFalso).titular)
+        self.assertFalse(hasattr(scheduler, 'TITULAR'))
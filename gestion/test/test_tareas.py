@@ -0,0 +1,155 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from gestion import tareas
+from gestion.models import Autor, Libro, Prestamo, Tarea, UsuarioBiblioteca
+from gestion.openlibrary import ErrorOpenLibrary
+
+DOC = {'title': 'Fundacion', 'author_name': ['Isaac Asimov'], 'publisher': ['Bantam'], 'first_publish_year': 1951}
+
+
+class ClienteFalso:
+    def __init__(self, docs=None, caido=False):
+        self.docs = [DOC] if docs is None else docs
+        self.caido = caido
+        self.llamadas = 0
+
+    def buscar_isbn(self, isbn):
+        self.llamadas += 1
+        if self.caido:
+            raise ErrorOpenLibrary('sin conexión')
+        return self.docs
+
+
+class ColaTareasTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='bibliotecario', password='pass')
+        self.client.login(username='bibliotecario', password='pass')
+        self.cliente = ClienteFalso()
+        parche = mock.patch('gestion.importacion.obtener_cliente', return_value=self.cliente)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_la_vista_solo_encola(self):
+        url = reverse('importar_libro_seleccionado', args=['9780553293357'])
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(self.cliente.llamadas, 0)
+        self.assertEqual([q['sql'].split()[0] for q in consultas if 'gestion_tarea' in q['sql']], ['INSERT'])
+        tarea = Tarea.objects.get()
+        self.assertRedirects(respuesta, f"{reverse('importar_libros')}?tarea={tarea.id}")
+        self.assertEqual((tarea.tipo, tarea.argumentos, tarea.usuario), ('importar_libro', {'isbn': '9780553293357'}, self.usuario))
+
+        self.assertEqual(tareas.procesar(), 1)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'c')
+        self.assertTrue(Libro.objects.filter(isbn='9780553293357', autor__apellido='Asimov').exists())
+
+        estado = self.client.get(reverse('estado_tarea', args=[tarea.id])).json()
+        self.assertTrue(estado['terminada'])
+        self.assertIn('importado exitosamente', estado['mensaje'])
+
+    def test_reintento_con_espera_y_fallo_final(self):
+        self.cliente.caido = True
+        tarea = tareas.encolar('importar_libro', isbn='9780553293357', max_intentos=2)
+        ahora = timezone.now()
+        tareas.procesar(ahora=ahora)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('p', 1))
+        self.assertIn('sin conexión', tarea.ultimo_error)
+        espera = timedelta(seconds=tareas.configuracion()['ESPERA_REINTENTO'])
+        self.assertEqual(tarea.proximo_intento, ahora + espera)
+        # Antes de la espera no se vuelve a intentar
+        self.assertEqual(tareas.procesar(ahora=ahora), 0)
+
+        tareas.procesar(ahora=ahora + espera)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('f', 2))
+        self.assertIsNotNone(tarea.terminada)
+
+    def test_reclamo_no_repite_filas(self):
+        for isbn in ('9780553293357', '9780553293364', '9780439139595'):
+            tareas.encolar('importar_libro', isbn=isbn)
+        primeras = tareas.reclamar(lote=2)
+        segundas = tareas.reclamar(lote=2)
+        self.assertEqual(len(primeras), 2)
+        self.assertEqual(len(segundas), 1)
+        self.assertFalse({t.id for t in primeras} & {t.id for t in segundas})
+        # Una tarea abandonada se retoma al vencer el plazo
+        vencido = timezone.now() + timedelta(seconds=tareas.configuracion()['PLAZO'] + 1)
+        retomadas = tareas.reclamar(lote=5, ahora=vencido)
+        self.assertEqual(len(retomadas), 3)
+        # El worker anterior ya no puede escribir el resultado
+        tareas.ejecutar(primeras[0])
+        self.assertEqual(Tarea.objects.get(pk=primeras[0].pk).estado, 'e')
+
+    def test_tarea_que_cae_el_worker_agota_sus_intentos(self):
+        tarea = tareas.encolar('importar_libro', isbn='9780553293357', max_intentos=2)
+        plazo = timedelta(seconds=tareas.configuracion()['PLAZO'] + 1)
+        ahora = timezone.now()
+        # Dos workers caen sin terminarla: cada reclamo cuenta un intento
+        self.assertEqual(len(tareas.reclamar(ahora=ahora)), 1)
+        self.assertEqual(len(tareas.reclamar(ahora=ahora + plazo)), 1)
+        self.assertEqual(tareas.reclamar(ahora=ahora + plazo * 2), [])
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('f', 2))
+        self.assertIsNotNone(tarea.terminada)
+        self.assertTrue(tarea.ultimo_error)
+
+    def test_renovar_solo_mientras_sea_del_worker(self):
+        tareas.encolar('importar_libro', isbn='9780553293357')
+        tarea, = tareas.reclamar()
+        plazo = timedelta(seconds=tareas.configuracion()['PLAZO'])
+        despues = timezone.now() + plazo / 2
+        self.assertTrue(tareas.renovar(tarea, despues))
+        self.assertEqual(Tarea.objects.get(pk=tarea.pk).proximo_intento, despues + plazo)
+        # Renovada, no se retoma al vencer el plazo original
+        self.assertEqual(tareas.reclamar(ahora=despues + plazo / 2), [])
+        tareas.reclamar(ahora=despues + plazo)
+        self.assertFalse(tareas.renovar(tarea))
+
+    def test_tarea_larga_renueva_el_plazo(self):
+        with mock.patch.dict(tareas.TAREAS, {'lenta': lambda: time.sleep(0.35) or {}}), \
+                self.settings(GESTION_TAREAS={'PLAZO': 0.3}), \
+                mock.patch.object(tareas, 'renovar', return_value=True) as renovar:
+            tarea = tareas.encolar('lenta')
+            tareas.procesar()
+        self.assertGreaterEqual(renovar.call_count, 2)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'c')
+
+    def test_estado_solo_para_el_dueno(self):
+        tarea = tareas.encolar('importar_libro', usuario=self.usuario, isbn='9780553293357')
+        User.objects.create_user(username='otro', password='pass')
+        self.client.login(username='otro', password='pass')
+        self.assertEqual(self.client.get(reverse('estado_tarea', args=[tarea.id])).status_code, 404)
+
+    def test_tipo_desconocido(self):
+        with self.assertRaises(ValueError):
+            tareas.encolar('no_existe')
+
+    def test_accion_admin_encola_generacion(self):
+        admin = User.objects.create_superuser(username='admin', password='pass')
+        self.client.force_login(admin)
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        libro = Libro.objects.create(titulo='Libro', autor=autor, ejemplares=1)
+        usuario = UsuarioBiblioteca.objects.create(nombre='U', cedula='1714567890')
+        borradores = [Prestamo.objects.create(libro=libro, usuario_biblioteca=usuario) for _ in range(2)]
+
+        self.client.post(reverse('admin:gestion_prestamo_changelist'), {
+            'action': 'generar_prestamos_seleccionados', '_selected_action': [p.id for p in borradores],
+        })
+        self.assertEqual(Prestamo.objects.filter(estado='b').count(), 2)
+
+        tareas.procesar()
+        tarea = Tarea.objects.get(tipo='generar_prestamos')
+        self.assertEqual(tarea.resultado['generados'], 1)
+        self.assertEqual(len(tarea.resultado['errores']), 1)
+        self.assertEqual(Prestamo.objects.filter(estado='p').count(), 1)
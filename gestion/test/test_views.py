@@ -13,4 +13,361 @@ class ListaLibroViewTest(TestCase):
         resp = self.client.get(reverse('lista_libros'))
         self.assertEqual(resp.status_code, 200)
         self.assertTemplateUsed(resp, 'gestion/templates/libros.html')
-        self.assertEqual(len(resp.context['libros']), 3)
\ No newline at end of file
+        self.assertEqual(len(resp.context['libros']), 3)
+
+class CatalogoKeysetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from gestion.models import Editorial
+        cls.autor = Autor.objects.create(nombre="autor", apellido="libro")
+        cls.otro_autor = Autor.objects.create(nombre="otro", apellido="autor")
+        editorial = Editorial.objects.create(nombre="Editorial")
+        cls.libros = [
+            Libro.objects.create(titulo=f"Libro {i}", autor=cls.autor if i % 2 else cls.otro_autor, editorial=editorial)
+            for i in range(5)
+        ]
+
+    def test_paginas_por_cursor(self):
+        resp = self.client.get(reverse('lista_libros'), {'por_pagina': 2})
+        pagina = resp.context['pagina']
+        self.assertEqual([l.id for l in pagina.objetos], [self.libros[0].id, self.libros[1].id])
+        self.assertIsNone(pagina.total)
+
+        resp = self.client.get(reverse('lista_libros'), {'por_pagina': 2, 'despues': pagina.cursor_siguiente})
+        self.assertEqual([l.id for l in resp.context['libros']], [self.libros[2].id, self.libros[3].id])
+
+        resp = self.client.get(reverse('lista_libros'), {'por_pagina': 2, 'antes': self.libros[4].id})
+        self.assertEqual([l.id for l in resp.context['libros']], [self.libros[2].id, self.libros[3].id])
+
+    def test_filtro_por_autor(self):
+        resp = self.client.get(reverse('lista_libros'), {'autor': self.autor.id, 'contar': '1'})
+        self.assertEqual(resp.context['pagina'].total, 2)
+        self.assertTrue(all(l.autor_id == self.autor.id for l in resp.context['libros']))
+
+    def test_consultas_constantes(self):
+        # Una sola consulta para los libros con autor y editorial
+        with self.assertNumQueries(1):
+            self.client.get(reverse('lista_libros'))
+
+    def test_libro_list_view_usa_cursor(self):
+        from django.contrib.auth.models import User
+        User.objects.create_user('u1', password='test12345')
+        self.client.login(username='u1', password='test12345')
+        resp = self.client.get(reverse('libro_list'), {'por_pagina': 3})
+        self.assertEqual(len(resp.context['libros']), 3)
+        self.assertTrue(resp.context['pagina'].tiene_siguiente)
+
+
+class BusquedaCatalogoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from gestion.models import Editorial
+        cls.autor = Autor.objects.create(nombre="Gabriel", apellido="García Márquez")
+        editorial = Editorial.objects.create(nombre="Sudamericana")
+        cls.cien = Libro.objects.create(titulo="Cien años de soledad", autor=cls.autor, editorial=editorial, isbn="9780060883287")
+        cls.otro = Libro.objects.create(titulo="Fundacion", autor=Autor.objects.create(nombre="Isaac", apellido="Asimov"))
+
+    def test_busqueda_por_prefijo_y_sin_acentos(self):
+        from gestion.busqueda import buscar_libros
+        self.assertEqual(buscar_libros("garcia marq"), [self.cien])
+        self.assertEqual(buscar_libros("sudam"), [self.cien])
+        self.assertEqual(buscar_libros("97800608"), [self.cien])
+
+    def test_indice_sigue_cambios_de_autor(self):
+        from gestion.busqueda import buscar_libros
+        self.autor.apellido = "Marquez Nuevo"
+        self.autor.save()
+        self.assertEqual(buscar_libros("nuevo"), [self.cien])
+        self.otro.delete()
+        self.assertEqual(buscar_libros("fundacion"), [])
+
+    def test_respaldo_icontains(self):
+        from gestion.busqueda import buscar_icontains
+        self.assertEqual(buscar_icontains("soledad"), [self.cien])
+
+    def test_vista_busqueda(self):
+        resp = self.client.get(reverse('buscar_libros'), {'q': 'cien'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context['libros']), [self.cien])
+
+    def test_admin_no_trunca_resultados(self):
+        from django.contrib.auth.models import User
+        Libro.objects.bulk_create(Libro(titulo=f"Soledad {i}", autor=self.autor) for i in range(1200))
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pass'))
+        resp = self.client.get(reverse('admin:gestion_libro_changelist'), {'q': 'soledad'})
+        self.assertEqual(resp.context['cl'].result_count, 1201)
+
+
+class TarjetasCatalogoTest(TestCase):
+    def setUp(self):
+        from gestion.models import Editorial, UsuarioBiblioteca
+        self.autor = Autor.objects.create(nombre="Gabriel", apellido="Garcia")
+        self.editorial = Editorial.objects.create(nombre="Sudamericana")
+        self.libro = Libro.objects.create(titulo="Cien años", autor=self.autor, editorial=self.editorial, ejemplares=1)
+        self.usuario = UsuarioBiblioteca.objects.create(nombre='U', cedula='1714567890', email='u@test.com')
+
+    def renders(self):
+        from unittest import mock
+        from gestion import tarjetas
+        with mock.patch.object(tarjetas, 'render_to_string', wraps=tarjetas.render_to_string) as render:
+            resp = self.client.get(reverse('lista_libros'))
+        return resp, render.call_count
+
+    def test_segunda_peticion_sale_de_cache(self):
+        self.assertEqual(self.renders()[1], 1)
+        resp, renders = self.renders()
+        self.assertEqual(renders, 0)
+        self.assertContains(resp, "Cien años")
+
+    def test_cambios_invalidan_la_tarjeta(self):
+        from gestion.models import Prestamo
+        self.renders()
+        Prestamo.objects.create(libro=self.libro, usuario_biblioteca=self.usuario).generar_prestamo()
+        resp, renders = self.renders()
+        self.assertEqual(renders, 1)
+        self.assertContains(resp, "No disponible")
+
+        self.autor.nombre = "Gabo"
+        self.autor.save()
+        self.assertContains(self.renders()[0], "Gabo Garcia")
+
+        self.editorial.delete()
+        self.assertNotContains(self.renders()[0], "Sudamericana")
+
+        self.libro.refresh_from_db()
+        self.libro.titulo = "Otro título"
+        self.libro.save()
+        self.assertContains(self.renders()[0], "Otro título")
+
+    def test_cache_en_archivos(self):
+        import tempfile
+        from django.test import override_settings
+        with tempfile.TemporaryDirectory() as directorio, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directorio},
+        }):
+            self.assertEqual(self.renders()[1], 1)
+            resp, renders = self.renders()
+            self.assertEqual(renders, 0)
+            self.assertContains(resp, "Cien años")
+
+class MetricasTest(TestCase):
+    def setUp(self):
+        from gestion.metricas import registro
+        registro.reiniciar()
+        from django.contrib.auth.models import User
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.normal = User.objects.create_user(username='normal', password='pass')
+
+    def test_histograma_percentiles(self):
+        from gestion.metricas import Histograma
+        h = Histograma()
+        for valor in range(1, 10001):
+            h.registrar(valor)
+        # Error relativo acotado por las sub-cubetas (~3%)
+        self.assertAlmostEqual(h.percentil(0.5), 5000, delta=5000 * 0.035)
+        self.assertAlmostEqual(h.percentil(0.99), 9900, delta=9900 * 0.035)
+        self.assertEqual(h.cantidad, 10000)
+
+    def test_middleware_registra_por_nombre_de_url(self):
+        self.client.get(reverse('lista_libros'))
+        self.client.get(reverse('lista_libros'))
+        self.client.login(username='staff', password='pass')
+        datos = self.client.get(reverse('metricas')).json()
+        self.assertEqual(datos['lista_libros']['peticiones'], 2)
+        self.assertGreaterEqual(datos['lista_libros']['consultas']['p50'], 1)
+
+        texto = self.client.get(reverse('metricas_prometheus')).content.decode()
+        self.assertIn('gestion_vista_latencia_segundos{vista="lista_libros",quantile="0.99"}', texto)
+        self.assertIn('gestion_vista_consultas_count{vista="lista_libros"} 2', texto)
+        self.assertIn('gestion_openlibrary_cache_total{resultado="fallos"}', texto)
+        self.assertIn('aciertos_memoria', datos['cache_openlibrary'])
+
+    def test_solo_staff(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.client.login(username='normal', password='pass')
+        self.assertEqual(self.client.get(reverse('metricas_prometheus')).status_code, 403)
+
+    def test_token_para_prometheus(self):
+        with self.settings(GESTION_METRICAS={'TOKEN': 'secreto'}):
+            response = self.client.get(reverse('metricas_prometheus'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+
+class PrestamoCarritoTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User, Permission
+        from gestion.models import UsuarioBiblioteca
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        self.libros = [Libro.objects.create(titulo=f'Libro {i}', autor=autor, ejemplares=1) for i in range(6)]
+        self.usuario_bib = UsuarioBiblioteca.objects.create(nombre='Estudiante', cedula='1714567890', email='e@test.com')
+        user = User.objects.create_user(username='bibliotecario', password='pass')
+        user.user_permissions.add(Permission.objects.get(codename='gestionar_prestamos'))
+        self.client.login(username='bibliotecario', password='pass')
+
+    def test_presta_todos_los_libros_en_un_recibo(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from gestion.models import Prestamo
+        from gestion.prestamos import prestar_libros
+        with CaptureQueriesContext(connection) as pocos:
+            prestar_libros(self.usuario_bib, [l.id for l in self.libros[:2]])
+        with CaptureQueriesContext(connection) as muchos:
+            recibo = prestar_libros(self.usuario_bib, [l.id for l in self.libros[2:]])
+        # Validación, un UPDATE de contadores, códigos e INSERT: no depende de la cantidad de libros
+        self.assertEqual(len(pocos), len(muchos))
+        self.assertEqual(recibo.cantidad, 4)
+        self.assertEqual(Prestamo.objects.filter(estado='p', usuario_biblioteca=self.usuario_bib).count(), 6)
+        self.assertEqual(sorted(p.codigo for p in recibo.prestamos), [f'BLB-{i:03d}' for i in range(3, 7)])
+        for libro in self.libros:
+            libro.refresh_from_db()
+            self.assertEqual(libro.ejemplares_prestados, 1)
+            self.assertFalse(libro.disponible)
+
+    def test_prestamos_del_recibo_recuerdan_su_estado_guardado(self):
+        from gestion.prestamos import prestar_libros
+        prestamo = prestar_libros(self.usuario_bib, [self.libros[0].id]).prestamos[0]
+        # Guardar el préstamo devuelto descuenta el ejemplar que tomó bulk_create
+        prestamo.estado = 'd'
+        prestamo.save()
+        self.libros[0].refresh_from_db()
+        self.assertEqual(self.libros[0].ejemplares_prestados, 0)
+
+    def test_usuario_no_numerico_es_error_de_formulario(self):
+        from gestion.models import Prestamo
+        response = self.client.post(reverse('prestamo_carrito'), {
+            'usuario_biblioteca': 'abc', 'libros': [self.libros[0].id],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, 'Seleccione un usuario de biblioteca válido', status_code=400)
+        self.assertFalse(Prestamo.objects.exists())
+
+    def test_vista_muestra_recibo(self):
+        response = self.client.post(reverse('prestamo_carrito'), {
+            'usuario_biblioteca': self.usuario_bib.id,
+            'libros': [self.libros[0].id, self.libros[1].id],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'BLB-001')
+        self.assertContains(response, 'BLB-002')
+
+    def test_si_un_libro_no_esta_disponible_no_se_presta_ninguno(self):
+        from gestion.models import Prestamo
+        Libro.objects.filter(pk=self.libros[2].pk).update(ejemplares_prestados=1)
+        response = self.client.post(reverse('prestamo_carrito'), {
+            'usuario_biblioteca': self.usuario_bib.id,
+            'libros': [l.id for l in self.libros[:3]],
+        })
+        self.assertContains(response, 'No hay ejemplares disponibles de: Libro 2')
+        self.assertFalse(Prestamo.objects.exists())
+        self.libros[0].refresh_from_db()
+        self.assertEqual(self.libros[0].ejemplares_prestados, 0)
+
+
+class ListadosConRetrasoTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from gestion.models import Multa, Prestamo
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        libro = Libro.objects.create(titulo='Libro', autor=autor, ejemplares=50)
+        hoy = timezone.now().date()
+        for dias in (1, 9, 4):
+            prestamo = Prestamo.objects.create(libro=libro, estado='p', fecha_max=hoy - timedelta(days=dias))
+            Multa.objects.create(prestamo=prestamo, tipo='r', monto=1)
+
+    def test_ordenar_prestamos_por_retraso_en_una_consulta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('lista_prestamos'), {'orden': 'retraso', 'vencidos': '1'})
+        self.assertEqual([p.dias_retraso for p in response.context['prestamos']], [9, 4, 1])
+        self.assertEqual(len([q for q in consultas if 'gestion_prestamo' in q['sql']]), 1)
+
+    def test_ordenar_multas_por_monto_vigente(self):
+        response = self.client.get(reverse('lista_multas'), {'orden': 'monto', 'pagada': '0'})
+        self.assertEqual([str(m.monto_vigente) for m in response.context['multas']], ['9.00', '4.00', '1.00'])
+
+    def test_detalle_suma_montos_vigentes(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from gestion.models import Multa, Prestamo
+        prestamo = Prestamo.objects.get(fecha_max=timezone.now().date() - timedelta(days=9))
+        Multa.objects.create(prestamo=prestamo, tipo='d', monto=2)
+        response = self.client.get(reverse('detalle_prestamo', args=[prestamo.id]))
+        self.assertEqual(response.context['total_multas'], Decimal('11.00'))
+        self.assertContains(response, '$11.00')
+
+    def test_admin_filtra_por_retraso(self):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser(username='admin', password='pass', email='a@a.com')
+        self.client.login(username='admin', password='pass')
+        response = self.client.get('/admin/gestion/prestamo/', {'retraso': '1-7', 'o': '-8'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+class ExportacionTest(TestCase):
+    def setUp(self):
+        from datetime import date
+        from django.contrib.auth.models import User
+        from gestion.models import Multa, Prestamo
+        autor = Autor.objects.create(nombre='Ana', apellido='Autor')
+        libro = Libro.objects.create(titulo='Libro, con coma', autor=autor, ejemplares=10)
+        viejo = Prestamo.objects.create(libro=libro, estado='d', fecha_prestamos=date(2024, 1, 10))
+        Prestamo.objects.create(libro=libro, estado='p', fecha_prestamos=date(2025, 3, 1))
+        Multa.objects.create(prestamo=viejo, tipo='r', monto=3, pagada=True)
+        User.objects.create_user(username='finanzas', password='pass')
+        self.client.login(username='finanzas', password='pass')
+
+    def _contenido(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_filtrado_por_fecha(self):
+        import csv, io
+        response = self.client.get(reverse('exportar', args=['prestamos']), {'desde': '2025-01-01'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        filas = list(csv.reader(io.StringIO(self._contenido(response).decode())))
+        self.assertEqual(filas[0][:2], ['codigo', 'libro'])
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][1], 'Libro, con coma')
+        self.assertEqual(filas[1][8], 'p')
+
+    def test_ndjson_comprimido(self):
+        import gzip, json
+        response = self.client.get(
+            reverse('exportar', args=['multas']), {'formato': 'ndjson', 'gzip': '1', 'estado': 'pagada'}
+        )
+        self.assertIn('multas.ndjson.gz', response['Content-Disposition'])
+        filas = [json.loads(l) for l in gzip.decompress(self._contenido(response)).splitlines()]
+        self.assertEqual(len(filas), 1)
+        self.assertEqual((filas[0]['tipo'], filas[0]['monto'], filas[0]['pagada']), ('r', '3.00', True))
+
+    def test_monto_vigente_de_prestamo_vencido(self):
+        import csv, io
+        from datetime import timedelta
+        from django.utils import timezone
+        from gestion.models import Multa, Prestamo
+        activo = Prestamo.objects.get(estado='p')
+        Prestamo.objects.filter(pk=activo.pk).update(fecha_max=timezone.now().date() - timedelta(days=5))
+        Multa.objects.create(prestamo=activo, tipo='r', monto=1)
+        response = self.client.get(reverse('exportar', args=['multas']), {'estado': 'pendiente'})
+        filas = list(csv.DictReader(io.StringIO(self._contenido(response).decode())))
+        self.assertEqual(len(filas), 1)
+        self.assertEqual(filas[0]['monto'], '1.00')
+        # 5 días de retraso a la tarifa diaria, no el monto guardado
+        self.assertEqual(float(filas[0]['monto_vigente']), 5.0)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(reverse('exportar', args=['prestamos']), {'desde': 'ayer'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('exportar', args=['libros'])).status_code, 404)
+
+    def test_comando_exportar(self):
+        import tempfile, os
+        from django.core.management import call_command
+        from io import StringIO
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'prestamos.csv')
+            call_command('exportar', 'prestamos', '--estado', 'd', '--salida', ruta, stdout=StringIO())
+            with open(ruta, encoding='utf-8') as f:
+                self.assertEqual(len(f.read().splitlines()), 2)
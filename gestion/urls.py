@@ -1,19 +1,23 @@
 from django.urls import path
 from .views import *
 from django.contrib.auth import views as auth_views
+from . import api
 urlpatterns = [
     path("",index, name= "index"),
 
     # Importación
     path('libros/importar/', importar_libros, name='importar_libros'),
+    path('libros/importar/archivo/', importar_isbns_archivo, name='importar_isbns_archivo'),
     path('libros/importar/<str:isbn>/', importar_libro_seleccionado, name='importar_libro_seleccionado'),
     path('libros/importar-sin-isbn/', importar_libro_sin_isbn, name='importar_libro_sin_isbn'),
+    path('tareas/<int:id>/', estado_tarea, name='estado_tarea'),
 
     # Notificaciones
     path('prestamos/<int:id>/enviar-correo/', enviar_correo_multa, name="enviar_correo_multa"),
 
     # Devolución
     path('prestamos/<int:id>/devolver/', devolver_prestamo, name="devolver_prestamo"),
+    path('prestamos/devolver-lote/', devolver_lote_api, name="devolver_lote"),
 
     #Class View
     path('libros_view/', LibroListView.as_view(), name= "libro_list"),
@@ -29,6 +33,7 @@ urlpatterns = [
     path('registro/', registro, name="registro"),
     #libros
     path('libros/', lista_libros, name="lista_libros"),
+    path('libros/buscar/', buscar_libros, name="buscar_libros"),
     path('libros/nuevo/', crear_libro, name="crear_libro"),
 
     #Autores
@@ -39,15 +44,32 @@ urlpatterns = [
     #prestamos
     path('prestamos/', lista_prestamos, name="lista_prestamos"),
     path('prestamos/nuevo/', crear_prestamo, name="crear_prestamo"),
+    path('prestamos/carrito/', prestamo_carrito, name="prestamo_carrito"),
     path('prestamos/<int:id>', detalle_prestamo, name="detalle_prestamo"),
     path('prestamos/<int:id>/generar/', generar_prestamo, name="generar_prestamo"),
 
     #multas
     path('multas/', lista_multas, name="lista_multas"),
+    path('multas/notificar/', notificar_multados, name="notificar_multados"),
     path('multas/nuevo/<int:id>', crear_multa, name="crear_multa"),
 
     #usuarios
     path('usuarios-biblioteca/', lista_usuarios_biblioteca, name="lista_usuarios_biblioteca"),
     path('usuarios-biblioteca/nuevo/', crear_usuario_biblioteca, name="crear_usuario_biblioteca"),
 
+    #exportacion
+    path('exportar/<str:modelo>/', exportar, name="exportar"),
+
+    #api de solo lectura
+    path('api/libros/', api.libros, name="api_libros"),
+    path('api/libros/<int:id>/', api.libro, name="api_libro"),
+    path('api/libros/<int:id>/disponibilidad/', api.disponibilidad, name="api_disponibilidad"),
+    path('api/usuarios/<int:id>/prestamos/', api.prestamos_usuario, name="api_prestamos_usuario"),
+    path('api/usuarios/<int:id>/multas/', api.multas_usuario, name="api_multas_usuario"),
+    path('api/cambios/', api.cambios, name="api_cambios"),
+
+    #metricas
+    path('metricas/', metricas, name="metricas"),
+    path('metricas/prometheus/', metricas_prometheus, name="metricas_prometheus"),
+
 ]
\ No newline at end of file
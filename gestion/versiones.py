@@ -0,0 +1,65 @@
+"""Versiones de los recursos de la API para respuestas condicionales.
+
+``tocar()`` incrementa la versión con un único UPDATE y sin leer nada; se llama
+desde las señales de guardado/borrado y desde las rutas masivas que no pasan
+por ``save()`` (contadores de ejemplares, devoluciones y multas en lote,
+importación). Solo existen filas para los recursos que algún cliente consultó.
+"""
+from django.db.models import F, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import Autor, Editorial, Libro, Multa, Prestamo, VersionRecurso
+
+CATALOGO = 'libros'
+USUARIO = 'usuario'
+
+
+def tocar(recurso, ids=None):
+    """Incrementa la versión de ``recurso`` (global) o de cada objeto en ``ids``.
+
+    ``ids`` puede ser una lista o un queryset de ids (se usa como subconsulta).
+    """
+    versiones = VersionRecurso.objects.filter(recurso=recurso)
+    if ids is None:
+        versiones = versiones.filter(objeto_id=0)
+    elif hasattr(ids, 'query'):
+        versiones = versiones.filter(objeto_id__in=Subquery(ids))
+    else:
+        ids = {i for i in ids if i is not None}
+        if not ids:
+            return 0
+        versiones = versiones.filter(objeto_id__in=ids)
+    return versiones.update(valor=F('valor') + 1, modificado=timezone.now())
+
+
+def tocar_usuarios_de_prestamos(prestamo_ids):
+    #Versiones de los usuarios dueños de los préstamos indicados
+    return tocar(USUARIO, Prestamo.objects.filter(pk__in=prestamo_ids).values('usuario_biblioteca_id'))
+
+
+def version(recurso, objeto_id=0):
+    """Devuelve la fila de versión, creándola si nadie la había consultado"""
+    return VersionRecurso.objects.get_or_create(recurso=recurso, objeto_id=objeto_id)[0]
+
+
+def _catalogo_cambiado(sender, **kwargs):
+    tocar(CATALOGO)
+
+
+def _prestamo_cambiado(sender, instance, **kwargs):
+    tocar(USUARIO, [instance.usuario_biblioteca_id])
+
+
+def _multa_cambiada(sender, instance, **kwargs):
+    tocar_usuarios_de_prestamos([instance.prestamo_id])
+
+
+def conectar():
+    for modelo in (Libro, Autor, Editorial):
+        post_save.connect(_catalogo_cambiado, sender=modelo, dispatch_uid=f'version_{modelo.__name__}_save')
+        post_delete.connect(_catalogo_cambiado, sender=modelo, dispatch_uid=f'version_{modelo.__name__}_delete')
+    post_save.connect(_prestamo_cambiado, sender=Prestamo, dispatch_uid='version_prestamo_save')
+    post_delete.connect(_prestamo_cambiado, sender=Prestamo, dispatch_uid='version_prestamo_delete')
+    post_save.connect(_multa_cambiada, sender=Multa, dispatch_uid='version_multa_save')
+    post_delete.connect(_multa_cambiada, sender=Multa, dispatch_uid='version_multa_delete')
@@ -1,22 +1,54 @@
+import json
+from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
-from .models import Autor, Libro, Prestamo, Multa, UsuarioBiblioteca, Editorial
-import requests
-from django.http import HttpResponseForbidden
+from .models import Autor, Libro, Prestamo, Multa, UsuarioBiblioteca, Editorial, Tarea
+from django.http import HttpResponseForbidden, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse, Http404
 from django.contrib.auth.models import User, Permission
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.views.generic import ListView, CreateView, UpdateView,DeleteView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.conf import settings
+from .paginacion import paginar_keyset, tamano_pagina
+from .openlibrary import abuscar, obtener_cliente
+from .importacion import leer_isbns
+from .busqueda import buscar_libros as buscar_en_catalogo
+from .prestamos import prestar_libros, devolver_lote, item_desde_dict
+from . import exportacion, notificaciones, tareas
+from .tarjetas import tarjetas
+from .metricas import registro as registro_metricas, configuracion as configuracion_metricas
+
+
+def _id_param(params, nombre):
+    valor = params.get(nombre, '').strip()
+    return int(valor) if valor.isdigit() else None
+
+
+def _catalogo_desde_request(request):
+    #Aplica los filtros del catálogo recibidos por GET y pagina por cursor
+    params = request.GET
+    filtros = {
+        'autor': _id_param(params, 'autor'),
+        'editorial': _id_param(params, 'editorial'),
+        'disponible': params.get('disponible'),
+    }
+    libros = Libro.objects.catalogo(**filtros)
+    pagina = paginar_keyset(
+        libros,
+        despues=params.get('despues'),
+        antes=params.get('antes'),
+        por_pagina=tamano_pagina(params.get('por_pagina')),
+        contar=params.get('contar') == '1',
+    )
+    return pagina, filtros
 
 
 def index(request):
@@ -24,8 +56,22 @@ def index(request):
     return render(request, 'gestion/templates/home.html', {'titulo': title})
 
 def lista_libros(request):
-    libros = Libro.objects.all()
-    return render(request,'gestion/templates/libros.html', {'libros': libros} )
+    pagina, filtros = _catalogo_desde_request(request)
+    return render(request,'gestion/templates/libros.html', {
+        'libros': pagina.objetos,
+        'tarjetas': tarjetas(pagina.objetos),
+        'pagina': pagina,
+        'filtros': filtros,
+    })
+
+def buscar_libros(request):
+    texto = request.GET.get('q', '').strip()
+    libros = buscar_en_catalogo(texto, limite=tamano_pagina(request.GET.get('por_pagina'))) if texto else []
+    return render(request, 'gestion/templates/libros.html', {
+        'libros': libros,
+        'tarjetas': tarjetas(libros),
+        'q': texto,
+    })
 
 def crear_libro(request):
     autores = Autor.objects.all()
@@ -68,9 +114,30 @@ def crear_autor(request, id=None):
                'texto_boton': 'Guardar cambios' if modo == 'editar' else 'Crear'}
     return render(request, 'gestion/templates/crear_autores.html', context)
 
+# Ordenamientos permitidos en los listados (?orden=)
+ORDEN_PRESTAMOS = {
+    'retraso': '-dias_retraso',
+    'multas': '-total_multas',
+    'proyectada': '-multa_proyectada',
+    'fecha_max': 'fecha_max',
+}
+ORDEN_MULTAS = {
+    'monto': '-monto_actual',
+    'fecha': '-fecha',
+}
+
 def lista_prestamos(request):
-    prestamos = Prestamo.objects.select_related('libro', 'usuario_biblioteca').all()
-    return render(request,'gestion/templates/prestamos.html', {'prestamos': prestamos})
+    #Retraso y montos calculados en SQL: se filtra y ordena en una sola consulta
+    prestamos = Prestamo.objects.select_related('libro', 'usuario_biblioteca').con_retraso()
+    if request.GET.get('vencidos') == '1':
+        prestamos = prestamos.vencidos()
+    retraso_min = _id_param(request.GET, 'retraso_min')
+    if retraso_min:
+        prestamos = prestamos.filter(dias_retraso__gte=retraso_min)
+    orden = request.GET.get('orden')
+    if orden in ORDEN_PRESTAMOS:
+        prestamos = prestamos.order_by(ORDEN_PRESTAMOS[orden], 'id')
+    return render(request,'gestion/templates/prestamos.html', {'prestamos': prestamos, 'orden': orden})
 
 def crear_prestamo(request):
     if not request.user.has_perm('gestion.gestionar_prestamos'):
@@ -111,16 +178,52 @@ def crear_prestamo(request):
     })
         
 
+def prestamo_carrito(request):
+    #Presta varios libros a un mismo usuario en una sola transacción
+    if not request.user.has_perm('gestion.gestionar_prestamos'):
+        return HttpResponseForbidden()
+    
+    status = 200
+    if request.method == 'POST':
+        libro_ids = [i for i in request.POST.getlist('libros') if i.isdigit()]
+        usuario_biblioteca_id = request.POST.get('usuario_biblioteca', '')
+        if usuario_biblioteca_id and not usuario_biblioteca_id.isdigit():
+            messages.error(request, 'Seleccione un usuario de biblioteca válido')
+            status = 400
+        else:
+            usuario_bib = get_object_or_404(UsuarioBiblioteca, id=usuario_biblioteca_id) if usuario_biblioteca_id else None
+            try:
+                recibo = prestar_libros(usuario_bib, libro_ids)
+                return render(request, 'recibo_prestamo.html', {'recibo': recibo})
+            except ValidationError as e:
+                messages.error(request, ' '.join(e.messages))
+    
+    return render(request, 'prestamo_carrito.html', {
+        'libros': Libro.objects.disponibles().con_disponibilidad().order_by('titulo'),
+        'usuarios_biblioteca': UsuarioBiblioteca.objects.filter(activo=True),
+    }, status=status)
+
 def detalle_prestamo(request, id):
     prestamo = get_object_or_404(Prestamo, id=id)
-    return render(request, 'gestion/templates/detalle_prestamo.html', {'prestamo': prestamo})
+    # El total suma los mismos montos vigentes que muestra cada fila
+    multas = list(prestamo.multas.con_monto_vigente())
+    total_multas = sum((multa.monto_vigente for multa in multas), Decimal('0.00'))
+    return render(request, 'gestion/templates/detalle_prestamo.html', {
+        'prestamo': prestamo, 'multas': multas, 'total_multas': total_multas,
+    })
 
 def lista_multas(request):
     multas = Multa.objects.select_related(
         'prestamo__libro',
         'prestamo__usuario_biblioteca'
-    ).all()
-    return render(request,'gestion/templates/multas.html', {'multas': multas})
+    ).con_monto_vigente()
+    pagada = request.GET.get('pagada')
+    if pagada in ('0', '1'):
+        multas = multas.filter(pagada=pagada == '1')
+    orden = request.GET.get('orden')
+    if orden in ORDEN_MULTAS:
+        multas = multas.order_by(ORDEN_MULTAS[orden], 'id')
+    return render(request,'gestion/templates/multas.html', {'multas': multas, 'orden': orden})
 
 def crear_multa(request):
     pass
@@ -147,7 +250,17 @@ class LibroListView(LoginRequiredMixin, ListView):
     model = Libro
     template_name = 'gestion/templates/libros_view.html'
     context_object_name = 'libros'
-    paginate_by = 1
+
+    def get_queryset(self):
+        # Paginación por cursor en lugar de Paginator (evita COUNT y OFFSET)
+        self.pagina, self.filtros = _catalogo_desde_request(self.request)
+        return self.pagina.objetos
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['pagina'] = self.pagina
+        context['filtros'] = self.filtros
+        return context
 
 class LibroDetalleView(LoginRequiredMixin, ListView):
     model = Libro
@@ -223,9 +336,57 @@ def devolver_prestamo(request, id):
     
     return render(request, 'devolver_prestamo.html', {'prestamo': prestamo})
 
+@login_required
+def devolver_lote_api(request):
+    """Devolución en lote. Recibe JSON ``{"items": [{"codigo": ..., "estado_libro": ...}, ...]}``
+    (o ``isbn`` + ``cedula`` en lugar de ``codigo``) y responde el resultado de cada item"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Use POST'}, status=405)
+    if not request.user.has_perm('gestion.gestionar_prestamos'):
+        return HttpResponseForbidden()
+    try:
+        items = json.loads(request.body)['items']
+        items = [item_desde_dict(item) for item in items]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'JSON inválido: se espera {"items": [...]}'}, status=400)
+    
+    resultados = devolver_lote(items)
+    return JsonResponse({
+        'devueltos': sum(1 for r in resultados if r.ok),
+        'errores': sum(1 for r in resultados if not r.ok),
+        'resultados': [r.como_dict() for r in resultados],
+    })
+
+@login_required
+def exportar(request, modelo):
+    """Descarga préstamos o multas en CSV/NDJSON sin cargarlos en memoria.
+    Parámetros: desde, hasta (AAAA-MM-DD), estado, formato=csv|ndjson, gzip=1"""
+    if modelo not in exportacion.COLUMNAS:
+        raise Http404
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        return HttpResponseBadRequest('Formato inválido')
+    try:
+        desde = exportacion.parsear_fecha(request.GET.get('desde'))
+        hasta = exportacion.parsear_fecha(request.GET.get('hasta'))
+    except ValueError:
+        return HttpResponseBadRequest('Fecha inválida, use AAAA-MM-DD')
+    comprimir = request.GET.get('gzip') == '1'
+    
+    content_type = 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(
+        exportacion.bloques(
+            modelo, formato, comprimir,
+            desde=desde, hasta=hasta, estado=request.GET.get('estado'),
+        ),
+        content_type='application/gzip' if comprimir else content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exportacion.nombre_archivo(modelo, formato, comprimir)}"'
+    return response
+
 @login_required
 def enviar_correo_multa(request, id):
-    #Envía correo de notificación de multa al usuario
+    #Encola la notificación de multa; el correo lo envía el worker (enviar_notificaciones)
     prestamo = get_object_or_404(Prestamo, id=id)
     
     if not prestamo.usuario_biblioteca or not prestamo.usuario_biblioteca.email:
@@ -236,60 +397,33 @@ def enviar_correo_multa(request, id):
         messages.error(request, 'Este préstamo no tiene multas')
         return redirect('detalle_prestamo', id=prestamo.id)
     
-    try:
-        # Calcular total de multas
-        total_multas = sum(float(m.monto) for m in prestamo.multas.all())
-        
-        # Preparar contexto para el template
-        context = {
-            'prestamo': prestamo,
-            'total_multas': total_multas,
-            'usuario': prestamo.usuario_biblioteca,
-            'libro': prestamo.libro,
-        }
-        
-        # Renderizar el mensaje
-        mensaje_html = render_to_string('email_multa.html', context)
-        mensaje_texto = f"""
-        Estimado/a {prestamo.usuario_biblioteca.nombre},
-        
-        Le informamos que tiene una multa pendiente por el préstamo del libro:
-        "{prestamo.libro.titulo}"
-        
-        Detalles:
-        - Fecha de préstamo: {prestamo.fecha_prestamos.strftime('%d/%m/%Y')}
-        - Fecha máxima de devolución: {prestamo.fecha_max.strftime('%d/%m/%Y')}
-        
-        Total de multas: ${total_multas:.2f}
-        
-        Por favor, devuelva el libro y pague la multa a la brevedad posible.
-        
-        Saludos,
-        Sistema de Biblioteca
-        """
-        
-        # Enviar correo
-        send_mail(
-            subject=f'Multa pendiente - Préstamo #{prestamo.id}',
-            message=mensaje_texto,
-            from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'biblioteca@example.com',
-            recipient_list=[prestamo.usuario_biblioteca.email],
-            html_message=mensaje_html,
-            fail_silently=False,
-        )
-        
-        messages.success(request, f'Correo enviado exitosamente a {prestamo.usuario_biblioteca.email}')
-        
-    except Exception as e:
-        messages.error(request, f'Error al enviar correo: {str(e)}')
+    if not prestamo.multas.filter(pagada=False).exists():
+        messages.info(request, 'Las multas de este préstamo ya están pagadas')
+    elif notificaciones.encolar([prestamo.id]):
+        messages.success(request, f'Notificación encolada para {prestamo.usuario_biblioteca.email}')
+    else:
+        messages.info(request, 'Este préstamo ya tiene una notificación de hoy')
     
     return redirect('detalle_prestamo', id=prestamo.id)
 
-import requests
+@login_required
+def notificar_multados(request):
+    #Encola un aviso para cada préstamo con multas pendientes
+    if request.method != 'POST':
+        return redirect('lista_multas')
+    if not request.user.has_perm('gestion.gestionar_prestamos'):
+        return HttpResponseForbidden()
+    encoladas = notificaciones.encolar_multados()
+    messages.success(request, f'{encoladas} notificaci{"ón encolada" if encoladas == 1 else "ones encoladas"}')
+    return redirect('lista_multas')
 
 @login_required
-def importar_libros(request):
-    """Vista para buscar e importar libros desde OpenLibrary"""
+async def importar_libros(request):
+    """Vista para buscar e importar libros desde OpenLibrary.
+
+    Es async: la consulta a OpenLibrary espera en el pool acotado de
+    ``openlibrary.abuscar`` sin ocupar un hilo del servidor ASGI.
+    """
     resultados = []
     busqueda_realizada = False
     
@@ -299,91 +433,73 @@ def importar_libros(request):
         
         if texto:
             try:
-                # Construir URL según tipo de búsqueda
-                if buscar_por == 'titulo':
-                    url = f"https://openlibrary.org/search.json?title={texto}&limit=10"
-                else:
-                    url = f"https://openlibrary.org/search.json?author={texto}&limit=10"
+                # Búsqueda a través de la caché de OpenLibrary
+                campo = 'title' if buscar_por == 'titulo' else 'author'
+                docs = await abuscar(campo, texto, limite=10)
                 
-                # Hacer petición
-                response = requests.get(url, timeout=10)
-                data = response.json()
-                
-                if data.get('docs'):
-                    resultados = data['docs'][:10]
+                if docs:
+                    resultados = docs[:10]
                     busqueda_realizada = True
                 else:
                     messages.warning(request, 'No se encontraron resultados')
                     
+            except TimeoutError:
+                messages.error(request, 'OpenLibrary no respondió a tiempo, intente de nuevo en unos segundos')
             except Exception as e:
                 messages.error(request, f'Error al buscar: {str(e)}')
     
-    return render(request, 'importar_libros.html', {
+    tarea = await sync_to_async(_tarea_del_usuario)(request, _id_param(request.GET, 'tarea'))
+    # render() lee la sesión y el usuario (consultas síncronas)
+    return await sync_to_async(render)(request, 'importar_libros.html', {
         'resultados': resultados,
-        'busqueda_realizada': busqueda_realizada
+        'busqueda_realizada': busqueda_realizada,
+        'tarea': tarea,
     })
 
 
 @login_required
-def importar_libro_seleccionado(request, isbn):
-    """Importa un libro específico desde OpenLibrary"""
-    try:
-        # Verificar si ya existe
-        if Libro.objects.filter(isbn=isbn).exists():
-            messages.warning(request, f'El libro con ISBN {isbn} ya existe en la biblioteca')
-            return redirect('importar_libros')
-        
-        # Buscar información del libro
-        url = f"https://openlibrary.org/search.json?isbn={isbn}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if not data.get('docs'):
-            messages.error(request, 'No se encontró información del libro')
-            return redirect('importar_libros')
-        
-        doc = data['docs'][0]
-        
-        # Crear o buscar autor
-        autor = None
-        if doc.get('author_name'):
-            nombre_completo = doc['author_name'][0]
-            nombres = nombre_completo.split()
-            firstname = nombres[0]
-            lastname = ' '.join(nombres[1:]) if len(nombres) > 1 else ''
-            
-            autor, created = Autor.objects.get_or_create(
-                nombre=firstname,
-                apellido=lastname
-            )
-        
-        # Crear o buscar editorial
-        editorial = None
-        if doc.get('publisher'):
-            nombre_editorial = doc['publisher'][0]
-            editorial, created = Editorial.objects.get_or_create(
-                nombre=nombre_editorial
-            )
-        
-        # Crear el libro
-        libro = Libro.objects.create(
-            titulo=doc.get('title', 'Sin título')[:200],
-            autor=autor if autor else Autor.objects.first(),
-            editorial=editorial,
-            isbn=isbn,
-            paginas=doc.get('number_of_pages_median'),
-            fecha_publicacion=f"{doc['first_publish_year']}-01-01" if doc.get('first_publish_year') else None,
-            ejemplares=1,
-            costo=20.00,
-            disponible=True  # ← MUY IMPORTANTE
-        )
-        
-        messages.success(request, f'Libro "{libro.titulo}" importado exitosamente')
-        
-    except Exception as e:
-        messages.error(request, f'Error al importar: {str(e)}')
-    
-    return redirect('importar_libros')
+async def importar_libro_seleccionado(request, isbn):
+    """Encola la importación de un libro de OpenLibrary (la ejecuta run_workers)"""
+    tarea = await tareas.aencolar('importar_libro', usuario=await request.auser(), isbn=isbn)
+    messages.info(request, f'Importación del ISBN {isbn} en curso (tarea #{tarea.id})')
+    return redirect(f"{reverse('importar_libros')}?tarea={tarea.id}")
+
+@login_required
+def importar_isbns_archivo(request):
+    """Encola la importación en lote de los ISBN de un archivo CSV o de texto"""
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Debe seleccionar un archivo')
+        else:
+            isbns = leer_isbns(archivo.read())
+            if not isbns:
+                messages.warning(request, 'El archivo no contiene ISBN')
+            else:
+                tarea = tareas.encolar('importar_isbns', usuario=request.user, isbns=isbns)
+                messages.info(request, f'Importación de {len(isbns)} ISBN en curso (tarea #{tarea.id})')
+                return redirect(f"{reverse('importar_isbns_archivo')}?tarea={tarea.id}")
+
+    tarea = _tarea_del_usuario(request, _id_param(request.GET, 'tarea'))
+    resultados = []
+    if tarea and tarea.estado == 'c':
+        resultados = tarea.resultado.get('resultados', [])
+    return render(request, 'importar_isbns.html', {'resultados': resultados, 'tarea': tarea})
+
+def _tarea_del_usuario(request, id):
+    #Cada usuario ve sus tareas; el personal, todas
+    if not id:
+        return None
+    tareas_visibles = Tarea.objects.all() if request.user.is_staff else Tarea.objects.filter(usuario=request.user)
+    return tareas_visibles.filter(pk=id).first()
+
+@login_required
+def estado_tarea(request, id):
+    """Estado de una tarea encolada, para consultarlo desde la página"""
+    tarea = _tarea_del_usuario(request, id)
+    if tarea is None:
+        raise Http404
+    return JsonResponse(tareas.estado(tarea))
 
 @login_required
 def importar_libro_sin_isbn(request):
@@ -469,4 +585,25 @@ def generar_prestamo(request, id):
     except Exception as e:
         messages.error(request, f"Error inesperado: {str(e)}")
     
-    return redirect('detalle_prestamo', id=id)
\ No newline at end of file
+    return redirect('detalle_prestamo', id=id)
+
+
+def _puede_ver_metricas(request):
+    #Personal del staff con sesión, o Prometheus con el token configurado
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = configuracion_metricas()['TOKEN']
+    return bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+
+def metricas(request):
+    if not _puede_ver_metricas(request):
+        return HttpResponseForbidden('Solo personal autorizado')
+    datos = registro_metricas.resumen()
+    datos['cache_openlibrary'] = obtener_cliente().estadisticas()
+    return JsonResponse(datos, json_dumps_params={'indent': 2})
+
+def metricas_prometheus(request):
+    if not _puede_ver_metricas(request):
+        return HttpResponseForbidden('Solo personal autorizado')
+    texto = registro_metricas.prometheus() + obtener_cliente().prometheus()
+    return HttpResponse(texto, content_type='text/plain; version=0.0.4; charset=utf-8')